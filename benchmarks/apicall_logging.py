@@ -0,0 +1,133 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+# Times the logging overhead of o365service calls. Calls go to an in-memory
+# transport, so what's left is the cost of the service layer itself: building
+# the request, recording metrics and writing debug log lines.
+#
+# The second run gives each call a simulated network wait, the way real
+# calls spend most of their time, and reports the time on top of that wait.
+# A background handler does its writing during the wait.
+#
+# Run from the project root:
+#   python benchmarks/apicall_logging.py [number of calls]
+import os
+import sys
+import json
+import logging
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pythoncontacts.settings')
+
+import django
+django.setup()
+
+import contacts.o365service
+import contacts.o365throttle
+import contacts.o365transport
+
+try:
+    from contacts.o365logging import BackgroundFileHandler, SamplingFilter
+except ImportError:
+    # Trees from before o365logging only have the synchronous handler
+    BackgroundFileHandler = None
+
+api_endpoint = 'https://outlook.office365.com/api/v1.0'
+# A token of a realistic size, so logging it costs what it would
+token = 'eyJ0eXAiOiJKV1QiLCJhbGciOiJSUzI1NiJ9.{0}.{1}'.format('a' * 900, 'b' * 340)
+contact_id = 'AAMkAGI2THVSAAA{0}'.format('x' * 120)
+
+# Answers every request with the same contact
+class ContactTransport:
+    def __init__(self, latency = 0.0):
+        self.latency = latency
+        self.body = json.dumps({ 'Id': contact_id, 'GivenName': 'Ann', 'Surname': 'Chen',
+                                 'MobilePhone1': '+1 425 555 0100',
+                                 'EmailAddresses': [ { 'Address': 'ann.chen@contoso.com', 'Name': 'Ann Chen' } ] }).encode('utf-8')
+
+    def request(self, method, url, **kwargs):
+        if (self.latency > 0):
+            time.sleep(self.latency)
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['request-id'] = 'server-request-id'
+        response._content = self.body
+        return response
+
+def configure(level, handler):
+    logger = logging.getLogger('contacts')
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
+        existing.close()
+    logger.setLevel(level)
+    if (not handler is None):
+        handler.setFormatter(logging.Formatter('%(asctime)s %(threadName)s %(levelname)s %(message)s'))
+        logger.addHandler(handler)
+
+def time_calls(function, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return (time.perf_counter() - start) / count
+
+def run(count, latency):
+    contacts.o365transport.set_transport(ContactTransport(latency))
+    # Don't let the per-mailbox rate limit pace the loop
+    contacts.o365throttle.rate_limiter = contacts.o365throttle.RateLimiter(rate = 1e9, burst = 10 ** 9)
+
+    log_path = os.path.join(tempfile.mkdtemp(), 'debug.log')
+    configs = [ ('no handler, WARNING', logging.WARNING, lambda: None),
+                ('file, INFO', logging.INFO, lambda: logging.FileHandler(log_path)),
+                ('file, DEBUG', logging.DEBUG, lambda: logging.FileHandler(log_path)) ]
+    if (not BackgroundFileHandler is None):
+        def sampled():
+            handler = BackgroundFileHandler(log_path)
+            handler.addFilter(SamplingFilter(100, 'DEBUG'))
+            return handler
+        configs += [ ('background, INFO', logging.INFO, lambda: BackgroundFileHandler(log_path)),
+                     ('background, DEBUG', logging.DEBUG, lambda: BackgroundFileHandler(log_path)),
+                     ('background, DEBUG 1/100', logging.DEBUG, sampled) ]
+
+    calls = [ ('make_api_call', lambda: contacts.o365service.make_api_call('GET', '{0}/Me/Contacts/{1}'.format(api_endpoint, contact_id), token)),
+              ('get_contact_by_id', lambda: contacts.o365service.get_contact_by_id(api_endpoint, token, contact_id)) ]
+
+    print('{0} calls each, {1:.0f} ms simulated latency{2}'.format(count, latency * 1000,
+                                                                  ', time above latency' if latency > 0 else ''))
+    print('{0:<26}{1:>22}{2:>26}'.format('logging', 'make_api_call (us)', 'get_contact_by_id (us)'))
+    for name, level, make_handler in configs:
+        configure(level, make_handler())
+        # Warm up, then time
+        time_calls(calls[0][1], 100)
+        timings = [ time_calls(function, count) for call_name, function in calls ]
+        print('{0:<26}{1:>22.1f}{2:>26.1f}'.format(name, (timings[0] - latency) * 1e6, (timings[1] - latency) * 1e6))
+
+    configure(logging.WARNING, None)
+    print()
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    run(count, 0.0)
+    run(max(1, count // 20), 0.005)
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
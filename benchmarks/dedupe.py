@@ -0,0 +1,118 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+# Times duplicate detection over generated contacts, some of which are
+# altered copies of others, and checks the groups it finds against the
+# copies that were made.
+#
+# Run from the project root:
+#   python benchmarks/dedupe.py [number of contacts]
+import os
+import sys
+import random
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pythoncontacts.settings')
+
+import django
+django.setup()
+
+from contacts.models import DisplayContact
+from contacts.dedupe import find_duplicates
+
+given_names = [ 'Ann', 'Bob', 'Carla', 'Dmitri', 'Elena', 'Farid', 'Grace', 'Hiroshi', 'Ines', 'Jamal',
+                'Katya', 'Luis', 'Mei', 'Noor', 'Olu', 'Priya', 'Quinn', 'Rafael', 'Sofia', 'Tomasz',
+                'Uma', 'Viktor', 'Wen', 'Ximena', 'Yusuf', 'Zara', 'Aiden', 'Bianca', 'Chidi', 'Dana' ]
+syllables = [ 'an', 'ber', 'cas', 'dor', 'el', 'fin', 'gar', 'hal', 'is', 'jen',
+              'kov', 'lin', 'mor', 'nak', 'os', 'pet', 'ros', 'sen', 'tan', 'vic' ]
+domains = [ 'contoso.com', 'fabrikam.com', 'northwindtraders.com', 'adventure-works.com' ]
+
+def make_person(rng, index):
+    given_name = rng.choice(given_names)
+    surname = ''.join(rng.choice(syllables) for _ in range(3)).capitalize()
+    address = '{0}.{1}{2}@{3}'.format(given_name.lower(), surname.lower(), index, rng.choice(domains))
+    phone = '+1 {0:03d} {1:03d} {2:04d}'.format(rng.randrange(200, 1000), rng.randrange(1000), rng.randrange(10000))
+    return DisplayContact(given_name, surname, phone, [ (address, '{0} {1}'.format(given_name, surname)) ],
+                          'AAMk{0:08d}'.format(index))
+
+# Copies a contact with the kind of differences duplicates usually have
+def make_duplicate(rng, original, index):
+    given_name, surname = original.given_name, original.last_name
+    phone, address = original.mobile_phone, original.email1_address
+    change = rng.randrange(5)
+    if (change == 0):
+        # Typo in the given name, same email address
+        position = rng.randrange(len(given_name) - 1)
+        given_name = given_name[:position] + given_name[position + 1] + given_name[position] + given_name[position + 2:]
+    elif (change == 1):
+        # Different phone formatting, no email address
+        digits = ''.join(character for character in phone if character.isdigit())
+        phone = '({0}) {1}-{2}'.format(digits[1:4], digits[4:7], digits[7:])
+        address = ''
+    elif (change == 2):
+        # Upper case email address, no phone
+        address = address.upper()
+        phone = ''
+    elif (change == 3):
+        # Given name and surname swapped
+        given_name, surname = surname, given_name
+    else:
+        # Same name only
+        phone = ''
+        address = ''
+    return DisplayContact(given_name, surname, phone, [ (address, '') ] if address else None, 'AAMk{0:08d}'.format(index))
+
+def run(count, duplicate_rate = 0.05):
+    rng = random.Random(1)
+    originals = int(count / (1 + duplicate_rate))
+    display_contacts = [ make_person(rng, index) for index in range(originals) ]
+    # The person each contact is a copy of, by Id
+    people = dict((display_contact.id, index) for index, display_contact in enumerate(display_contacts))
+    for index in range(originals, count):
+        original = rng.randrange(originals)
+        display_contacts.append(make_duplicate(rng, display_contacts[original], index))
+        people[display_contacts[index].id] = original
+    expected = set()
+    for index in range(originals, count):
+        expected.add(people[display_contacts[index].id])
+
+    start = time.perf_counter()
+    groups = find_duplicates(display_contacts)
+    elapsed = time.perf_counter() - start
+
+    # A group is correct if all of its contacts are copies of one person
+    correct = 0
+    found = set()
+    for group in groups:
+        group_people = set(people[display_contact.id] for display_contact in group.contacts)
+        if (len(group_people) == 1):
+            correct += 1
+        found.update(group_people)
+
+    print('{0} contacts, {1} people with duplicates'.format(count, len(expected)))
+    print('find_duplicates: {0:.2f}s, {1} groups'.format(elapsed, len(groups)))
+    print('Correct groups: {0} (precision {1:.3f}), people found: {2} (recall {3:.3f})'.format(
+        correct, correct / max(len(groups), 1), len(found & expected), len(found & expected) / len(expected)))
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
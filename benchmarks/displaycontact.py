@@ -0,0 +1,156 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+# Compares the memory use and JSON speed of DisplayContact with the
+# original, dict-based implementation, which is kept below for reference.
+#
+# Run from the project root:
+#   python benchmarks/displaycontact.py [number of contacts]
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pythoncontacts.settings')
+
+import django
+django.setup()
+
+from contacts.models import DisplayContact
+
+# The DisplayContact class before it was converted to __slots__. get_json
+# is condensed into a loop but builds the same string.
+class LegacyDisplayContact:
+    given_name = ''
+    last_name = ''
+    mobile_phone = ''
+    email1_address = ''
+    email1_name = ''
+    email2_address = ''
+    email2_name = ''
+    email3_address = ''
+    email3_name = ''
+    id = ''
+
+    def load_json(self, json):
+        self.given_name = json['GivenName']
+        self.last_name = json['Surname']
+
+        if (not json['MobilePhone1'] is None):
+            self.mobile_phone = json['MobilePhone1']
+
+        email_address_list = json['EmailAddresses']
+        if (not email_address_list[0] is None):
+            self.email1_address = email_address_list[0]['Address']
+            self.email1_name = email_address_list[0]['Name']
+        if (not email_address_list[1] is None):
+            self.email2_address = email_address_list[1]['Address']
+            self.email2_name = email_address_list[1]['Name']
+        if (not email_address_list[2] is None):
+            self.email3_address = email_address_list[2]['Address']
+            self.email3_name = email_address_list[2]['Name']
+
+        self.id = json['Id']
+
+    def get_json(self, return_nulls):
+        json_string = '{'
+        json_string += '"GivenName": "{0}"'.format(self.given_name)
+        json_string += ',"Surname": "{0}"'.format(self.last_name)
+        json_string += ',"MobilePhone1": "{0}"'.format(self.mobile_phone)
+        json_string += ',"EmailAddresses": ['
+
+        email_entry_added = False
+        for address, name in ((self.email1_address, self.email1_name),
+                              (self.email2_address, self.email2_name),
+                              (self.email3_address, self.email3_name)):
+            if (address == '' and name == ''):
+                if (return_nulls == True):
+                    if (email_entry_added == True):
+                        json_string += ','
+                    email_entry_added = True
+                    json_string += 'null'
+            else:
+                if (email_entry_added == True):
+                    json_string += ','
+                email_entry_added = True
+                json_string += '{'
+                json_string += '"@odata.type": "#Microsoft.OutlookServices.EmailAddress"'
+                json_string += ',"Address": "{0}"'.format(address)
+                json_string += ',"Name": "{0}"'.format(name)
+                json_string += '}'
+
+        json_string += ']'
+        json_string += '}'
+
+        return json_string
+
+def make_json_contacts(count):
+    json_contacts = []
+    for index in range(count):
+        json_contacts.append({ 'Id': 'AAMkAGI2TG93AAA{0:08d}'.format(index),
+                               'GivenName': 'Given{0}'.format(index),
+                               'Surname': 'Surname{0}'.format(index),
+                               'MobilePhone1': '+1 425 555 {0:04d}'.format(index % 10000),
+                               'EmailAddresses': [ { 'Address': 'user{0}@contoso.com'.format(index), 'Name': 'User {0}'.format(index) },
+                                                   { 'Address': 'user{0}@fabrikam.com'.format(index), 'Name': 'User {0}'.format(index) },
+                                                   None ] })
+    return json_contacts
+
+# Loads every contact and reports the time taken and the memory
+# still held by the loaded objects
+def measure_load(contact_class, json_contacts):
+    tracemalloc.start()
+    start = time.perf_counter()
+    loaded = []
+    for json_contact in json_contacts:
+        contact = contact_class()
+        contact.load_json(json_contact)
+        loaded.append(contact)
+    elapsed = time.perf_counter() - start
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return loaded, elapsed, held
+
+def measure_serialize(loaded):
+    start = time.perf_counter()
+    for contact in loaded:
+        contact.get_json(True)
+        contact.get_json(False)
+    return time.perf_counter() - start
+
+def run(count):
+    json_contacts = make_json_contacts(count)
+    print('{0} contacts with two email addresses each'.format(count))
+    print('{0:<22}{1:>14}{2:>16}{3:>18}'.format('', 'load (us)', 'bytes held', 'serialize (us)'))
+
+    for name, contact_class in (('LegacyDisplayContact', LegacyDisplayContact), ('DisplayContact', DisplayContact)):
+        loaded, load_time, held = measure_load(contact_class, json_contacts)
+        serialize_time = measure_serialize(loaded)
+        print('{0:<22}{1:>14.2f}{2:>16.0f}{3:>18.2f}'.format(name,
+                                                             load_time * 1e6 / count,
+                                                             held / count,
+                                                             serialize_time * 1e6 / (count * 2)))
+    print('All figures are per contact.')
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
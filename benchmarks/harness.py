@@ -0,0 +1,156 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+# Shared setup for benchmarks/run.py and benchmarks/loadtest.py: a throwaway
+# database, an Office 365 stand-in the app is pointed at, connected users,
+# and latency statistics.
+import os
+import sys
+import tempfile
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pythoncontacts.settings')
+
+import o365standin
+
+# The password every benchmark user signs in with
+password = 'benchmark'
+
+# Sets up Django against a new SQLite database, so benchmarks never touch
+# db.sqlite3. Call before importing anything that uses models.
+#   parameters:
+#     debug_logging: Boolean. Keep the contacts logger at DEBUG. By default
+#                    it is at INFO, as in production.
+#     database_path: string. An existing benchmark database to use instead,
+#                    such as one set up by another process.
+#   returns:
+#     The path of the database file.
+def setup_django(debug_logging = False, database_path = None):
+    import django
+    from django.conf import settings
+
+    create_tables = database_path is None
+    if (create_tables):
+        database_path = os.path.join(tempfile.mkdtemp(prefix = 'contacts-benchmark-'), 'db.sqlite3')
+    settings.DATABASES['default']['NAME'] = database_path
+    # Create the contacts tables straight from the models, whether or not
+    # migrations have been generated. Django 1.9 and later mark an app as
+    # having no migrations with None; earlier versions need a module name
+    # that doesn't exist.
+    settings.MIGRATION_MODULES = { 'contacts': None if django.VERSION >= (1, 9) else 'contacts.no_migrations' }
+    # Measure the app as it runs in production: no query log, no debug pages
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = [ '*' ]
+    settings.CONTACTS_SERVER_TIMING = False
+    # Signing in isn't what's being measured
+    settings.PASSWORD_HASHERS = [ 'django.contrib.auth.hashers.MD5PasswordHasher' ]
+    # Set in LOGGING rather than on the logger, so it holds if Django is set
+    # up again (get_wsgi_application does)
+    settings.LOGGING['loggers']['contacts']['level'] = 'DEBUG' if debug_logging else 'INFO'
+
+    django.setup()
+
+    if (create_tables):
+        from django.core.management import call_command
+        # From Django 1.9, migrate only creates the tables of apps without
+        # migrations when asked to. Earlier versions always do, and ignore it.
+        call_command('migrate', interactive = False, verbosity = 0, run_syncdb = True)
+    return database_path
+
+# Starts a stand-in server and points the app at it
+#   parameters:
+#     rate_limit: Boolean. Keep the app's per-mailbox rate limit. It is
+#                 lifted by default, so it doesn't set the pace.
+#     options: Passed to StandinServer (latency, throttle_rate, and so on).
+def start_standin(rate_limit = False, **options):
+    server = o365standin.start_server(**options)
+    use_standin(server.url, rate_limit)
+    return server
+
+# Points the app's token and discovery endpoints at a stand-in, which may be
+# running in another process. Connections created with create_user use its
+# API endpoint.
+#   parameters:
+#     standin_url: string. The stand-in's URL, like http://127.0.0.1:8001.
+#     rate_limit: Boolean. As for start_standin.
+def use_standin(standin_url, rate_limit = False):
+    import contacts.o365service
+    import contacts.o365throttle
+
+    contacts.o365service.access_token_url = '{0}{1}'.format(standin_url, o365standin.token_path)
+    contacts.o365service.discovery_endpoint = '{0}{1}'.format(standin_url, o365standin.discovery_path)
+    contacts.o365service.discovery_resource = '{0}/discovery/'.format(standin_url)
+    if (not rate_limit):
+        contacts.o365throttle.rate_limiter = contacts.o365throttle.RateLimiter(rate = 1e9, burst = 10 ** 9)
+
+# Creates a local user connected to a mailbox on the stand-in, as if they
+# had signed in and connected their account
+#   parameters:
+#     standin_url: string. The stand-in's URL.
+#     username: string. The local username.
+#     is_staff: Boolean. Whether the user can see /contacts/metrics/.
+#   returns:
+#     The Office365Connection.
+def create_user(standin_url, username, is_staff = False):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from contacts.models import Office365Connection
+
+    user = User.objects.create_user(username, '{0}@contoso.com'.format(username), password)
+    if (is_staff):
+        user.is_staff = True
+        user.save()
+    user_email = '{0}@contoso.com'.format(username)
+    tokens = o365standin.issue_tokens(standin_url, user_email)
+
+    return Office365Connection.objects.create(
+        username = username,
+        user = user,
+        user_email = user_email,
+        access_token = tokens['access_token'],
+        access_token_expires = timezone.now() + datetime.timedelta(seconds = int(tokens['expires_in'])),
+        refresh_token = tokens['refresh_token'],
+        outlook_resource_id = tokens['resource'],
+        outlook_api_endpoint = '{0}{1}'.format(standin_url, o365standin.api_path.rstrip('/')))
+
+# Returns latency statistics for a list of durations in seconds
+#   parameters:
+#     durations: list. The duration of each operation.
+#     elapsed: float. The wall-clock time they took, if they overlapped.
+#                     Defaults to their sum.
+def summarize(durations, elapsed = None):
+    from contacts.o365metrics import percentile
+
+    ordered = sorted(durations)
+    count = len(ordered)
+    total = sum(ordered)
+    elapsed = total if elapsed is None else elapsed
+    return { 'count': count,
+             'elapsed_s': round(elapsed, 3),
+             'per_second': round(count / elapsed, 1) if elapsed > 0 else 0.0,
+             'mean_ms': round(total * 1000 / count, 3) if count > 0 else 0.0,
+             'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+             'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+             'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+             'max_ms': round(ordered[-1] * 1000, 3) if count > 0 else 0.0 }
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,451 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+# Load-tests the contacts views. Virtual users sign in and list, open,
+# create, update and delete contacts at the same time. The app runs in its
+# own process, backed by the Office 365 stand-in (benchmarks/o365standin.py)
+# in another. The number of users is stepped up until throughput stops
+# growing, to find where the app saturates.
+#
+# Each step reports requests per second, latency percentiles, the error rate
+# and, per view, the Office 365 calls made per request (from
+# /contacts/metrics/).
+#
+# Run from the project root:
+#   python benchmarks/loadtest.py
+#   python benchmarks/loadtest.py --users 1,2,4,8,16,32 --duration 30 --latency 0.05
+#   python benchmarks/loadtest.py --scenario my-scenario.json --output results.json
+#
+# A scenario file sets the mix of actions, by weight, and how long each
+# user pauses between actions, in seconds:
+#   { "think_time": 0.5, "actions": { "index": 60, "edit": 20, "update": 10, "create": 5, "delete": 5 } }
+#
+# The virtual users run in this process, on the same machine as the app. At
+# high user counts check that this process isn't what saturates first.
+from collections import Counter
+from socketserver import ThreadingMixIn
+from urllib.parse import urlencode
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+import os
+import sys
+import argparse
+import html
+import json
+import random
+import re
+import subprocess
+import threading
+import time
+
+import requests
+
+import harness
+
+default_scenario = { 'think_time': 0.0,
+                     'actions': { 'index': 50, 'edit': 20, 'update': 15, 'create': 10, 'delete': 5 } }
+actions = ('index', 'edit', 'update', 'create', 'delete')
+
+# Throughput must grow by more than this from one step to the next, or the
+# app is reported as saturated
+saturation_growth = 0.10
+# A step with more errors than this is saturated too
+saturation_error_rate = 0.05
+
+# Seconds a virtual user waits for a response
+request_timeout = 60
+
+contact_link = re.compile(r'href="/contacts/edit/([^"]+?)/"')
+form_field = re.compile(r'<input[^>]*\bname="([^"]+)"[^>]*\bvalue="([^"]*)"')
+# Views that fail render error.html with a 200, so look for its text
+error_page_text = 'Return <a href="/contacts/">home</a>.'
+
+# Durations and errors per view, kept only while a step is being measured
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.recording = False
+        self.durations = {}
+        self.errors = Counter()
+        self.started = None
+        self.elapsed = 0.0
+
+    def start(self):
+        with self.lock:
+            self.durations = {}
+            self.errors = Counter()
+            self.recording = True
+            self.started = time.perf_counter()
+
+    def stop(self):
+        with self.lock:
+            self.recording = False
+            self.elapsed = time.perf_counter() - self.started
+
+    def add(self, view_name, duration, succeeded):
+        with self.lock:
+            if (self.recording):
+                self.durations.setdefault(view_name, []).append(duration)
+                if (not succeeded):
+                    self.errors[view_name] += 1
+
+# A user with their own session, doing the scenario's actions until stopped
+#   parameters:
+#     app_url: string. Where the app is running.
+#     username: string. A user created with harness.create_user.
+#     scenario: dictionary. The think time and the weight of each action.
+#     recorder: Recorder. Where request timings go.
+#     seed: int. Seeds the choice of actions.
+class VirtualUser(threading.Thread):
+    def __init__(self, app_url, username, scenario, recorder, seed):
+        super().__init__(name = username)
+        self.daemon = True
+        self.app_url = app_url
+        self.username = username
+        self.think_time = scenario['think_time']
+        self.action_names = [ name for name in actions if scenario['actions'].get(name, 0) > 0 ]
+        self.action_weights = [ scenario['actions'][name] for name in self.action_names ]
+        self.recorder = recorder
+        self.random = random.Random(seed)
+        self.session = requests.Session()
+        self.contact_ids = []
+        self.ready = threading.Event()
+        self.stopping = threading.Event()
+        self.failure = None
+
+    def run(self):
+        try:
+            sign_in(self.session, self.app_url, self.username)
+            # The first visit mirrors the mailbox. That's measured by
+            # benchmarks/run.py; here it's only setup.
+            if (not self.index()):
+                raise RuntimeError('{0} could not list their contacts'.format(self.username))
+        except Exception as e:
+            self.failure = e
+            return
+        finally:
+            self.ready.set()
+
+        while (not self.stopping.is_set()):
+            getattr(self, self.choose_action())()
+            if (self.think_time > 0):
+                self.stopping.wait(self.think_time)
+
+    def choose_action(self):
+        point = self.random.uniform(0, sum(self.action_weights))
+        for name, weight in zip(self.action_names, self.action_weights):
+            point -= weight
+            if (point <= 0):
+                return name
+        return self.action_names[-1]
+
+    # Makes a request and records how long it took
+    #   parameters:
+    #     view_name: string. The URL name of the view, as /contacts/metrics/ reports it.
+    #     expected_status: int. 200 for a page, 302 for a form post or delete.
+    #   returns:
+    #     The response, or None if the request failed.
+    def request(self, view_name, method, path, expected_status, data = None):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, '{0}{1}'.format(self.app_url, path), data = data,
+                                            allow_redirects = False, timeout = request_timeout)
+            succeeded = response.status_code == expected_status and not error_page_text in response.text
+        except requests.RequestException:
+            response = None
+            succeeded = False
+        self.recorder.add(view_name, time.perf_counter() - started, succeeded)
+        return response if succeeded else None
+
+    def post(self, view_name, path, data):
+        data['csrfmiddlewaretoken'] = self.session.cookies.get('csrftoken', '')
+        return self.request(view_name, 'POST', path, 302, data)
+
+    # Lists a page of contacts, with a random sort order and sometimes a search
+    def index(self):
+        query = { 'sort': self.random.choice([ 'given_name', '-given_name', 'last_name', 'mobile_phone' ]) }
+        if (self.random.random() < 0.25):
+            query['page'] = self.random.randint(2, 4)
+        if (self.random.random() < 0.2):
+            query['q'] = self.random.choice('aeiou')
+        response = self.request('index', 'GET', '/contacts/?{0}'.format(urlencode(query)), 200)
+        if (not response is None):
+            contact_ids = [ html.unescape(contact_id) for contact_id in contact_link.findall(response.text) ]
+            if (len(contact_ids) > 0):
+                self.contact_ids = contact_ids
+        return not response is None
+
+    # Opens a contact the user has seen
+    #   returns:
+    #     The contact ID and the form's fields, or None.
+    def edit(self):
+        if (len(self.contact_ids) == 0):
+            self.index()
+            return None
+        contact_id = self.random.choice(self.contact_ids)
+        response = self.request('edit', 'GET', '/contacts/edit/{0}/'.format(contact_id), 200)
+        if (response is None):
+            return None
+        fields = dict((name, html.unescape(value)) for name, value in form_field.findall(response.text))
+        return contact_id, fields
+
+    def update(self):
+        opened = self.edit()
+        if (not opened is None):
+            contact_id, fields = opened
+            fields['mobile_phone'] = '+1 425 555 {0:04d}'.format(self.random.randint(0, 9999))
+            self.post('update', '/contacts/update/{0}/'.format(contact_id), fields)
+
+    def create(self):
+        if (self.request('new', 'GET', '/contacts/new/', 200) is None):
+            return
+        number = self.random.randint(0, 99999)
+        self.post('create', '/contacts/create/',
+                  { 'first_name': 'Load', 'last_name': 'Test {0}'.format(number),
+                    'mobile_phone': '+1 425 555 {0:04d}'.format(number % 10000),
+                    'email1_address': 'load.test{0}@contoso.com'.format(number), 'email1_name': 'Load Test',
+                    'email2_address': '', 'email2_name': '', 'email3_address': '', 'email3_name': '' })
+
+    def delete(self):
+        if (len(self.contact_ids) == 0):
+            self.index()
+            return
+        contact_id = self.contact_ids.pop(self.random.randrange(len(self.contact_ids)))
+        self.request('delete', 'GET', '/contacts/delete/{0}/'.format(contact_id), 302)
+
+# Signs a session in through the login form
+def sign_in(session, app_url, username):
+    login_url = '{0}/login/'.format(app_url)
+    session.get(login_url, timeout = request_timeout)
+    response = session.post(login_url, allow_redirects = False, timeout = request_timeout,
+                            data = { 'username': username,
+                                     'password': harness.password,
+                                     'next': '/contacts/',
+                                     'csrfmiddlewaretoken': session.cookies.get('csrftoken', '') })
+    if (response.status_code != 302):
+        raise RuntimeError('{0} could not sign in: HTTP status {1}'.format(username, response.status_code))
+
+# Runs one step: count users doing the scenario for duration seconds
+#   parameters:
+#     admin: requests.Session. Signed in as a staff user, to read /contacts/metrics/.
+#   returns:
+#     The step's results as a dictionary.
+def run_step(app_url, admin, scenario, count, duration):
+    recorder = Recorder()
+    users = [ VirtualUser(app_url, 'load{0}'.format(index), scenario, recorder, index) for index in range(count) ]
+    for user in users:
+        user.start()
+    for user in users:
+        user.ready.wait()
+    failures = [ user.failure for user in users if not user.failure is None ]
+    if (len(failures) > 0):
+        for user in users:
+            user.stopping.set()
+        raise failures[0]
+
+    metrics_url = '{0}/contacts/metrics/'.format(app_url)
+    admin.post(metrics_url, data = { 'csrfmiddlewaretoken': admin.cookies.get('csrftoken', '') }, timeout = request_timeout)
+    recorder.start()
+    time.sleep(duration)
+    recorder.stop()
+    for user in users:
+        user.stopping.set()
+    for user in users:
+        user.join()
+    view_metrics = admin.get(metrics_url, timeout = request_timeout).json()['views']
+
+    all_durations = []
+    views = {}
+    for view_name in sorted(recorder.durations):
+        durations = recorder.durations[view_name]
+        all_durations.extend(durations)
+        result = harness.summarize(durations, recorder.elapsed)
+        result['errors'] = recorder.errors[view_name]
+        served = view_metrics.get(view_name, {})
+        result['api_calls_per_request'] = round(served['api_calls'] / served['count'], 2) if served.get('count') else None
+        views[view_name] = result
+
+    step = harness.summarize(all_durations, recorder.elapsed)
+    step['users'] = count
+    step['errors'] = sum(recorder.errors.values())
+    step['error_rate'] = round(step['errors'] / step['count'], 4) if step['count'] > 0 else 0.0
+    step['views'] = views
+    return step
+
+def print_step(step):
+    print('{0:>6} users{1:>10.1f}{2:>10.1f}{3:>10.1f}{4:>10.1f}{5:>9.1%}'.format(
+        step['users'], step['per_second'], step['p50_ms'], step['p95_ms'], step['p99_ms'], step['error_rate']))
+    for view_name, result in sorted(step['views'].items()):
+        api_calls = result['api_calls_per_request']
+        print('{0:>12}{1:>10.1f}{2:>10.1f}{3:>10.1f}{4:>10.1f}{5:>9}{6:>12}'.format(
+            view_name, result['per_second'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+            result['errors'], '-' if api_calls is None else api_calls))
+    sys.stdout.flush()
+
+# Returns whether a step shows the app is saturated: too many errors, or
+# too little more throughput than the step before
+def is_saturated(step, previous):
+    if (step['error_rate'] > saturation_error_rate):
+        return True
+    return not previous is None and step['per_second'] < previous['per_second'] * (1 + saturation_growth)
+
+# Reads a scenario file, filling in defaults for anything it leaves out
+def load_scenario(path):
+    scenario = dict(default_scenario)
+    if (not path is None):
+        with open(path) as scenario_file:
+            scenario.update(json.load(scenario_file))
+    unknown = set(scenario['actions']) - set(actions)
+    if (len(unknown) > 0):
+        raise ValueError('Unknown actions in {0}: {1}'.format(path, ', '.join(sorted(unknown))))
+    if (sum(scenario['actions'].values()) <= 0):
+        raise ValueError('The scenario needs at least one action with a weight above 0')
+    return scenario
+
+# Starts a process that prints 'Serving on <URL>' once it's ready
+#   returns:
+#     The process and the URL.
+def start_process(arguments):
+    process = subprocess.Popen(arguments, stdout = subprocess.PIPE, universal_newlines = True)
+    for line in process.stdout:
+        if (line.startswith('Serving on ')):
+            return process, line.split()[-1]
+    process.wait()
+    raise RuntimeError('{0} exited with code {1}'.format(os.path.basename(arguments[1]), process.returncode))
+
+# A WSGI server that handles each connection on its own thread, optionally
+# with at most a fixed number running at once, like a threaded worker
+class AppServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    slots = None
+
+    def process_request_thread(self, request, client_address):
+        if (self.slots is None):
+            return super().process_request_thread(request, client_address)
+        with self.slots:
+            return super().process_request_thread(request, client_address)
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+# Runs the app for a load test, in the process started by main
+def serve(argv):
+    parser = argparse.ArgumentParser(description = 'Runs the app against a load test database and stand-in.')
+    parser.add_argument('--database', required = True)
+    parser.add_argument('--standin', required = True, help = 'the stand-in URL')
+    parser.add_argument('--threads', type = int, default = 0)
+    arguments = parser.parse_args(argv)
+
+    harness.setup_django(database_path = arguments.database)
+    harness.use_standin(arguments.standin)
+    from django.core.wsgi import get_wsgi_application
+
+    server = make_server('127.0.0.1', 0, get_wsgi_application(), AppServer, QuietHandler)
+    if (arguments.threads > 0):
+        server.slots = threading.BoundedSemaphore(arguments.threads)
+    print('Serving on http://127.0.0.1:{0}'.format(server.server_port))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Load-tests the contacts views against a local Office 365 stand-in.')
+    parser.add_argument('--users', default = '1,2,4,8,16,32', help = 'comma-separated user counts to step through (default 1,2,4,8,16,32)')
+    parser.add_argument('--duration', type = float, default = 20, help = 'seconds to measure each step (default 20)')
+    parser.add_argument('--scenario', help = 'a JSON file with the think time and action weights')
+    parser.add_argument('--contacts', type = int, default = 200, help = 'contacts in each user\'s mailbox (default 200)')
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'seconds the stand-in adds to each API call')
+    parser.add_argument('--jitter', type = float, default = 0.0, help = 'up to this many more seconds, at random')
+    parser.add_argument('--throttle-rate', type = float, default = 0.0, help = 'fraction of API calls answered with 429')
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = 'fraction of API calls answered with 503')
+    parser.add_argument('--threads', type = int, default = 0,
+                        help = 'the most requests the app handles at once (default 0, no limit)')
+    parser.add_argument('--keep-going', action = 'store_true', help = 'run every step, even after saturation')
+    parser.add_argument('--output', help = 'where to save the results as JSON')
+    arguments = parser.parse_args()
+
+    scenario = load_scenario(arguments.scenario)
+    counts = [ int(count) for count in arguments.users.split(',') ]
+    benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+
+    database_path = harness.setup_django()
+    standin, standin_url = start_process([ sys.executable, os.path.join(benchmarks_path, 'o365standin.py'), '--port', '0',
+                                           '--mailbox-contacts', str(arguments.contacts),
+                                           '--latency', str(arguments.latency), '--jitter', str(arguments.jitter),
+                                           '--throttle-rate', str(arguments.throttle_rate),
+                                           '--error-rate', str(arguments.error_rate) ])
+    app = None
+    try:
+        for index in range(max(counts)):
+            harness.create_user(standin_url, 'load{0}'.format(index))
+        harness.create_user(standin_url, 'loadadmin', is_staff = True)
+        # The app's process writes to the database from here on
+        from django.db import connections
+        connections.close_all()
+
+        app, app_url = start_process([ sys.executable, os.path.abspath(__file__), 'serve', '--database', database_path,
+                                       '--standin', standin_url, '--threads', str(arguments.threads) ])
+        admin = requests.Session()
+        sign_in(admin, app_url, 'loadadmin')
+
+        print('Scenario: {0}'.format(json.dumps(scenario, sort_keys = True)))
+        print('{0:>12}{1:>10}{2:>10}{3:>10}{4:>10}{5:>9}{6:>12}'.format('', 'rps', 'p50 ms', 'p95 ms', 'p99 ms', 'errors', 'o365/req'))
+        steps = []
+        saturated_at = None
+        for count in counts:
+            step = run_step(app_url, admin, scenario, count, arguments.duration)
+            print_step(step)
+            if (saturated_at is None and is_saturated(step, steps[-1] if len(steps) > 0 else None)):
+                saturated_at = count
+            steps.append(step)
+            if (not saturated_at is None and not arguments.keep_going):
+                break
+    finally:
+        for process in (app, standin):
+            if (not process is None):
+                process.terminate()
+                process.wait()
+
+    peak = max(steps, key = lambda step: step['per_second'])
+    print()
+    if (saturated_at is None):
+        print('Not saturated at {0} users; peak {1:.1f} requests/s. Try more users.'.format(counts[-1], peak['per_second']))
+    else:
+        print('Saturated at {0} users; peak {1:.1f} requests/s with {2} users.'.format(saturated_at, peak['per_second'], peak['users']))
+
+    if (not arguments.output is None):
+        with open(arguments.output, 'w') as output_file:
+            json.dump({ 'options': vars(arguments),
+                        'scenario': scenario,
+                        'saturated_at': saturated_at,
+                        'peak': { 'users': peak['users'], 'per_second': peak['per_second'] },
+                        'steps': steps }, output_file, indent = 2)
+        print('Results saved to {0}'.format(arguments.output))
+
+if __name__ == '__main__':
+    if (len(sys.argv) > 1 and sys.argv[1] == 'serve'):
+        serve(sys.argv[2:])
+    else:
+        main()
+    
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,595 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+# A local stand-in for the parts of Office 365 the app talks to: the token
+# endpoint, the discovery service, and the Outlook REST v1.0 Contacts, Mail
+# and Calendar APIs, including $batch. Items are kept in memory per mailbox.
+#
+# Latency, page sizes, throttling (429 with Retry-After) and server errors
+# (503) can be set, so benchmarks and load tests can measure the app without
+# a live tenant.
+#
+# Used by benchmarks/run.py and benchmarks/loadtest.py. It can also be run on
+# its own:
+#   python benchmarks/o365standin.py --port 8001 --contacts 500 --latency 0.05
+from collections import Counter, OrderedDict
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import argparse
+import base64
+import datetime
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+api_path = '/api/v1.0/'
+token_path = '/common/oauth2/token'
+discovery_path = '/discovery/v1.0/me/services'
+
+# The entity sets under /Me that are stored, by their lowercase name
+entity_sets = { 'contacts': 'Contacts', 'messages': 'Messages', 'events': 'Events' }
+# The capabilities returned by discovery
+capabilities = [ 'Contacts', 'Mail', 'Calendar' ]
+
+# Page sizes, as Office 365 applies them: $top defaults to 10 and is capped at 50
+default_page_size = 10
+max_page_size = 50
+# Seconds an issued access token is valid for
+token_lifetime = 3600
+tenant_id = '00000000-0000-0000-0000-00000000beef'
+
+# The $filter expressions understood: startswith(Field,'value') and
+# Field eq 'value', joined with 'or'
+filter_term_pattern = re.compile(r"\s*(?:startswith\((\w+),\s*'((?:[^']|'')*)'\)|(\w+)\s+eq\s+'((?:[^']|'')*)')\s*")
+
+given_names = [ 'Ann', 'Bob', 'Carla', 'Dmitri', 'Elena', 'Farid', 'Grace', 'Hiroshi', 'Ines', 'Jamal',
+                'Katya', 'Luis', 'Mei', 'Noor', 'Olu', 'Priya', 'Quinn', 'Rafael', 'Sofia', 'Tomasz' ]
+surnames = [ 'Anderson', 'Baptiste', 'Chen', 'Dubois', 'Eriksen', 'Fernandes', 'Garcia', 'Haddad', 'Ivanova',
+             'Jensen', 'Kowalski', 'Lindqvist', 'Moreau', 'Nakamura', 'Okafor', 'Patel', 'Rossi', 'Schmidt' ]
+
+# Raised while handling a request to return an OData error response
+class StandinError(Exception):
+    def __init__(self, status_code, code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+
+    def to_json(self):
+        return { 'error': { 'code': self.code, 'message': str(self) } }
+
+def encode_base64url(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def decode_base64url(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+# Builds an unsigned JWT with the claims the app reads (upn and tid)
+def make_token(user, resource):
+    header = { 'typ': 'JWT', 'alg': 'none' }
+    claims = { 'upn': user, 'tid': tenant_id, 'aud': resource,
+               'exp': int(time.time()) + token_lifetime, 'jti': uuid.uuid4().hex }
+    return '{0}.{1}.'.format(encode_base64url(json.dumps(header).encode('utf-8')),
+                             encode_base64url(json.dumps(claims).encode('utf-8')))
+
+# Returns the token response a stand-in at url gives a user after sign-in.
+# Tokens aren't signed, so they can be made without the server running.
+def issue_tokens(url, user, resource = None):
+    resource = resource or '{0}/'.format(url)
+    return { 'token_type': 'Bearer',
+             'access_token': make_token(user, resource),
+             'refresh_token': 'refresh.{0}'.format(encode_base64url(user.encode('utf-8'))),
+             'expires_in': str(token_lifetime),
+             'expires_on': str(int(time.time()) + token_lifetime),
+             'resource': resource }
+
+def new_id():
+    # Real Ids are long base64 strings
+    return 'AAMkAGI2{0}{1}AAA='.format(uuid.uuid4().hex, uuid.uuid4().hex[:16])
+
+def new_change_key():
+    return encode_base64url(uuid.uuid4().bytes)
+
+def now_iso():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+# Generates contacts like the ones in a real mailbox, with the properties
+# the app uses and a few it doesn't
+def make_contacts(count, seed = 1):
+    rng = random.Random(seed)
+    for index in range(count):
+        given_name = rng.choice(given_names)
+        surname = '{0}{1}'.format(rng.choice(surnames), index)
+        yield { 'GivenName': given_name,
+                'Surname': surname,
+                'MobilePhone1': '+1 425 {0:03d} {1:04d}'.format(rng.randrange(1000), rng.randrange(10000)),
+                'EmailAddresses': [ { 'Address': '{0}.{1}@contoso.com'.format(given_name, surname).lower(),
+                                      'Name': '{0} {1}'.format(given_name, surname) } ],
+                'JobTitle': 'Engineer',
+                'CompanyName': 'Contoso',
+                'BusinessPhones': [ '+1 425 555 0100' ],
+                'HomeAddress': { 'Street': '1 Main St', 'City': 'Redmond', 'State': 'WA', 'PostalCode': '98052' } }
+
+# One user's items, by entity set, in the order they were created
+class Mailbox:
+    def __init__(self):
+        self.items = dict((name, OrderedDict()) for name in entity_sets.values())
+        self.lock = threading.Lock()
+
+    def add(self, entity_set, properties):
+        item = dict(properties)
+        item['Id'] = new_id()
+        touch(item)
+        with self.lock:
+            self.items[entity_set][item['Id']] = item
+        return item
+
+    def get(self, entity_set, item_id):
+        item = self.items[entity_set].get(item_id)
+        if (item is None):
+            raise StandinError(404, 'ErrorItemNotFound', 'The specified object was not found in the store.')
+        return item
+
+    def update(self, entity_set, item_id, properties, if_match = None):
+        with self.lock:
+            item = self.get(entity_set, item_id)
+            if (not if_match is None and if_match != item['@odata.etag']):
+                raise StandinError(412, 'ErrorIrresolvableConflict',
+                                   'The send or update operation could not be performed because the change key passed in the request does not match the current change key for the item.')
+            item.update(properties)
+            touch(item)
+            return dict(item)
+
+    def delete(self, entity_set, item_id):
+        with self.lock:
+            self.get(entity_set, item_id)
+            del self.items[entity_set][item_id]
+
+    def list(self, entity_set):
+        with self.lock:
+            return list(self.items[entity_set].values())
+
+# Gives an item a new ChangeKey and modified time, as any change does
+def touch(item):
+    item['ChangeKey'] = new_change_key()
+    item['@odata.etag'] = 'W/"{0}"'.format(item['ChangeKey'])
+    item['DateTimeLastModified'] = now_iso()
+
+# The server. Each connection is handled on its own thread, and connections
+# are kept alive, like the service's.
+#   parameters:
+#     address: (host, port). Port 0 picks a free port.
+#     latency: float. Seconds added to every API call.
+#     jitter: float. Up to this many more seconds are added at random.
+#     throttle_rate: float. The fraction of API calls answered with 429.
+#     retry_after: int. The Retry-After sent with a 429, in seconds.
+#     error_rate: float. The fraction of API calls answered with 503.
+#     seed: int. Seeds the random latency, throttling and errors.
+#     mailbox_contacts: int. The number of contacts a mailbox starts with
+#                       when it is first used.
+class StandinServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address = ('127.0.0.1', 0), latency = 0.0, jitter = 0.0, throttle_rate = 0.0,
+                 retry_after = 1, error_rate = 0.0, seed = None, mailbox_contacts = 0):
+        HTTPServer.__init__(self, address, StandinHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.mailbox_contacts = mailbox_contacts
+        self.mailboxes = {}
+        self.request_counts = Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}'.format(*self.server_address[:2])
+
+    @property
+    def api_endpoint(self):
+        return '{0}{1}'.format(self.url, api_path.rstrip('/'))
+
+    def start(self):
+        self.thread = threading.Thread(target = self.serve_forever, name = 'o365standin')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def get_mailbox(self, user):
+        with self.lock:
+            mailbox = self.mailboxes.get(user.lower())
+            if (mailbox is None):
+                mailbox = self.mailboxes[user.lower()] = Mailbox()
+                for contact in make_contacts(self.mailbox_contacts):
+                    mailbox.add('Contacts', contact)
+            return mailbox
+
+    # Adds count generated contacts to a user's mailbox
+    def seed_contacts(self, user, count, seed = 1):
+        mailbox = self.get_mailbox(user)
+        for contact in make_contacts(count, seed):
+            mailbox.add('Contacts', contact)
+
+    # Returns an access token and refresh token for a user, as the token
+    # endpoint would after sign-in
+    def issue_tokens(self, user, resource = None):
+        return issue_tokens(self.url, user, resource)
+
+    def count_request(self, name):
+        with self.lock:
+            self.request_counts[name] += 1
+
+    # Returns the number of requests received, by operation, since the last call
+    def take_request_counts(self):
+        with self.lock:
+            counts = self.request_counts
+            self.request_counts = Counter()
+            return counts
+
+    # Decides whether an API call is throttled or fails, and how long it takes
+    def get_injected_fault(self):
+        with self.lock:
+            delay = self.latency + (self.random.random() * self.jitter if self.jitter > 0 else 0.0)
+            roll = self.random.random()
+        if (roll < self.throttle_rate):
+            return delay, 429
+        if (roll < self.throttle_rate + self.error_rate):
+            return delay, 503
+        return delay, None
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'o365standin/1.0'
+    # Headers and body are written separately. Without this, Nagle's
+    # algorithm holds back the body until the client acknowledges the
+    # headers, adding about 40 ms to every response on a kept-alive connection.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PATCH(self):
+        self.handle_request('PATCH')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+    def handle_request(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length > 0 else b''
+        url = urlsplit(self.path)
+
+        try:
+            if (url.path == token_path and method == 'POST'):
+                self.server.count_request('POST token')
+                self.send_json(200, self.get_token_response(body))
+            elif (url.path == discovery_path and method == 'GET'):
+                self.server.count_request('GET discovery')
+                self.get_user()
+                self.send_json(200, self.get_discovery_response())
+            elif (url.path.startswith(api_path)):
+                self.handle_api_call(method, url, body)
+            else:
+                raise StandinError(404, 'ErrorInvalidUrl', 'Unknown path: {0}'.format(url.path))
+        except StandinError as e:
+            self.send_json(e.status_code, e.to_json(), self.get_error_headers(e))
+
+    def handle_api_call(self, method, url, body):
+        path = url.path[len(api_path):]
+        delay, fault = self.server.get_injected_fault()
+        if (delay > 0):
+            time.sleep(delay)
+
+        mailbox = self.server.get_mailbox(self.get_user())
+
+        if (path.lower() == '$batch' and method == 'POST'):
+            self.server.count_request('POST $batch')
+            if (fault is None):
+                self.send_batch_response(mailbox, body)
+                return
+        else:
+            self.server.count_request(get_route_name(method, path))
+
+        if (fault == 429):
+            raise StandinError(429, 'ApplicationThrottled', 'Application is over its MailboxConcurrency limit.')
+        if (fault == 503):
+            raise StandinError(503, 'ErrorServerBusy', 'The server cannot service this request right now.')
+
+        status_code, headers, json_body = dispatch(mailbox, method, path, dict(parse_qsl(url.query)),
+                                                   self.headers, body, self.server.api_endpoint)
+        self.send_json(status_code, json_body, headers)
+
+    def get_error_headers(self, e):
+        if (e.status_code == 429):
+            return { 'Retry-After': str(self.server.retry_after) }
+        return None
+
+    # Returns the user an access token was issued to
+    def get_user(self):
+        authorization = self.headers.get('Authorization') or ''
+        if (not authorization.startswith('Bearer ')):
+            raise StandinError(401, 'InvalidAuthenticationToken', 'Access token is empty.')
+        try:
+            claims = json.loads(decode_base64url(authorization[7:].split('.')[1]).decode('utf-8'))
+            if (claims['exp'] < time.time()):
+                raise StandinError(401, 'InvalidAuthenticationToken', 'Access token has expired.')
+            return claims['upn']
+        except (IndexError, KeyError, ValueError):
+            raise StandinError(401, 'InvalidAuthenticationToken', 'Access token validation failure.')
+
+    # The authorization code grant takes any code and signs in as the user
+    # named by it ('alice' signs in alice@contoso.com). The refresh token
+    # grant takes the refresh tokens issue_tokens returns.
+    def get_token_response(self, body):
+        form = dict(parse_qsl(body.decode('utf-8')))
+        grant_type = form.get('grant_type')
+        if (grant_type == 'authorization_code'):
+            code = form.get('code') or 'user'
+            user = code if '@' in code else '{0}@contoso.com'.format(code)
+        elif (grant_type == 'refresh_token'):
+            try:
+                user = decode_base64url(form.get('refresh_token', '').split('.', 1)[1]).decode('utf-8')
+            except (IndexError, ValueError):
+                raise StandinError(400, 'invalid_grant', 'The refresh token is malformed.')
+        else:
+            raise StandinError(400, 'unsupported_grant_type', 'Unsupported grant_type: {0}'.format(grant_type))
+        return self.server.issue_tokens(user, form.get('resource'))
+
+    def get_discovery_response(self):
+        return { 'value': [ { 'capability': capability,
+                              'serviceResourceId': '{0}/'.format(self.server.url),
+                              'serviceEndpointUri': self.server.api_endpoint }
+                            for capability in capabilities ] }
+
+    # Runs each operation of a $batch request and returns the results as
+    # a multipart/mixed response
+    def send_batch_response(self, mailbox, body):
+        boundary = None
+        for parameter in (self.headers.get('Content-Type') or '').split(';')[1:]:
+            name, _, value = parameter.strip().partition('=')
+            if (name.lower() == 'boundary'):
+                boundary = value.strip('"')
+        if (boundary is None):
+            raise StandinError(400, 'ErrorInvalidRequest', 'A $batch request must be multipart/mixed.')
+
+        response_boundary = 'batchresponse_{0}'.format(uuid.uuid4())
+        parts = []
+        for part in body.decode('utf-8').split('--{0}'.format(boundary))[1:]:
+            if (part.startswith('--')):
+                break
+            method, path, query, headers, part_body = parse_batch_request_part(part, self.server.api_endpoint)
+            try:
+                status_code, _, json_body = dispatch(mailbox, method, path, query, headers,
+                                                     part_body, self.server.api_endpoint)
+            except StandinError as e:
+                status_code, json_body = e.status_code, e.to_json()
+            parts.append('--{0}\r\nContent-Type: application/http\r\nContent-Transfer-Encoding: binary\r\n\r\n'
+                         'HTTP/1.1 {1} {2}\r\nContent-Type: application/json\r\n\r\n{3}\r\n'.format(
+                             response_boundary, status_code, self.responses.get(status_code, ('',))[0],
+                             '' if json_body is None else json.dumps(json_body)))
+        content = '{0}--{1}--\r\n'.format(''.join(parts), response_boundary).encode('utf-8')
+        self.send_body(200, content, 'multipart/mixed; boundary={0}'.format(response_boundary))
+
+    def send_json(self, status_code, json_body, headers = None):
+        content = b'' if json_body is None else json.dumps(json_body).encode('utf-8')
+        self.send_body(status_code, content, 'application/json; odata.metadata=minimal; charset=utf-8', headers)
+
+    def send_body(self, status_code, content, content_type, headers = None):
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        request_id = self.headers.get('client-request-id')
+        if (request_id):
+            self.send_header('client-request-id', request_id)
+        self.send_header('request-id', str(uuid.uuid4()))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+# Splits one part of a $batch request into the embedded request's method,
+# path (relative to the API endpoint), query, headers and body
+def parse_batch_request_part(part, api_endpoint):
+    part = part.replace('\r\n', '\n')
+    _, _, http_request = part.strip('\n').partition('\n\n')
+    head, _, body = http_request.partition('\n\n')
+    lines = head.split('\n')
+    method, url = lines[0].split(' ')[0:2]
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip()] = value.strip()
+    url = urlsplit(url)
+    path = url.path
+    if (path.startswith(api_path)):
+        path = path[len(api_path):]
+    return method.upper(), path.lstrip('/'), dict(parse_qsl(url.query)), headers, body.strip().encode('utf-8')
+
+# The operation a call is counted under, with Ids replaced: 'GET Me/Contacts/{id}'
+def get_route_name(method, path):
+    segments = path.strip('/').split('/')
+    if (len(segments) >= 3):
+        segments[2] = '{id}'
+    return '{0} {1}'.format(method, '/'.join(segments))
+
+# Handles one API operation on a mailbox
+#   parameters:
+#     mailbox: Mailbox. The signed-in user's mailbox.
+#     method: string. The HTTP method.
+#     path: string. The path after /api/v1.0/, like 'Me/Contacts/{id}'.
+#     query: dict. The query parameters.
+#     headers: The request headers (If-Match and If-None-Match are used).
+#     body: bytes. The request body.
+#     api_endpoint: string. Used to build @odata.nextLink.
+#   returns:
+#     (status code, extra headers, JSON body or None)
+def dispatch(mailbox, method, path, query, headers, body, api_endpoint):
+    segments = path.strip('/').split('/')
+    if (len(segments) < 2 or segments[0].lower() != 'me'):
+        raise StandinError(404, 'ErrorInvalidUrl', 'Unknown path: {0}'.format(path))
+
+    if (len(segments) == 2 and segments[1].lower() == 'sendmail' and method == 'POST'):
+        message = parse_body(body).get('Message', {})
+        message['IsDraft'] = False
+        mailbox.add('Messages', message)
+        return 202, None, None
+
+    entity_set = entity_sets.get(segments[1].lower())
+    if (entity_set is None):
+        raise StandinError(404, 'ErrorInvalidUrl', 'Unknown entity set: {0}'.format(segments[1]))
+
+    if (len(segments) == 2):
+        if (method == 'GET'):
+            return 200, None, get_collection_page(mailbox, entity_set, path, query, api_endpoint)
+        if (method == 'POST'):
+            return 201, None, mailbox.add(entity_set, parse_body(body))
+    elif (len(segments) == 3):
+        item_id = segments[2]
+        if (method == 'GET'):
+            item = mailbox.get(entity_set, item_id)
+            if_none_match = headers.get('If-None-Match')
+            if (not if_none_match is None and if_none_match == item['@odata.etag']):
+                return 304, None, None
+            return 200, None, select_properties(item, query.get('$select'))
+        if (method == 'PATCH'):
+            return 200, None, mailbox.update(entity_set, item_id, parse_body(body), headers.get('If-Match'))
+        if (method == 'DELETE'):
+            mailbox.delete(entity_set, item_id)
+            return 204, None, None
+    elif (len(segments) == 4 and entity_set == 'Messages' and segments[3].lower() == 'send' and method == 'POST'):
+        mailbox.update(entity_set, segments[2], { 'IsDraft': False })
+        return 202, None, None
+
+    raise StandinError(405, 'ErrorInvalidRequest', 'Unsupported operation: {0} {1}'.format(method, path))
+
+def parse_body(body):
+    try:
+        return json.loads(body.decode('utf-8')) if body else {}
+    except ValueError:
+        raise StandinError(400, 'RequestBodyRead', 'The request body is not valid JSON.')
+
+def select_properties(item, select):
+    if (not select):
+        return dict(item)
+    names = [ name.strip() for name in select.split(',') ] + [ 'Id', '@odata.etag' ]
+    return dict((name, item[name]) for name in names if name in item)
+
+# Applies $filter, $orderby, $skip, $top and $select to a collection and
+# returns one page, with @odata.nextLink if there are more items
+def get_collection_page(mailbox, entity_set, path, query, api_endpoint):
+    items = mailbox.list(entity_set)
+
+    if (query.get('$filter')):
+        items = [ item for item in items if matches_filter(item, parse_filter(query['$filter'])) ]
+
+    if (query.get('$orderby')):
+        field, _, direction = query['$orderby'].strip().partition(' ')
+        items.sort(key = lambda item: str(item.get(field) or '').lower(), reverse = direction.lower() == 'desc')
+
+    try:
+        skip = int(query.get('$skip') or 0)
+        top = min(int(query.get('$top') or default_page_size), max_page_size)
+    except ValueError:
+        raise StandinError(400, 'ErrorInvalidUrlQuery', '$skip and $top must be numbers.')
+
+    page = [ select_properties(item, query.get('$select')) for item in items[skip:skip + top] ]
+    result = { 'value': page }
+    if (skip + top < len(items)):
+        next_query = dict(query)
+        next_query['$skip'] = str(skip + top)
+        next_query['$top'] = str(top)
+        result['@odata.nextLink'] = '{0}/{1}?{2}'.format(api_endpoint, path.strip('/'),
+                                                         urlencode(sorted(next_query.items()), safe = "$,'()"))
+    return result
+
+# Parses a $filter into (field, value, is prefix match) terms, any of which may match
+def parse_filter(expression):
+    terms = []
+    for clause in re.split(r'\s+or\s+', expression):
+        match = filter_term_pattern.fullmatch(clause)
+        if (match is None):
+            raise StandinError(400, 'ErrorInvalidUrlQueryFilter', 'Unsupported $filter: {0}'.format(expression))
+        if (match.group(1)):
+            terms.append((match.group(1), match.group(2).replace("''", "'").lower(), True))
+        else:
+            terms.append((match.group(3), match.group(4).replace("''", "'").lower(), False))
+    return terms
+
+def matches_filter(item, terms):
+    for field, value, is_prefix in terms:
+        item_value = str(item.get(field) or '').lower()
+        if (item_value.startswith(value) if is_prefix else item_value == value):
+            return True
+    return False
+
+# Starts a stand-in server on a background thread and returns it
+def start_server(**options):
+    return StandinServer(**options).start()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Runs a local stand-in for the Office 365 APIs.')
+    parser.add_argument('--port', type = int, default = 8001)
+    parser.add_argument('--user', default = 'user@contoso.com', help = 'the mailbox to seed')
+    parser.add_argument('--contacts', type = int, default = 0, help = 'the number of contacts to seed')
+    parser.add_argument('--mailbox-contacts', type = int, default = 0,
+                        help = 'the number of contacts every other mailbox starts with')
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'seconds added to each API call')
+    parser.add_argument('--jitter', type = float, default = 0.0, help = 'up to this many more seconds, at random')
+    parser.add_argument('--throttle-rate', type = float, default = 0.0, help = 'fraction of API calls answered with 429')
+    parser.add_argument('--retry-after', type = int, default = 1)
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = 'fraction of API calls answered with 503')
+    arguments = parser.parse_args()
+
+    server = StandinServer(('127.0.0.1', arguments.port), latency = arguments.latency, jitter = arguments.jitter,
+                           throttle_rate = arguments.throttle_rate, retry_after = arguments.retry_after,
+                           error_rate = arguments.error_rate, mailbox_contacts = arguments.mailbox_contacts)
+    server.seed_contacts(arguments.user, arguments.contacts)
+    tokens = server.issue_tokens(arguments.user)
+    print('Serving on {0}'.format(server.url))
+    print('API endpoint: {0}'.format(server.api_endpoint))
+    print('Access token for {0}: {1}'.format(arguments.user, tokens['access_token']))
+    print('Refresh token: {0}'.format(tokens['refresh_token']))
+    # Whoever started the stand-in may be waiting for these lines on a pipe
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
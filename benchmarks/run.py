@@ -0,0 +1,269 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+# Runs the offline benchmark suite against a local Office 365 stand-in
+# (benchmarks/o365standin.py): make_api_call, each Contacts, Mail and
+# Calendar function, and the index, edit and update views at several
+# contact counts. Results are saved as JSON, and can be compared with an
+# earlier run to spot regressions.
+#
+# Run from the project root:
+#   python benchmarks/run.py
+#   python benchmarks/run.py --counts 100,1000,5000 --latency 0.02
+#   python benchmarks/run.py --compare benchmarks/results/<earlier run>.json
+import os
+import argparse
+import datetime
+import json
+import platform
+import time
+
+import harness
+
+# How much slower an operation's mean must be than in the earlier run to be
+# reported as a regression
+regression_threshold = 0.10
+
+contact_payload = json.dumps({ 'GivenName': 'Pavel', 'Surname': 'Bansky',
+                               'EmailAddresses': [ { 'Address': 'pavelb@contoso.com', 'Name': 'Pavel Bansky' } ],
+                               'MobilePhone1': '+1 732 555 0102' })
+message_payload = json.dumps({ 'Subject': 'Benchmark', 'Body': { 'ContentType': 'Text', 'Content': 'Hello' },
+                               'ToRecipients': [ { 'EmailAddress': { 'Address': 'pavelb@contoso.com' } } ] })
+event_payload = json.dumps({ 'Subject': 'Benchmark', 'Start': '2015-03-01T17:00:00Z', 'End': '2015-03-01T18:00:00Z' })
+
+# Collects the results of one run
+class Suite:
+    def __init__(self, server, iterations):
+        self.server = server
+        self.iterations = iterations
+        self.results = []
+
+    # Times function over iterations calls and records the result
+    #   parameters:
+    #     group: string. 'service' or 'view'.
+    #     name: string. What was measured.
+    #     function: callable. Called with the iteration number. Returns True if the call succeeded.
+    #     contact_count: int. The number of contacts in the mailbox.
+    #     iterations: int. Overrides the suite's number of iterations.
+    #     prepare: callable. Called with the iteration number before each call, untimed.
+    def measure(self, group, name, function, contact_count, iterations = None, prepare = None):
+        iterations = iterations or self.iterations
+        durations = []
+        errors = 0
+        self.server.take_request_counts()
+
+        for iteration in range(iterations):
+            if (not prepare is None):
+                prepare(iteration)
+            started = time.perf_counter()
+            succeeded = function(iteration)
+            durations.append(time.perf_counter() - started)
+            errors += 0 if succeeded else 1
+
+        upstream_calls = sum(self.server.take_request_counts().values())
+        result = { 'group': group, 'name': name, 'contacts': contact_count, 'errors': errors,
+                   'upstream_calls_per_op': round(upstream_calls / iterations, 2) }
+        result.update(harness.summarize(durations))
+        self.results.append(result)
+        print('{0:<8}{1:<34}{2:>9}{3:>10.3f}{4:>10.3f}{5:>10.3f}{6:>10.1f}{7:>8}{8:>10}'.format(
+            group, name, contact_count, result['mean_ms'], result['p50_ms'], result['p95_ms'],
+            result['per_second'], errors, result['upstream_calls_per_op']))
+        return result
+
+def print_header():
+    print('{0:<8}{1:<34}{2:>9}{3:>10}{4:>10}{5:>10}{6:>10}{7:>8}{8:>10}'.format(
+        'group', 'operation', 'contacts', 'mean ms', 'p50 ms', 'p95 ms', 'ops/s', 'errors', 'upstream'))
+
+# Times make_api_call and every Contacts, Mail and Calendar function
+def run_service_benchmarks(suite, contact_count):
+    import contacts.o365service as service
+
+    connection = harness.create_user(suite.server.url, 'service{0}'.format(contact_count))
+    suite.server.seed_contacts(connection.user_email, contact_count)
+    endpoint = connection.outlook_api_endpoint
+    token = connection.access_token
+    mailbox = suite.server.get_mailbox(connection.user_email)
+    iterations = suite.iterations
+
+    # Items to read, update and delete, one per iteration
+    contact_ids = [ mailbox.add('Contacts', json.loads(contact_payload))['Id'] for _ in range(iterations * 2) ]
+    message_ids = [ mailbox.add('Messages', json.loads(message_payload))['Id'] for _ in range(iterations * 2) ]
+    event_ids = [ mailbox.add('Events', json.loads(event_payload))['Id'] for _ in range(iterations * 2) ]
+    batch_ids = [ mailbox.add('Contacts', json.loads(contact_payload))['Id'] for _ in range(iterations * 20) ]
+    contact_url = '{0}/Me/Contacts/{{0}}'.format(endpoint)
+    change_keys = {}
+
+    def remember_change_key(iteration):
+        change_keys[iteration] = mailbox.get('Contacts', contact_ids[iteration])['ChangeKey']
+
+    measures = [
+        ('make_api_call GET', lambda i: service.make_api_call('GET', contact_url.format(contact_ids[i]), token).status_code == 200, None),
+        ('get_contacts', lambda i: not service.get_contacts(endpoint, token) is None, None),
+        ('get_contact_by_id', lambda i: not service.get_contact_by_id(endpoint, token, contact_ids[i]) is None, None),
+        ('get_contact_if_changed (304)', lambda i: service.get_contact_if_changed(endpoint, token, contact_ids[i], change_keys[i])[0] == 304, remember_change_key),
+        ('create_contact', lambda i: service.create_contact(endpoint, token, contact_payload) == 201, None),
+        ('update_contact', lambda i: service.update_contact(endpoint, token, contact_ids[i], '{"JobTitle": "Manager"}', change_keys[i]) == 200, remember_change_key),
+        ('create_contacts (batch of 20)', lambda i: all(result.status_code == 201 for result in service.create_contacts(endpoint, token, [ contact_payload ] * 20)), None),
+        ('update_contacts (batch of 20)', lambda i: all(result.status_code == 200 for result in service.update_contacts(endpoint, token, [ (contact_id, '{"JobTitle": "Lead"}') for contact_id in contact_ids[iterations:iterations + 20] ])), None),
+        ('delete_contact', lambda i: service.delete_contact(endpoint, token, contact_ids[i]) == 204, None),
+        ('delete_contacts (batch of 20)', lambda i: all(result.status_code == 204 for result in service.delete_contacts(endpoint, token, batch_ids[i * 20:(i + 1) * 20])), None),
+        ('get_messages', lambda i: not service.get_messages(endpoint, token) is None, None),
+        ('get_message_by_id', lambda i: not service.get_message_by_id(endpoint, token, message_ids[i]) is None, None),
+        ('create_message', lambda i: service.create_message(endpoint, token, message_payload) == 201, None),
+        ('update_message', lambda i: service.update_message(endpoint, token, message_ids[i], '{"Subject": "Updated"}') == 200, None),
+        ('send_draft_message', lambda i: service.send_draft_message(endpoint, token, message_ids[iterations + i]) == 202, None),
+        ('delete_message', lambda i: service.delete_message(endpoint, token, message_ids[i]) == 204, None),
+        ('get_events', lambda i: not service.get_events(endpoint, token) is None, None),
+        ('get_event_by_id', lambda i: not service.get_event_by_id(endpoint, token, event_ids[i]) is None, None),
+        ('create_event', lambda i: service.create_event(endpoint, token, event_payload) == 201, None),
+        ('update_event', lambda i: service.update_event(endpoint, token, event_ids[i], '{"Subject": "Updated"}') == 200, None),
+        ('delete_event', lambda i: service.delete_event(endpoint, token, event_ids[i]) == 204, None),
+    ]
+    for name, function, prepare in measures:
+        suite.measure('service', name, function, contact_count, prepare = prepare)
+
+    # Reading the whole mailbox grows with the number of contacts, so it runs fewer times
+    suite.measure('service', 'iter_contacts (all, 50 per page)',
+                  lambda i: sum(1 for contact in service.iter_contacts(endpoint, token, page_size = 50)) >= contact_count,
+                  contact_count, iterations = max(1, min(iterations, 20000 // max(contact_count, 1))))
+
+# Times the index, edit and update views through Django's test client,
+# with the app serving the list from the local mirror
+def run_view_benchmarks(suite, contact_count):
+    from django.test import Client
+    from django.core.urlresolvers import reverse
+    from contacts.models import MirroredContact
+    import contacts.listcache
+
+    connection = harness.create_user(suite.server.url, 'views{0}'.format(contact_count))
+    suite.server.seed_contacts(connection.user_email, contact_count)
+    client = Client()
+    client.login(username = connection.username, password = harness.password)
+    iterations = suite.iterations
+    index_url = reverse('contacts:index')
+
+    # The first view syncs the mirror with Office 365
+    suite.measure('view', 'index (first sync)', lambda i: client.get(index_url).status_code == 200,
+                  contact_count, iterations = 1)
+
+    suite.measure('view', 'index (rendered)', lambda i: client.get(index_url).status_code == 200,
+                  contact_count, prepare = lambda i: contacts.listcache.invalidate(connection))
+    suite.measure('view', 'index (cached)', lambda i: client.get(index_url).status_code == 200,
+                  contact_count)
+    suite.measure('view', 'index (page 5, sorted, search)',
+                  lambda i: client.get(index_url, { 'page': 5, 'sort': '-last_name', 'q': 'a' }).status_code == 200,
+                  contact_count, prepare = lambda i: contacts.listcache.invalidate(connection))
+
+    contact_ids = list(MirroredContact.objects.filter(connection = connection)
+                                              .order_by('id')
+                                              .values_list('contact_id', flat = True)[:iterations])
+
+    suite.measure('view', 'edit', lambda i: client.get(reverse('contacts:edit', args = [ contact_ids[i % len(contact_ids)] ])).status_code == 200,
+                  contact_count)
+
+    def post_update(iteration):
+        mirrored_contact = MirroredContact.objects.get(connection = connection, contact_id = contact_ids[iteration % len(contact_ids)])
+        display_contact = mirrored_contact.to_display_contact()
+        data = { 'first_name': 'Updated{0}'.format(iteration),
+                 'last_name': display_contact.last_name,
+                 'mobile_phone': display_contact.mobile_phone,
+                 'change_key': display_contact.change_key }
+        for number in (1, 2, 3):
+            data['email{0}_address'.format(number)] = getattr(display_contact, 'email{0}_address'.format(number)) or ''
+            data['email{0}_name'.format(number)] = getattr(display_contact, 'email{0}_name'.format(number)) or ''
+        return data
+
+    update_forms = {}
+    suite.measure('view', 'update',
+                  lambda i: client.post(reverse('contacts:update', args = [ contact_ids[i % len(contact_ids)] ]), update_forms.pop(i)).status_code == 302,
+                  contact_count, prepare = lambda i: update_forms.__setitem__(i, post_update(i)))
+
+# Prints each result's change in mean latency from an earlier run
+def compare(results, previous_path):
+    with open(previous_path) as previous_file:
+        previous = json.load(previous_file)
+    earlier = dict(((result['group'], result['name'], result['contacts']), result) for result in previous['results'])
+
+    print()
+    print('Compared with {0} ({1})'.format(previous_path, previous.get('started')))
+    print('{0:<8}{1:<34}{2:>9}{3:>12}{4:>12}{5:>10}'.format('group', 'operation', 'contacts', 'before ms', 'after ms', 'change'))
+    regressions = 0
+    for result in results:
+        before = earlier.get((result['group'], result['name'], result['contacts']))
+        if (before is None or before['mean_ms'] == 0):
+            continue
+        change = (result['mean_ms'] - before['mean_ms']) / before['mean_ms']
+        flag = ''
+        if (change > regression_threshold):
+            flag = '  slower'
+            regressions += 1
+        print('{0:<8}{1:<34}{2:>9}{3:>12.3f}{4:>12.3f}{5:>+9.0%}{6}'.format(
+            result['group'], result['name'], result['contacts'], before['mean_ms'], result['mean_ms'], change, flag))
+    print('{0} operations more than {1:.0%} slower'.format(regressions, regression_threshold))
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Runs the offline benchmark suite.')
+    parser.add_argument('--counts', default = '100,1000', help = 'comma-separated contact counts (default 100,1000)')
+    parser.add_argument('--iterations', type = int, default = 100, help = 'calls per operation (default 100)')
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'seconds the stand-in adds to each API call')
+    parser.add_argument('--jitter', type = float, default = 0.0, help = 'up to this many more seconds, at random')
+    parser.add_argument('--only', choices = [ 'service', 'view' ], help = 'run only one group')
+    parser.add_argument('--debug-logging', action = 'store_true', help = 'keep the contacts logger at DEBUG')
+    parser.add_argument('--output', help = 'where to save the results (default benchmarks/results/<time>.json)')
+    parser.add_argument('--compare', help = 'an earlier results file to compare with')
+    arguments = parser.parse_args()
+
+    harness.setup_django(arguments.debug_logging)
+    import django
+    server = harness.start_standin(latency = arguments.latency, jitter = arguments.jitter, seed = 1)
+
+    started = datetime.datetime.now()
+    counts = [ int(count) for count in arguments.counts.split(',') ]
+    suite = Suite(server, arguments.iterations)
+
+    print_header()
+    for contact_count in counts:
+        if (arguments.only in (None, 'service')):
+            run_service_benchmarks(suite, contact_count)
+        if (arguments.only in (None, 'view')):
+            run_view_benchmarks(suite, contact_count)
+
+    server.stop()
+
+    output = arguments.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results',
+                                              '{0}.json'.format(started.strftime('%Y%m%d-%H%M%S')))
+    if (not os.path.isdir(os.path.dirname(os.path.abspath(output)))):
+        os.makedirs(os.path.dirname(os.path.abspath(output)))
+    with open(output, 'w') as output_file:
+        json.dump({ 'started': started.isoformat(),
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'platform': platform.platform(),
+                    'options': vars(arguments),
+                    'results': suite.results }, output_file, indent = 2)
+    print('Results saved to {0}'.format(output))
+
+    if (arguments.compare):
+        compare(suite.results, arguments.compare)
+
+if __name__ == '__main__':
+    main()
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,92 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+# Times building the contact search index and typeahead lookups against it,
+# using generated contacts.
+#
+# Run from the project root:
+#   python benchmarks/searchindex.py [number of contacts]
+import os
+import sys
+import random
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pythoncontacts.settings')
+
+import django
+django.setup()
+
+from contacts.searchindex import ContactIndex
+
+given_names = [ 'Ann', 'Bob', 'Carla', 'Dmitri', 'Elena', 'Farid', 'Grace', 'Hiroshi', 'Ines', 'Jamal',
+                'Katya', 'Luis', 'Mei', 'Noor', 'Olu', 'Priya', 'Quinn', 'Rafael', 'Sofia', 'Tomasz' ]
+surnames = [ 'Anderson', 'Baptiste', 'Chen', 'Dubois', 'Eriksen', 'Fernandes', 'Garcia', 'Haddad', 'Ivanova',
+             'Jensen', 'Kowalski', 'Lindqvist', 'Moreau', 'Nakamura', 'Okafor', 'Patel', 'Rossi', 'Schmidt' ]
+domains = [ 'contoso.com', 'fabrikam.com', 'northwindtraders.com', 'adventure-works.com' ]
+
+def make_entries(count):
+    rng = random.Random(1)
+    entries = []
+    for index in range(count):
+        given_name = '{0}{1}'.format(rng.choice(given_names), rng.choice([ '', 'a', 'e', 'o' ]))
+        surname = '{0}{1}'.format(rng.choice(surnames), index % 997)
+        address = '{0}.{1}@{2}'.format(given_name.lower(), surname.lower(), rng.choice(domains))
+        entries.append(('AAMk{0:08d}'.format(index), given_name, surname,
+                        '+1 425 {0:03d} {1:04d}'.format(rng.randrange(1000), rng.randrange(10000)),
+                        [ { 'Address': address, 'Name': '{0} {1}'.format(given_name, surname) } ]))
+    return entries
+
+def time_queries(index, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            index.search(query)
+    return (time.perf_counter() - start) / (repeat * len(queries))
+
+def run(count):
+    entries = make_entries(count)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = ContactIndex(entries)
+    build_time = time.perf_counter() - start
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('{0} contacts, {1} distinct terms'.format(len(index), len(index.terms)))
+    print('Build: {0:.2f}s, {1:.1f} MB held'.format(build_time, held / 1e6))
+
+    # Typeahead queries as they'd arrive while typing, from one letter up
+    query_sets = [ ('one letter', [ 'a', 'k', 'm', 's' ]),
+                   ('name prefix', [ 'gra', 'nakam', 'lindq', 'soph' ]),
+                   ('two words', [ 'ann ch', 'elena mor', 'priya pat', 'quinn zz' ]),
+                   ('email', [ 'bob.ander', 'fabrikam', 'northwind' ]),
+                   ('phone', [ '425 55', '42512', '0100' ]),
+                   ('no match', [ 'xyzzy', 'qqq' ]) ]
+    print('{0:<14}{1:>16}'.format('query', 'mean (ms)'))
+    for name, queries in query_sets:
+        print('{0:<14}{1:>16.4f}'.format(name, time_queries(index, queries, 200) * 1000))
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -1,11 +1,14 @@
 #Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
 from django.contrib import admin
-from contacts.models import Office365Connection
+from contacts.models import Office365Connection, ContactImport, Job
 
 # Register your models here.
 # Register the Office365Connection model so super users
 # can use the admin site to view and delete connections
 admin.site.register(Office365Connection)
+# Register the ContactImport model so super users can check on imports
+admin.site.register(ContactImport)
+admin.site.register(Job)
 
 # MIT License: 
  
@@ -0,0 +1,138 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from collections import OrderedDict
+from django.db.models.signals import post_save, post_delete
+from contacts.models import Office365Connection
+import contacts.listcache
+import threading
+import time
+import logging
+
+# Used for debug logging
+logger = logging.getLogger('contacts')
+
+# The number of connections each process keeps, most recently used first
+max_cached_connections = 1000
+# How long a cached connection is used, in seconds. Saves and deletes made
+# in this process drop it straight away; the timeout bounds how long changes
+# made by another process (another web worker, runjobs) go unnoticed.
+#
+# The exception is contacts_synced. A process that marks the mirror for a
+# resync also bumps the user's contact list version in the shared cache (see
+# contacts.listcache), and a cached connection is only used while that
+# version is the one it was cached with. Otherwise a stale contacts_synced
+# would render the old mirror and cache the page under the new version.
+# Tokens don't need this: a token another process replaced is still valid
+# until it expires, and contacts.tokens reloads the saved token before
+# refreshing, including after a 401.
+cache_timeout = 60
+
+_connections = OrderedDict()
+_connections_lock = threading.Lock()
+# Counts invalidations, so a lookup that raced with a save doesn't cache
+# what it read before the save
+_generation = 0
+
+# Returns the signed-in user's Office365Connection. Each request gets its
+# own copy, so views can change and save it without affecting other requests.
+#   parameters:
+#     request: HttpRequest. A request from a signed-in user.
+#   raises:
+#     Office365Connection.DoesNotExist if the user hasn't connected an account.
+def get_connection(request):
+    connection_info = getattr(request, '_office365_connection', None)
+    if (connection_info is None):
+        connection_info = get_user_connection(request.user)
+        request._office365_connection = connection_info
+    return connection_info
+
+# Returns a user's Office365Connection from the cache, or from the database
+# if it isn't cached. Connections made before they were linked to a User are
+# found by username, and linked.
+#   parameters:
+#     user: User. The signed-in user.
+def get_user_connection(user):
+    username = user.get_username()
+
+    with _connections_lock:
+        entry = _connections.get(username)
+        if (not entry is None and entry[0] > time.time()):
+            _connections.move_to_end(username)
+        else:
+            entry = None
+        generation = _generation
+
+    if (not entry is None):
+        cached = copy_connection(entry[1])
+        if (contacts.listcache.get_version(cached) == entry[2]):
+            return cached
+
+    try:
+        connection_info = Office365Connection.objects.get(user = user)
+    except Office365Connection.DoesNotExist:
+        connection_info = Office365Connection.objects.get(username = username, user__isnull = True)
+        connection_info.user = user
+        connection_info.save(update_fields = [ 'user' ])
+        logger.debug('Linked connection %s to user %s', connection_info.pk, user.pk)
+
+    # Read after the row. A resync marked between the two reads is missed
+    # until the timeout, as any other change would be.
+    list_version = contacts.listcache.get_version(connection_info)
+    with _connections_lock:
+        if (generation == _generation):
+            _connections[username] = (time.time() + cache_timeout, copy_connection(connection_info), list_version)
+            _connections.move_to_end(username)
+            while (len(_connections) > max_cached_connections):
+                _connections.popitem(last = False)
+
+    return connection_info
+
+# Returns a new instance with the same field values, so requests never
+# share one
+def copy_connection(connection_info):
+    duplicate = Office365Connection(*[ getattr(connection_info, field.attname)
+                                       for field in Office365Connection._meta.concrete_fields ])
+    duplicate._state.adding = False
+    duplicate._state.db = connection_info._state.db
+    return duplicate
+
+# Drops a user's cached connection
+def invalidate(username):
+    global _generation
+    with _connections_lock:
+        _connections.pop(username, None)
+        _generation += 1
+
+# Drops every cached connection
+def clear():
+    global _generation
+    with _connections_lock:
+        _connections.clear()
+        _generation += 1
+
+def connection_changed(sender, instance, **kwargs):
+    invalidate(instance.username)
+
+post_save.connect(connection_changed, sender = Office365Connection, dispatch_uid = 'contacts.connections.saved')
+post_delete.connect(connection_changed, sender = Office365Connection, dispatch_uid = 'contacts.connections.deleted')
+
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
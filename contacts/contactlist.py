@@ -0,0 +1,183 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from django.db.models import Q
+from urllib.parse import urlencode
+import hashlib
+import contacts.o365service
+
+# Page sizes the index page accepts
+default_page_size = 50
+max_page_size = 200
+
+# The sort keys the index page accepts, mapped to the mirror's
+# field name and the Office 365 property name
+sort_fields = { 'given_name': ('given_name', 'GivenName'),
+                'last_name': ('surname', 'Surname'),
+                'mobile_phone': ('mobile_phone', 'MobilePhone1') }
+default_sort = 'given_name'
+
+# The properties the index page displays
+list_properties = 'GivenName,Surname,MobilePhone1,EmailAddresses,ChangeKey,DateTimeLastModified'
+
+# The page, page size, sort order and filter of one view of the contact list,
+# parsed from the index page's query string. Invalid values fall back to the
+# defaults rather than failing the page.
+class ContactListQuery:
+    def __init__(self, page = 1, page_size = default_page_size, sort = default_sort, search = ''):
+        self.page = page
+        self.page_size = page_size
+        self.sort = sort
+        self.search = search
+
+    # Reads the query from a request's GET parameters
+    #   parameters:
+    #     query_dict: QueryDict. request.GET
+    @classmethod
+    def from_query_dict(cls, query_dict):
+        page = parse_int(query_dict.get('page'), 1, 1, None)
+        page_size = parse_int(query_dict.get('page_size'), default_page_size, 1, max_page_size)
+
+        sort = query_dict.get('sort', default_sort)
+        if (not sort.lstrip('-') in sort_fields):
+            sort = default_sort
+
+        search = query_dict.get('q', '').strip()
+        return cls(page, page_size, sort, search)
+
+    def is_descending(self):
+        return self.sort.startswith('-')
+
+    def get_offset(self):
+        return (self.page - 1) * self.page_size
+
+    # Applies the filter, sort order and page to a MirroredContact queryset
+    def apply(self, queryset):
+        if (self.search != ''):
+            queryset = queryset.filter(Q(given_name__icontains = self.search) |
+                                       Q(surname__icontains = self.search) |
+                                       Q(mobile_phone__icontains = self.search) |
+                                       Q(email_search__icontains = self.search))
+
+        # Sort case-insensitively, like Office 365 does
+        field = sort_fields[self.sort.lstrip('-')][0]
+        prefix = '-' if self.is_descending() else ''
+        queryset = queryset.extra(select = { 'sort_key': 'LOWER({0})'.format(field) },
+                                  order_by = [ prefix + 'sort_key', prefix + 'id' ])
+
+        # Take one extra row to find out if there is a next page
+        offset = self.get_offset()
+        return queryset[offset:offset + self.page_size + 1]
+
+    # Builds the OData query string for the same view of the list,
+    # for when it's served directly from Office 365
+    def to_odata(self):
+        orderby = '{0} {1}'.format(sort_fields[self.sort.lstrip('-')][1],
+                                   'desc' if self.is_descending() else 'asc')
+
+        odata_filter = None
+        if (self.search != ''):
+            literal = contacts.o365service.odata_string(self.search)
+            odata_filter = 'startswith(GivenName,{0}) or startswith(Surname,{0})'.format(literal)
+
+        # Ask for one extra item to find out if there is a next page
+        return contacts.o365service.build_query_parameters(select = list_properties,
+                                                           top = self.page_size + 1,
+                                                           skip = self.get_offset(),
+                                                           orderby = orderby,
+                                                           filter = odata_filter)
+
+    # Returns the query string for this query with some values replaced,
+    # used to build the next, previous and sort links
+    def get_query_string(self, **changes):
+        values = { 'page': self.page, 'page_size': self.page_size, 'sort': self.sort, 'q': self.search }
+        values.update(changes)
+
+        if (values['page'] == 1):
+            del values['page']
+        if (values['page_size'] == default_page_size):
+            del values['page_size']
+        if (values['sort'] == default_sort):
+            del values['sort']
+        if (values['q'] == ''):
+            del values['q']
+
+        return '?{0}'.format(urlencode(sorted(values.items()))) if len(values) > 0 else '?'
+
+    # The link to sort by a column. Sorting by the current column again reverses it.
+    def get_sort_query_string(self, sort):
+        if (self.sort == sort):
+            sort = '-{0}'.format(sort)
+        return self.get_query_string(sort = sort, page = 1)
+
+# Builds the template context for one page of contacts
+#   parameters:
+#     query: ContactListQuery. The query the page was built from.
+#     page_items: list. The items returned for the page, including the extra look-ahead item.
+def get_page_context(query, page_items):
+    has_next = len(page_items) > query.page_size
+    context = { 'query': query,
+                'has_next': has_next,
+                'has_previous': query.page > 1,
+                'sort_given_name': query.get_sort_query_string('given_name'),
+                'sort_last_name': query.get_sort_query_string('last_name'),
+                'sort_mobile_phone': query.get_sort_query_string('mobile_phone') }
+
+    if (has_next):
+        context['next_page'] = query.get_query_string(page = query.page + 1)
+    if (query.page > 1):
+        context['previous_page'] = query.get_query_string(page = query.page - 1)
+
+    return context
+
+# Returns an ETag for one page of contacts, computed from the ChangeKeys of
+# the contacts on it. A contact that was changed locally has no ChangeKey
+# until the next sync, so its displayed fields are used instead.
+#   parameters:
+#     query: ContactListQuery. The query the page was built from.
+#     user_email: string. The account the contacts belong to.
+#     page_items: list. DisplayContacts for the page, including the look-ahead item.
+def get_page_etag(query, user_email, page_items):
+    page_hash = hashlib.md5()
+    page_hash.update('{0}\n{1}\n{2}\n'.format(user_email, query.get_query_string(), len(page_items)).encode('utf-8'))
+    
+    for contact in page_items[:query.page_size]:
+        if (contact.change_key):
+            fields = (contact.id, contact.change_key)
+        else:
+            fields = (contact.id, contact.given_name, contact.last_name, contact.mobile_phone) + contact.email_fields
+        page_hash.update('\n'.join(fields).encode('utf-8'))
+        page_hash.update(b'\0')
+        
+    return page_hash.hexdigest()
+
+def parse_int(value, default, minimum, maximum):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+
+    if (value < minimum):
+        return minimum
+    if (not maximum is None and value > maximum):
+        return maximum
+    return value
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,391 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from difflib import SequenceMatcher
+from contacts.models import DisplayContact
+from contacts.searchindex import get_words
+import contacts.o365service
+import contacts.listcache
+import contacts.sync
+import re
+import logging
+
+# Used for debug logging
+logger = logging.getLogger('contacts')
+
+# Pairs that score at least this much are treated as duplicates
+default_threshold = 0.8
+# Blocks with more contacts than this are skipped, so a very common key
+# (a shared switchboard number, a common name) can't make the scan quadratic
+max_block_size = 100
+# Phone numbers are compared on their last digits, so '+1 425 555 0100'
+# and '(425) 555-0100' match. Shorter numbers aren't used as keys.
+phone_key_digits = 9
+min_phone_digits = 7
+# Office 365 stores at most this many email addresses on a contact
+max_email_addresses = 3
+# Given names at least this similar are taken to be spellings of one name
+min_given_name_similarity = 0.75
+# The highest score for contacts with different given names, however much
+# else they share. Family members often share a home number or an address.
+different_given_name_score = 0.5
+
+# The fields of a contact that duplicate detection compares
+class Candidate:
+    __slots__ = ('name', 'words', 'given_name', 'emails', 'phone')
+
+    def __init__(self, display_contact):
+        given_words = get_words(display_contact.given_name)
+        self.words = given_words + get_words(display_contact.last_name)
+        self.name = ' '.join(sorted(self.words))
+        self.given_name = given_words[0] if len(given_words) > 0 else ''
+        self.emails = frozenset(entry[0].strip().lower() for entry in display_contact.get_email_addresses()
+                                if not entry is None and entry[0].strip() != '')
+        self.phone = get_phone_key(display_contact.mobile_phone)
+
+    # True if the contacts share an email address or phone number
+    def shares_details(self, other):
+        return (not self.emails.isdisjoint(other.emails)) or (self.phone != '' and self.phone == other.phone)
+
+    # True if both contacts have email addresses, or both have phone
+    # numbers, and none of them are the same
+    def conflicts_with(self, other):
+        return ((len(self.emails) > 0 and len(other.emails) > 0 and self.emails.isdisjoint(other.emails)) or
+                (self.phone != '' and other.phone != '' and self.phone != other.phone))
+
+    # True if the given names show these are different people: both have
+    # one, and it isn't a spelling, initial, short form or typo (swapped
+    # letters) of any word of the other's name. Other words are checked as
+    # well because given name and surname are sometimes swapped.
+    def given_name_differs(self, other):
+        if (self.given_name == '' or other.given_name == ''):
+            return False
+
+        for given_name, words in ((self.given_name, other.words), (other.given_name, self.words)):
+            for word in words:
+                if (word.startswith(given_name) or given_name.startswith(word) or
+                    sorted(word) == sorted(given_name) or
+                    SequenceMatcher(None, given_name, word, autojunk = False).ratio() >= min_given_name_similarity):
+                    return False
+        return True
+
+def get_phone_key(phone):
+    digits = re.sub(r'\D', '', phone)
+    if (len(digits) < min_phone_digits):
+        return ''
+    return digits[-phone_key_digits:]
+
+# Returns the keys a contact is grouped under. Only contacts that share at
+# least one key are compared, which keeps the number of comparisons close
+# to linear in the number of contacts.
+#   email: every address, so any shared address puts two contacts together
+#   phone: the last digits of the mobile number
+#   name: the words of the full name in sorted order, so swapped given name
+#         and surname still match
+#   surname: the start of the surname and the given name's initial, which
+#         catches typos and nicknames in the given name
+def get_blocking_keys(candidate, display_contact):
+    keys = [ 'email:' + email for email in candidate.emails ]
+    if (candidate.phone):
+        keys.append('phone:' + candidate.phone)
+    if (candidate.name):
+        keys.append('name:' + candidate.name)
+
+    surname = ''.join(get_words(display_contact.last_name))
+    given_name = ''.join(get_words(display_contact.given_name))
+    if (len(surname) >= 2):
+        keys.append('surname:{0}:{1}'.format(surname[:4], given_name[:1]))
+    return keys
+
+# Returns how similar two names are from 0 to 1, or None if either is
+# missing. If the cheap upper bounds show the similarity is below minimum,
+# 0 is returned without the full comparison.
+def get_name_similarity(name1, name2, minimum = 0.0):
+    if (name1 == '' or name2 == ''):
+        return None
+    if (name1 == name2):
+        return 1.0
+    if (minimum > 1.0):
+        return 0.0
+
+    matcher = SequenceMatcher(None, name1, name2, autojunk = False)
+    if (matcher.real_quick_ratio() < minimum or matcher.quick_ratio() < minimum):
+        return 0.0
+    return matcher.ratio()
+
+# Scores how likely two contacts are to be the same person, from 0 to 1.
+# A shared email address or phone number is strong evidence, and the names
+# decide how strong, unless the given names differ: then it is more likely
+# a family or a shared office line. A name match alone counts for less,
+# and for nothing when the contacts have different email addresses or
+# phone numbers.
+#   parameters:
+#     candidate1, candidate2: Candidate. The contacts to compare.
+#     threshold: float. Scores below this may be returned as 0, which lets
+#                most pairs skip the full name comparison.
+def score_pair(candidate1, candidate2, threshold = 0.0):
+    shared_email = not candidate1.emails.isdisjoint(candidate2.emails)
+    shared_phone = candidate1.phone != '' and candidate1.phone == candidate2.phone
+
+    if (shared_email or shared_phone):
+        base = 0.8 if (shared_email and shared_phone) else 0.7
+        name_similarity = get_name_similarity(candidate1.name, candidate2.name, (threshold - base) / 0.3)
+        score = min(base + 0.3 * (0.5 if name_similarity is None else name_similarity), 1.0)
+        if (candidate1.given_name_differs(candidate2)):
+            return min(score, different_given_name_score)
+        return score
+
+    if (candidate1.conflicts_with(candidate2)):
+        return 0.0
+    name_similarity = get_name_similarity(candidate1.name, candidate2.name, threshold / 0.9)
+    if (name_similarity is None):
+        return 0.0
+    return 0.9 * name_similarity
+
+# A set of contacts believed to be the same person, and the contact they
+# would be merged into
+#   contacts: list. The DisplayContacts in the group, the one to keep first.
+#   score: float. The highest pair score in the group.
+#   merged: DisplayContact. The kept contact with the others' details added.
+#   dropped_emails: list. Addresses that don't fit in the merged contact.
+class DuplicateGroup:
+    def __init__(self, display_contacts, score):
+        self.contacts = sorted(display_contacts, key = get_contact_rank, reverse = True)
+        self.score = score
+        self.merged, self.dropped_emails = merge_contacts(self.contacts)
+
+    def get_primary(self):
+        return self.contacts[0]
+
+    def get_duplicates(self):
+        return self.contacts[1:]
+
+# Contacts with more details filled in, then more recently changed ones,
+# are preferred as the one to keep
+def get_contact_rank(display_contact):
+    filled = sum(1 for field in (display_contact.given_name, display_contact.last_name, display_contact.mobile_phone) if field)
+    filled += sum(1 for field in display_contact.email_fields if field)
+    changed = display_contact.last_modified.timestamp() if display_contact.last_modified else 0
+    return (filled, changed)
+
+# Combines contacts into the first one. Empty fields are filled from the
+# others and email addresses are added until the contact is full.
+#   returns:
+#     A (DisplayContact, list of email addresses that didn't fit) tuple.
+def merge_contacts(display_contacts):
+    primary = display_contacts[0]
+    merged = DisplayContact(primary.given_name, primary.last_name, primary.mobile_phone, None,
+                            primary.id, primary.change_key, primary.last_modified)
+
+    seen = set()
+    emails = []
+    dropped_emails = []
+    for display_contact in display_contacts:
+        if (merged.given_name == '' and merged.last_name == ''):
+            merged.given_name = display_contact.given_name
+            merged.last_name = display_contact.last_name
+        if (merged.mobile_phone == ''):
+            merged.mobile_phone = display_contact.mobile_phone
+
+        for entry in display_contact.get_email_addresses():
+            if (entry is None or entry[0].strip() == ''):
+                continue
+            key = entry[0].strip().lower()
+            if (key in seen):
+                continue
+            seen.add(key)
+            if (len(emails) < max_email_addresses):
+                emails.append(entry)
+            else:
+                dropped_emails.append(entry[0])
+
+    for index, (address, name) in enumerate(emails):
+        merged.set_email_address(index, address, name)
+    return merged, dropped_emails
+
+# Loads every contact in a user's mirror, for find_duplicates
+def get_mirror_contacts(connection_info):
+    return [ mirrored_contact.to_display_contact()
+             for mirrored_contact in connection_info.mirrored_contacts.all().iterator() ]
+
+# Finds groups of contacts that are probably the same person
+#   parameters:
+#     display_contacts: list. DisplayContacts to check, usually the user's whole mirror.
+#     threshold: float. The lowest pair score treated as a duplicate.
+#   returns:
+#     A list of DuplicateGroup, highest scoring first.
+def find_duplicates(display_contacts, threshold = default_threshold):
+    logger.debug('Entering find_duplicates.')
+    logger.debug('  contacts: %s, threshold: %s', len(display_contacts), threshold)
+
+    candidates = [ Candidate(display_contact) for display_contact in display_contacts ]
+
+    blocks = {}
+    for index, candidate in enumerate(candidates):
+        for key in get_blocking_keys(candidate, display_contacts[index]):
+            blocks.setdefault(key, []).append(index)
+
+    # Each pair is scored once, even if it shares several keys
+    compared = set()
+    parents = list(range(len(candidates)))
+    matches = []
+    name_matches = []
+    for key, members in blocks.items():
+        if (len(members) < 2):
+            continue
+        if (len(members) > max_block_size):
+            logger.debug('Skipping block %s of %s contacts', key, len(members))
+            continue
+
+        for position, index1 in enumerate(members):
+            for index2 in members[position + 1:]:
+                pair = (index1, index2)
+                if (pair in compared):
+                    continue
+                compared.add(pair)
+
+                score = score_pair(candidates[index1], candidates[index2], threshold)
+                if (score < threshold):
+                    continue
+                if (candidates[index1].shares_details(candidates[index2])):
+                    union(parents, index1, index2)
+                    matches.append((index1, score))
+                else:
+                    name_matches.append((index1, index2, score))
+
+    # The email addresses and phone numbers of each group so far
+    group_details = {}
+    for index, candidate in enumerate(candidates):
+        group_details.setdefault(find(parents, index), GroupDetails()).add(candidate)
+
+    # A contact whose name matches contacts with details in more than one
+    # other group could belong to any of them, so its name matches are left
+    # out rather than joining those people together. Nor may a name match
+    # join two groups whose details conflict.
+    detailed_roots = {}
+    for index1, index2, score in name_matches:
+        for index, other in ((index1, index2), (index2, index1)):
+            other_root = find(parents, other)
+            if (other_root != find(parents, index) and group_details[other_root].has_details()):
+                detailed_roots.setdefault(index, set()).add(other_root)
+
+    name_matches.sort(key = lambda match: match[2], reverse = True)
+    for index1, index2, score in name_matches:
+        if (len(detailed_roots.get(index1, ())) > 1 or len(detailed_roots.get(index2, ())) > 1):
+            continue
+        root1 = find(parents, index1)
+        root2 = find(parents, index2)
+        if (root1 != root2):
+            if (group_details[root1].conflicts_with(group_details[root2])):
+                continue
+            union(parents, index1, index2)
+            group_details[root1].update(group_details.pop(root2))
+        matches.append((index1, score))
+
+    groups = {}
+    for index in range(len(candidates)):
+        groups.setdefault(find(parents, index), []).append(index)
+
+    scores = {}
+    for index, score in matches:
+        root = find(parents, index)
+        scores[root] = max(score, scores.get(root, 0.0))
+
+    duplicate_groups = [ DuplicateGroup([ display_contacts[index] for index in members ], scores[root])
+                         for root, members in groups.items() if len(members) > 1 ]
+    duplicate_groups.sort(key = lambda group: group.score, reverse = True)
+
+    logger.debug('Compared %s pairs, found %s groups', len(compared), len(duplicate_groups))
+    logger.debug('Leaving find_duplicates.')
+    return duplicate_groups
+
+# The email addresses and phone numbers of a group of contacts
+class GroupDetails:
+    def __init__(self):
+        self.emails = set()
+        self.phones = set()
+
+    def has_details(self):
+        return len(self.emails) > 0 or len(self.phones) > 0
+
+    def add(self, candidate):
+        self.emails.update(candidate.emails)
+        if (candidate.phone != ''):
+            self.phones.add(candidate.phone)
+
+    def update(self, other):
+        self.emails.update(other.emails)
+        self.phones.update(other.phones)
+
+    def conflicts_with(self, other):
+        return ((len(self.emails) > 0 and len(other.emails) > 0 and self.emails.isdisjoint(other.emails)) or
+                (len(self.phones) > 0 and len(other.phones) > 0 and self.phones.isdisjoint(other.phones)))
+
+# Union-find over contact indexes, with path halving
+def find(parents, index):
+    while (parents[index] != index):
+        parents[index] = parents[parents[index]]
+        index = parents[index]
+    return index
+
+def union(parents, index1, index2):
+    root1 = find(parents, index1)
+    root2 = find(parents, index2)
+    if (root1 != root2):
+        parents[root2] = root1
+
+# Merges one group in Office 365: the kept contact is updated with the
+# merged details (only if its ChangeKey still matches), then
+# the others are deleted. The mirror is updated to match.
+#   parameters:
+#     connection_info: Office365Connection. The user's connection.
+#     token: string. The access token.
+#     group: DuplicateGroup. The group to merge.
+#   returns:
+#     The number of contacts deleted.
+#   raises:
+#     MergeError if the kept contact couldn't be updated.
+def apply_merge(connection_info, token, group):
+    primary = group.get_primary()
+    update_payload = group.merged.get_update_json(primary)
+    if (not update_payload is None):
+        status = contacts.o365service.update_contact(connection_info.outlook_api_endpoint, token,
+                                                     primary.id, update_payload, primary.change_key)
+        # Per MSDN, success should be a 200 status
+        if (status != 200):
+            raise MergeError(status)
+        contacts.sync.mirror_contact_updated(connection_info, primary.id, group.merged)
+
+    duplicate_ids = [ display_contact.id for display_contact in group.get_duplicates() ]
+    results = contacts.o365service.delete_contacts(connection_info.outlook_api_endpoint, token, duplicate_ids)
+    # A 404 means the contact is already gone, which is just as good
+    deleted_ids = [ contact_id for contact_id, result in zip(duplicate_ids, results) if result.status_code in (204, 404) ]
+    contacts.sync.remove_contacts(connection_info, deleted_ids)
+    contacts.listcache.invalidate(connection_info)
+    return len(deleted_ids)
+
+# Raised when the contact a group is merged into can't be updated. A 412
+# status means it was changed after the duplicates were found.
+class MergeError(Exception):
+    def __init__(self, status_code):
+        self.status_code = status_code
+        super(MergeError, self).__init__('Unable to update the merged contact: {0} HTTP status returned.'.format(status_code))
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
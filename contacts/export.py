@@ -0,0 +1,180 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from contacts.models import DisplayContact
+import contacts.o365service
+import csv
+import logging
+
+# Used for debug logging
+logger = logging.getLogger('contacts')
+
+# The properties included in an export
+export_properties = '?$select=GivenName,Surname,MobilePhone1,EmailAddresses'
+# The number of contacts requested from Office 365 per page
+export_page_size = 100
+# Output is collected into chunks of about this many characters before it is
+# sent, so a large export isn't written one small line at a time
+chunk_size = 16384
+
+# The formats export_contacts accepts, mapped to (content type, file extension)
+export_formats = { 'csv': ('text/csv; charset=utf-8', 'csv'),
+                   'vcard3': ('text/vcard; charset=utf-8', 'vcf'),
+                   'vcard4': ('text/vcard; charset=utf-8', 'vcf') }
+
+# CSV columns, named the way Outlook's CSV import expects them
+csv_header = [ 'First Name', 'Last Name', 'Mobile Phone',
+               'E-mail Address', 'E-mail Display Name',
+               'E-mail 2 Address', 'E-mail 2 Display Name',
+               'E-mail 3 Address', 'E-mail 3 Display Name' ]
+
+# Lazily fetches every contact for a connection as DisplayContacts. Pages
+# are fetched as they are needed, so only one or two are in memory at once.
+#   parameters:
+#     connection_info: Office365Connection. The connection to export.
+#     token: string. The access token.
+def iter_display_contacts(connection_info, token):
+    for json_contact in contacts.o365service.iter_contacts(connection_info.outlook_api_endpoint,
+                                                           token,
+                                                           export_properties,
+                                                           page_size = export_page_size):
+        display_contact = DisplayContact()
+        display_contact.load_json(json_contact)
+        yield display_contact
+
+# Converts contacts to the requested format, one chunk at a time
+#   parameters:
+#     display_contacts: iterable. DisplayContacts, usually from iter_display_contacts.
+#     export_format: string. One of the keys of export_formats.
+#   returns:
+#     A generator of strings.
+def export_contacts(display_contacts, export_format):
+    if (export_format == 'csv'):
+        lines = iter_csv(display_contacts)
+    elif (export_format == 'vcard3'):
+        lines = iter_vcards(display_contacts, '3.0')
+    elif (export_format == 'vcard4'):
+        lines = iter_vcards(display_contacts, '4.0')
+    else:
+        raise ValueError('Unknown export format: {0}'.format(export_format))
+
+    return iter_chunks(lines)
+
+def iter_chunks(lines):
+    chunk = []
+    length = 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if (length >= chunk_size):
+            yield ''.join(chunk)
+            chunk = []
+            length = 0
+
+    if (len(chunk) > 0):
+        yield ''.join(chunk)
+
+# A file-like object whose write returns what it was given, so csv.writer
+# can format one row at a time without buffering the whole file
+class EchoBuffer:
+    def write(self, value):
+        return value
+
+def iter_csv(display_contacts):
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow(csv_header)
+
+    for display_contact in display_contacts:
+        yield writer.writerow([ display_contact.given_name,
+                                display_contact.last_name,
+                                display_contact.mobile_phone,
+                                display_contact.email1_address,
+                                display_contact.email1_name,
+                                display_contact.email2_address,
+                                display_contact.email2_name,
+                                display_contact.email3_address,
+                                display_contact.email3_name ])
+
+def iter_vcards(display_contacts, version):
+    for display_contact in display_contacts:
+        yield get_vcard(display_contact, version)
+
+# Returns one contact as a vCard (RFC 2426 for 3.0, RFC 6350 for 4.0)
+#   parameters:
+#     display_contact: DisplayContact. The contact.
+#     version: string. '3.0' or '4.0'.
+def get_vcard(display_contact, version):
+    full_name = ' '.join(name for name in (display_contact.given_name, display_contact.last_name) if name)
+    if (full_name == ''):
+        # FN is required
+        full_name = display_contact.email1_address
+
+    lines = [ 'BEGIN:VCARD',
+              'VERSION:{0}'.format(version),
+              'N:{0};{1};;;'.format(escape_vcard_value(display_contact.last_name),
+                                    escape_vcard_value(display_contact.given_name)),
+              'FN:{0}'.format(escape_vcard_value(full_name)) ]
+
+    if (display_contact.mobile_phone):
+        tel_type = 'CELL' if version == '3.0' else 'cell'
+        lines.append('TEL;TYPE={0}:{1}'.format(tel_type, escape_vcard_value(display_contact.mobile_phone)))
+
+    for entry in display_contact.get_email_addresses():
+        if (not entry is None and entry[0]):
+            if (version == '3.0'):
+                lines.append('EMAIL;TYPE=INTERNET:{0}'.format(escape_vcard_value(entry[0])))
+            else:
+                lines.append('EMAIL:{0}'.format(escape_vcard_value(entry[0])))
+
+    lines.append('END:VCARD')
+    return ''.join(fold_vcard_line(line) + '\r\n' for line in lines)
+
+def escape_vcard_value(value):
+    return (value.replace('\\', '\\\\')
+                 .replace(',', '\\,')
+                 .replace(';', '\\;')
+                 .replace('\r\n', '\\n')
+                 .replace('\n', '\\n'))
+
+# Lines longer than 75 octets are folded: split, with each continuation
+# line starting with a space. Splits never fall inside a UTF-8 character.
+def fold_vcard_line(line):
+    if (len(line.encode('utf-8')) <= 75):
+        return line
+
+    parts = []
+    current = ''
+    current_length = 0
+    limit = 75
+    for character in line:
+        character_length = len(character.encode('utf-8'))
+        if (current_length + character_length > limit):
+            parts.append(current)
+            current = ''
+            current_length = 0
+            # Continuation lines start with a space, which counts
+            limit = 74
+        current += character
+        current_length += character_length
+
+    parts.append(current)
+    return '\r\n '.join(parts)
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,411 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connection
+from django.utils import timezone
+from contacts.models import ContactImport, DisplayContact, import_stall_timeout
+import contacts.o365service
+import contacts.o365executor
+import contacts.listcache
+import contacts.sync
+import contacts.tokens
+import threading
+import csv
+import io
+import os
+import json
+import uuid
+import logging
+
+# Used for debug logging
+logger = logging.getLogger('contacts')
+
+# The number of contacts created between progress saves. An interrupted
+# import resumes at the start of the group it was working on.
+import_group_size = 200
+# The number of contacts per $batch request. The batches of a group are
+# sent concurrently, up to o365executor.per_user_limit at a time.
+import_batch_size = contacts.o365service.max_batch_size
+# At most this many row errors are kept on an import
+max_saved_errors = 1000
+
+# Where uploaded files are kept until their import finishes
+def get_import_dir():
+    return getattr(settings, 'CONTACTS_IMPORT_DIR', os.path.join(settings.BASE_DIR, 'imports'))
+
+# Raised for a row that can't be imported
+class ImportRowError(Exception):
+    pass
+
+# Column names accepted in a CSV header, after normalize_column_name, mapped
+# to DisplayContact attributes. Includes the names Outlook exports and the
+# names used by export.csv_header.
+csv_columns = { 'first name': 'given_name',
+                'given name': 'given_name',
+                'last name': 'last_name',
+                'surname': 'last_name',
+                'mobile phone': 'mobile_phone',
+                'mobile': 'mobile_phone',
+                'email': 'email1_address',
+                'email address': 'email1_address',
+                'email display name': 'email1_name',
+                'email name': 'email1_name',
+                'email 2': 'email2_address',
+                'email 2 address': 'email2_address',
+                'email 2 display name': 'email2_name',
+                'email 2 name': 'email2_name',
+                'email 3': 'email3_address',
+                'email 3 address': 'email3_address',
+                'email 3 display name': 'email3_name',
+                'email 3 name': 'email3_name' }
+
+def normalize_column_name(name):
+    return ' '.join(name.lower().replace('-', '').replace('_', ' ').split())
+
+# Returns 'csv' or 'vcard' based on a file name, or None
+def guess_format(file_name):
+    extension = os.path.splitext(file_name)[1].lower()
+    if (extension == '.csv'):
+        return 'csv'
+    if (extension in ('.vcf', '.vcard')):
+        return 'vcard'
+    return None
+
+# Reads contacts from a CSV file one row at a time. The first row must be
+# a header; unknown columns are ignored.
+#   parameters:
+#     text_file: file. The file, opened in text mode with newline = ''.
+#   returns:
+#     A generator of (row number, DisplayContact) tuples. Rows are numbered from 1,
+#     not counting the header.
+def iter_csv_contacts(text_file):
+    reader = csv.reader(text_file)
+    header = next(reader, None)
+    if (header is None):
+        return
+
+    fields = [ csv_columns.get(normalize_column_name(column)) for column in header ]
+    if (not any(fields)):
+        raise ImportRowError('The CSV header has no recognized columns: {0}'.format(', '.join(header)))
+
+    for row_number, row in enumerate(reader, start = 1):
+        display_contact = DisplayContact()
+        for field, value in zip(fields, row):
+            if (not field is None):
+                setattr(display_contact, field, value)
+        yield row_number, display_contact
+
+# Reads contacts from a vCard file (versions 3.0 and 4.0) one card at a time.
+# N, FN, TEL and EMAIL are read; other properties are ignored.
+#   returns:
+#     A generator of (card number, DisplayContact) tuples, numbered from 1.
+def iter_vcard_contacts(text_file):
+    card_number = 0
+    display_contact = None
+    full_name = ''
+    phone_numbers = []
+
+    for line in iter_unfolded_lines(text_file):
+        name, _, value = line.partition(':')
+        parameters = name.split(';')
+        property_name = parameters[0].split('.')[-1].upper()
+        parameters = [ parameter.upper() for parameter in parameters[1:] ]
+
+        if (property_name == 'BEGIN' and value.upper() == 'VCARD'):
+            display_contact = DisplayContact()
+            full_name = ''
+            phone_numbers = []
+        elif (display_contact is None):
+            continue
+        elif (property_name == 'END' and value.upper() == 'VCARD'):
+            if (display_contact.given_name == '' and display_contact.last_name == '' and full_name != ''):
+                display_contact.given_name = full_name
+            # Prefer a mobile number, otherwise the first one
+            phone_numbers.sort(key = lambda phone_number: not phone_number[0])
+            if (len(phone_numbers) > 0):
+                display_contact.mobile_phone = phone_numbers[0][1]
+            card_number += 1
+            yield card_number, display_contact
+            display_contact = None
+        elif (property_name == 'N'):
+            name_parts = split_vcard_value(value) + [ '', '' ]
+            display_contact.last_name = name_parts[0]
+            display_contact.given_name = name_parts[1]
+        elif (property_name == 'FN'):
+            full_name = unescape_vcard_value(value)
+        elif (property_name == 'TEL'):
+            is_mobile = any('CELL' in parameter for parameter in parameters)
+            phone_numbers.append((is_mobile, unescape_vcard_value(value).replace('tel:', '', 1)))
+        elif (property_name == 'EMAIL'):
+            index = len(display_contact.email_fields) // 2
+            display_contact.set_email_address(index, unescape_vcard_value(value), '')
+
+# Joins folded lines (continuation lines start with a space or tab)
+def iter_unfolded_lines(text_file):
+    current = None
+    for line in text_file:
+        line = line.rstrip('\r\n')
+        if (line[:1] in (' ', '\t') and not current is None):
+            current += line[1:]
+        else:
+            if (current):
+                yield current
+            current = line
+
+    if (current):
+        yield current
+
+# Splits a structured vCard value (like N) on unescaped semicolons
+def split_vcard_value(value):
+    parts = []
+    current = ''
+    escaped = False
+    for character in value:
+        if (escaped):
+            current += '\\' + character
+            escaped = False
+        elif (character == '\\'):
+            escaped = True
+        elif (character == ';'):
+            parts.append(unescape_vcard_value(current))
+            current = ''
+        else:
+            current += character
+
+    parts.append(unescape_vcard_value(current))
+    return parts
+
+def unescape_vcard_value(value):
+    result = []
+    escaped = False
+    for character in value:
+        if (escaped):
+            result.append('\n' if character in 'nN' else character)
+            escaped = False
+        elif (character == '\\'):
+            escaped = True
+        else:
+            result.append(character)
+    return ''.join(result)
+
+# Trims a contact's fields and checks that it can be created
+#   raises:
+#     ImportRowError if the contact has no name or email address, or an
+#     email address is invalid.
+def validate_contact(display_contact):
+    display_contact.given_name = display_contact.given_name.strip()
+    display_contact.last_name = display_contact.last_name.strip()
+    display_contact.mobile_phone = display_contact.mobile_phone.strip()
+    display_contact.email_fields = tuple(field.strip() for field in display_contact.email_fields)
+
+    if (display_contact.given_name == '' and display_contact.last_name == '' and
+        display_contact.email1_address == ''):
+        raise ImportRowError('No name or email address')
+
+    for entry in display_contact.get_email_addresses():
+        if (not entry is None and entry[0] != ''):
+            try:
+                validate_email(entry[0])
+            except ValidationError:
+                raise ImportRowError('Invalid email address: {0}'.format(entry[0]))
+
+# Returns a generator of (row number, DisplayContact) for an import's file
+def iter_file_contacts(text_file, file_format):
+    if (file_format == 'csv'):
+        return iter_csv_contacts(text_file)
+    if (file_format == 'vcard'):
+        return iter_vcard_contacts(text_file)
+    raise ValueError('Unknown import format: {0}'.format(file_format))
+
+# Creates an import of a file that is already on disk
+#   parameters:
+#     connection_info: Office365Connection. The connection to import into.
+#     file_path: string. The file to import.
+#     file_format: string. 'csv' or 'vcard'.
+#     status: string. 'running' for an import about to be run, or 'queued'
+#             for one that will be run as a job.
+def create_import(connection_info, file_path, file_format, status = 'running'):
+    return ContactImport.objects.create(connection = connection_info,
+                                        file_path = os.path.abspath(file_path),
+                                        file_format = file_format,
+                                        status = status)
+
+# Saves an uploaded file to the import folder and creates an import for it
+#   parameters:
+#     connection_info: Office365Connection. The connection to import into.
+#     uploaded_file: UploadedFile. From request.FILES.
+#     file_format: string. 'csv' or 'vcard'.
+#     status: string. As for create_import.
+def create_upload_import(connection_info, uploaded_file, file_format, status = 'running'):
+    import_dir = get_import_dir()
+    if (not os.path.isdir(import_dir)):
+        os.makedirs(import_dir)
+
+    file_path = os.path.join(import_dir, '{0}.{1}'.format(uuid.uuid4(), file_format))
+    with open(file_path, 'wb') as destination:
+        for chunk in uploaded_file.chunks():
+            destination.write(chunk)
+
+    return create_import(connection_info, file_path, file_format, status)
+
+# Marks an interrupted or failed import as running again. Returns False if
+# the import finished or is still running, so it isn't run twice at once.
+def claim_import(contact_import):
+    stalled_before = timezone.now() - import_stall_timeout
+    claimed = (ContactImport.objects.filter(pk = contact_import.pk)
+                                    .exclude(status = 'completed')
+                                    .exclude(status = 'running', updated__gt = stalled_before)
+                                    .update(status = 'running', updated = timezone.now()))
+    if (claimed == 1):
+        contact_import.status = 'running'
+    return claimed == 1
+
+# Runs (or resumes) an import. Contacts are read from the file as a stream,
+# validated, and created in groups of import_group_size. Each group is split
+# into $batch requests that are sent concurrently. Progress is saved after
+# each group.
+#   parameters:
+#     contact_import: ContactImport. The import to run.
+#     progress: callable. Optional. Called with the ContactImport after each group.
+def run_import(contact_import, progress = None):
+    logger.debug('Entering run_import.')
+    logger.debug('  import: %s, resuming after row %s', contact_import.pk, contact_import.rows_done)
+
+    connection_info = contact_import.connection
+    errors = contact_import.get_errors()
+
+    try:
+        with io.open(contact_import.file_path, 'r', encoding = 'utf-8-sig', newline = '') as text_file:
+            group = []
+            for row_number, display_contact in iter_file_contacts(text_file, contact_import.file_format):
+                if (row_number <= contact_import.rows_done):
+                    continue
+
+                group.append((row_number, display_contact))
+                if (len(group) >= import_group_size):
+                    import_group(contact_import, connection_info, group, errors)
+                    group = []
+                    if (not progress is None):
+                        progress(contact_import)
+
+            if (len(group) > 0):
+                import_group(contact_import, connection_info, group, errors)
+                if (not progress is None):
+                    progress(contact_import)
+    except Exception as e:
+        logger.debug('Import %s failed: %s', contact_import.pk, e)
+        contact_import.status = 'failed'
+        add_error(errors, contact_import.rows_done + 1, 'Import stopped: {0}'.format(e))
+        contact_import.errors = json.dumps(errors)
+        contact_import.save()
+        raise
+    finally:
+        # Whatever was created is in Office 365 now, so resync the mirror
+        contacts.sync.mirror_invalidate(connection_info)
+        contacts.listcache.invalidate(connection_info)
+
+    contact_import.status = 'completed'
+    contact_import.save()
+
+    # Uploaded files are removed once they've been imported
+    if (os.path.dirname(contact_import.file_path) == os.path.abspath(get_import_dir())):
+        os.remove(contact_import.file_path)
+
+    logger.debug('Leaving run_import.')
+    return contact_import
+
+# Validates and creates one group of contacts, then saves progress
+def import_group(contact_import, connection_info, group, errors):
+    valid = []
+    for row_number, display_contact in group:
+        try:
+            validate_contact(display_contact)
+        except ImportRowError as e:
+            add_error(errors, row_number, str(e))
+            contact_import.failed += 1
+        else:
+            valid.append((row_number, display_contact))
+
+    token = contacts.tokens.get_access_token(connection_info)
+    batches = [ valid[start:start + import_batch_size] for start in range(0, len(valid), import_batch_size) ]
+    arguments = [ (connection_info.outlook_api_endpoint, token,
+                   [ display_contact.get_json(False) for row_number, display_contact in batch ],
+                   import_batch_size)
+                  for batch in batches ]
+
+    bulk_result = contacts.o365executor.get_executor().run(contacts.o365service.create_contacts,
+                                                           arguments,
+                                                           user = connection_info.username,
+                                                           is_failure = lambda result: False)
+    logger.debug('Import %s group: %s', contact_import.pk, bulk_result.stats)
+
+    failures = dict(bulk_result.failures)
+    for index, batch in enumerate(batches):
+        batch_results = bulk_result.results[index]
+        if (batch_results is None):
+            # The call raised, so none of the batch is known to be created
+            batch_results = [ failures[index] ] * len(batch)
+
+        for (row_number, display_contact), result in zip(batch, batch_results):
+            # Per MSDN, success should be a 201 status
+            if (isinstance(result, contacts.o365service.BatchResult) and result.status_code == 201):
+                contact_import.created += 1
+            else:
+                add_error(errors, row_number, get_result_error(result))
+                contact_import.failed += 1
+
+    contact_import.rows_done = group[-1][0]
+    contact_import.errors = json.dumps(errors)
+    contact_import.save()
+
+def get_result_error(result):
+    if (not isinstance(result, contacts.o365service.BatchResult)):
+        return 'Request failed: {0}'.format(result)
+
+    message = ''
+    if (isinstance(result.body, dict)):
+        message = result.body.get('error', {}).get('message', '')
+    return '{0} HTTP status returned. {1}'.format(result.status_code, message).strip()
+
+def add_error(errors, row_number, message):
+    if (len(errors) < max_saved_errors):
+        errors.append({ 'row': row_number, 'error': message })
+
+# Runs an import on a background thread, so the upload view can return
+# straight away. Progress is read back from the ContactImport.
+def start_import_thread(contact_import):
+    def run():
+        try:
+            run_import(contact_import)
+        except Exception:
+            # The failure is recorded on the import
+            pass
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target = run, name = 'contact-import-{0}'.format(contact_import.pk))
+    thread.daemon = True
+    thread.start()
+    return thread
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
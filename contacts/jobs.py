@@ -0,0 +1,389 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+# A database-backed job queue for Office 365 work that doesn't need to
+# happen inside a request: syncs, imports, and, when CONTACTS_BACKGROUND_JOBS
+# is on, the creates, updates and deletes made from the contact forms. The
+# runjobs management command runs the jobs.
+#
+# A connection's jobs run one at a time, in the order they were queued. A
+# job that fails in a way that may pass (a 503, a network error) is retried
+# later, and the jobs queued after it wait.
+from django.conf import settings
+from django.db import connection
+from django.db.models import Min, F, Q
+from django.utils import timezone
+from contacts.models import Job, ContactImport, DisplayContact, import_stall_timeout
+import contacts.o365service
+import contacts.importer
+import contacts.listcache
+import contacts.sync
+import contacts.tokens
+import datetime
+import json
+import logging
+import requests
+
+# Used for debug logging. Jobs are logged by kind and id rather than as
+# objects: records may be formatted on another thread (see o365logging), and
+# a Job's str() reads its connection from the database.
+logger = logging.getLogger('contacts')
+
+# A job is started at most this many times before it fails
+max_attempts = 5
+# Seconds to wait before the first retry. Each retry after that waits twice
+# as long, up to max_retry_delay.
+retry_delay = 5
+max_retry_delay = 300
+# How long a worker holds a job. A worker that stops without finishing its
+# job stops renewing the lease, and once it expires another worker starts
+# the job again. Imports renew it as they make progress.
+lease_duration = datetime.timedelta(minutes = 5)
+# The number of jobs runjobs runs at once by default
+default_concurrency = 4
+
+update_conflict_message = 'The contact was changed in Office 365 after it was opened, so the update was not saved.'
+earlier_update_failed_message = 'An earlier change to the contact was not saved, so this one, made on top of it, was not saved either.'
+create_unknown_message = 'Office 365 may have created the contact before the request failed, so it was not sent again. Check the contact list before adding it again. ({0})'
+
+# Raised by a job that can't succeed however often it is tried, like an
+# update to a contact that was deleted. The job fails straight away.
+class PermanentJobError(Exception):
+    pass
+
+# Whether the contact views queue their creates, updates and deletes as
+# jobs instead of waiting for Office 365
+def is_enabled():
+    return getattr(settings, 'CONTACTS_BACKGROUND_JOBS', False)
+
+def get_concurrency():
+    return getattr(settings, 'CONTACTS_JOB_CONCURRENCY', default_concurrency)
+
+# Adds a job to the queue
+#   parameters:
+#     connection_info: Office365Connection. The connection the job works on.
+#     kind: string. One of the keys of job_handlers.
+#     payload: The job's arguments, passed to its handler. Must be JSON serializable.
+def enqueue(connection_info, kind, **payload):
+    if (not kind in job_handlers):
+        raise ValueError('Unknown job kind: {0}'.format(kind))
+
+    job = Job.objects.create(connection = connection_info, kind = kind, payload = json.dumps(payload))
+    logger.debug('Queued %s job %s for %s', kind, job.pk, connection_info.username)
+    return job
+
+# Queues a failed or interrupted import to run again from where it stopped
+#   returns:
+#     The Job, or None if the import is completed, queued or still running.
+def queue_import(contact_import):
+    now = timezone.now()
+    queued = (ContactImport.objects.filter(pk = contact_import.pk)
+                                   .exclude(status__in = ('completed', 'queued'))
+                                   .exclude(status = 'running', updated__gt = now - import_stall_timeout)
+                                   .update(status = 'queued', updated = now))
+    if (queued == 0):
+        return None
+
+    contact_import.status = 'queued'
+    return enqueue(contact_import.connection, 'import', import_id = contact_import.pk)
+
+# Returns the latest of a contact's update jobs that hasn't finished, or
+# None. Until it has run, the mirror shows its change rather than the
+# version in Office 365, and further updates are sent after it.
+def get_pending_update(connection_info, contact_id):
+    pending = connection_info.jobs.filter(kind = 'update', status__in = ('queued', 'running')).order_by('-pk')
+    for job in pending:
+        if (job.get_payload().get('contact_id') == contact_id):
+            return job
+    return None
+
+# Returns the number of a connection's jobs that haven't finished
+def get_pending_count(connection_info):
+    return connection_info.jobs.filter(status__in = ('queued', 'running')).count()
+
+# Takes the next job that is ready to run and marks it as running
+#   parameters:
+#     worker_name: string. Recorded on the job, to show who ran it.
+#   returns:
+#     The Job, or None if no job is ready.
+def claim_next_job(worker_name):
+    now = timezone.now()
+
+    # Only the earliest unfinished job of each connection can run. The
+    # connection's later jobs wait for it, even while it waits for a retry.
+    heads = list(Job.objects.filter(status__in = ('queued', 'running'))
+                            .values('connection')
+                            .annotate(head = Min('pk'))
+                            .values_list('head', flat = True))
+    candidates = (Job.objects.filter(pk__in = heads)
+                             .filter(Q(status = 'queued', run_after__lte = now) |
+                                     Q(status = 'running', lease_expires__lt = now))
+                             .order_by('run_after', 'pk'))
+
+    for job in candidates:
+        # Another worker may claim the same job first. Whoever changes it
+        # from the state it was read in has it.
+        claimed = (Job.objects.filter(pk = job.pk, status = job.status, lease_expires = job.lease_expires)
+                              .update(status = 'running',
+                                      attempts = F('attempts') + 1,
+                                      lease_expires = now + lease_duration,
+                                      worker = worker_name,
+                                      updated = now))
+        if (claimed == 1):
+            return Job.objects.select_related('connection').get(pk = job.pk)
+
+    return None
+
+# Extends the lease on a job that is still being worked on
+def renew_lease(job):
+    job.lease_expires = timezone.now() + lease_duration
+    Job.objects.filter(pk = job.pk).update(lease_expires = job.lease_expires, updated = timezone.now())
+
+# Runs a claimed job and records the outcome: completed, failed, or queued
+# again to be retried
+def run_job(job):
+    connection_info = job.connection
+    logger.debug('Running %s job %s for %s, attempt %s', job.kind, job.pk, connection_info.username, job.attempts)
+
+    try:
+        result = job_handlers[job.kind](job, connection_info, **job.get_payload())
+    except (PermanentJobError, contacts.tokens.TokenRefreshError) as e:
+        fail_job(job, e)
+    except contacts.o365service.ApiError as e:
+        if (e.status_code == 401):
+            # The token was rejected before its expiry time. Get a new
+            # one for the next attempt.
+            try:
+                contacts.tokens.refresh_access_token(connection_info)
+            except contacts.tokens.TokenRefreshError as refresh_error:
+                fail_job(job, refresh_error)
+                return job
+        if (400 <= e.status_code < 500 and not e.status_code in (401, 408, 429)):
+            fail_job(job, e)
+        else:
+            retry_job(job, e)
+    except Exception as e:
+        retry_job(job, e)
+    else:
+        job.status = 'completed'
+        job.result = json.dumps(result)
+        job.error = ''
+        job.lease_expires = None
+        job.save()
+        logger.debug('Completed %s job %s: %s', job.kind, job.pk, job.result)
+
+    return job
+
+def retry_job(job, error):
+    if (job.attempts >= max_attempts):
+        fail_job(job, error)
+        return
+
+    delay = min(retry_delay * 2 ** (job.attempts - 1), max_retry_delay)
+    job.status = 'queued'
+    job.run_after = timezone.now() + datetime.timedelta(seconds = delay)
+    job.error = str(error)
+    job.lease_expires = None
+    job.save()
+    logger.debug('Retrying %s job %s in %s seconds: %s', job.kind, job.pk, delay, str(error))
+
+def fail_job(job, error):
+    job.status = 'failed'
+    job.error = str(error)
+    job.lease_expires = None
+    job.save()
+    logger.info('%s job %s failed: %s', job.kind, job.pk, str(error))
+
+    # Views show a queued change as made. Resync the mirror so the page
+    # shows what Office 365 really has.
+    contacts.sync.mirror_invalidate(job.connection)
+    contacts.listcache.invalidate(job.connection)
+
+# Runs jobs until stopping is set. Each runjobs worker thread runs this.
+#   parameters:
+#     worker_name: string. Recorded on the jobs it runs.
+#     stopping: threading.Event. Set to stop once the current job is done.
+#     poll_interval: float. Seconds to wait when no job is ready.
+#     exit_when_idle: Boolean. Return as soon as no job is ready.
+#     report: function. Called with each job once it has run, if given.
+def work(worker_name, stopping, poll_interval = 1.0, exit_when_idle = False, report = None):
+    try:
+        while (not stopping.is_set()):
+            try:
+                job = claim_next_job(worker_name)
+            except Exception as e:
+                # The database may be busy (SQLite allows one writer); try again
+                logger.info('%s could not claim a job: %s', worker_name, str(e))
+                job = None
+
+            if (job is None):
+                if (exit_when_idle):
+                    break
+                stopping.wait(poll_interval)
+                continue
+
+            run_job(job)
+            if (not report is None):
+                report(job)
+    finally:
+        connection.close()
+
+# Syncs the mirror. Changes made by queued creates, updates and deletes
+# show up in it once they have run.
+def run_sync_job(job, connection_info):
+    return dict(contacts.sync.sync_contacts(connection_info)._asdict())
+
+def run_import_job(job, connection_info, import_id):
+    try:
+        contact_import = ContactImport.objects.get(pk = import_id)
+    except ContactImport.DoesNotExist:
+        raise PermanentJobError('No import with id: {0}'.format(import_id))
+
+    if (not contacts.importer.claim_import(contact_import)):
+        raise PermanentJobError('Import {0} is {1} and can\'t be resumed.'.format(import_id, contact_import.status))
+
+    # run_import records a failure on the import before raising it, and
+    # the retry resumes where it stopped
+    contacts.importer.run_import(contact_import, progress = lambda contact_import: renew_lease(job))
+    resync(connection_info)
+    return { 'rows_done': contact_import.rows_done,
+             'created': contact_import.created,
+             'failed': contact_import.failed }
+
+# A create is a POST, so sending it again after Office 365 may have acted
+# on it could add the contact twice. Only a failure that means the request
+# was turned away (a failed connect, a 401 or a 429) is retried.
+def run_create_job(job, connection_info, contact):
+    try:
+        result = contacts.o365service.create_contact(connection_info.outlook_api_endpoint,
+                                                     contacts.tokens.get_access_token(connection_info),
+                                                     contact)
+    except requests.exceptions.ConnectTimeout:
+        raise
+    except requests.exceptions.RequestException as e:
+        raise PermanentJobError(create_unknown_message.format(str(e)))
+        
+    if (result >= 500):
+        raise PermanentJobError(create_unknown_message.format('{0} HTTP status returned'.format(result)))
+    # Per MSDN, success should be a 201 status
+    check_status(result, 201, connection_info, 'Me/Contacts')
+    # The new contact's Id isn't known, so sync it into the mirror here
+    # rather than leave that to the next page view
+    resync(connection_info)
+    return { 'status_code': result }
+
+# Sends an update made while the form's version was current
+#   parameters:
+#     changes: string. The changed properties as JSON (see DisplayContact.get_update_json).
+#     change_key: string. The ChangeKey the form was filled in from.
+#     after_job: int. Optional. The id of the update job whose change the
+#                form showed (see get_pending_update). The update is sent
+#                with the ChangeKey that job left the contact with.
+def run_update_job(job, connection_info, contact_id, changes, change_key, after_job = None):
+    if (not after_job is None):
+        change_key = get_change_key_after(after_job)
+        
+    token = contacts.tokens.get_access_token(connection_info)
+    r = contacts.o365service.patch_contact(connection_info.outlook_api_endpoint,
+                                           token,
+                                           contact_id,
+                                           changes,
+                                           change_key)
+    if (r.status_code == 412):
+        # An earlier attempt may have been saved and only its response lost.
+        # The update changed the ChangeKey, so this attempt is rejected. If
+        # the contact has the changes, the update was made.
+        if (job.attempts > 1):
+            contact_json = get_contact_with_changes(connection_info, token, contact_id, changes)
+            if (not contact_json is None):
+                return { 'status_code': r.status_code, 'change_key': contact_json.get('ChangeKey'), 'already_saved': True }
+        raise PermanentJobError(update_conflict_message)
+    # Per MSDN, success should be a 200 status
+    check_status(r.status_code, 200, connection_info, 'Me/Contacts/{0}'.format(contact_id))
+    
+    try:
+        change_key = r.json().get('ChangeKey')
+    except ValueError:
+        change_key = None
+    return { 'status_code': r.status_code, 'change_key': change_key }
+
+# Returns the contact as Office 365 has it if it already has the changes an
+# update job would make, or None if it doesn't (or can't be fetched)
+def get_contact_with_changes(connection_info, token, contact_id, changes):
+    contact_json = contacts.o365service.get_contact_by_id(connection_info.outlook_api_endpoint, token,
+                                                          contact_id, contacts.sync.sync_properties)
+    if (contact_json is None):
+        return None
+        
+    current_contact = DisplayContact()
+    current_contact.load_json(contact_json)
+    changed_json = dict(contact_json)
+    changed_json.update(json.loads(changes))
+    changed_contact = DisplayContact()
+    changed_contact.load_json(changed_json)
+    
+    return contact_json if changed_contact.get_update_json(current_contact) is None else None
+
+# Returns the ChangeKey an earlier update job left its contact with. Jobs
+# run in order, so it has finished; if it failed, so does the update made
+# on top of it. An older result without a ChangeKey gives None, and the
+# update is sent without If-Match.
+def get_change_key_after(job_id):
+    earlier = Job.objects.filter(pk = job_id).first()
+    if (earlier is None or earlier.status != 'completed'):
+        raise PermanentJobError(earlier_update_failed_message)
+    return earlier.get_result().get('change_key')
+
+def run_delete_job(job, connection_info, contact_id):
+    result = contacts.o365service.delete_contact(connection_info.outlook_api_endpoint,
+                                                 contacts.tokens.get_access_token(connection_info),
+                                                 contact_id)
+    # Per MSDN, success should be a 204 status. A 404 means it's already gone.
+    if (result != 404):
+        check_status(result, 204, connection_info, 'Me/Contacts/{0}'.format(contact_id))
+    return { 'status_code': result }
+
+# Raises an ApiError, which run_job retries or fails depending on the
+# status, if a call didn't return the expected status
+def check_status(status_code, expected, connection_info, path):
+    if (status_code != expected):
+        raise contacts.o365service.ApiError(status_code, '{0}/{1}'.format(connection_info.outlook_api_endpoint, path))
+
+# Brings the mirror up to date after a job changed contacts. A failure
+# leaves the mirror to be synced by the next page view; the job's change
+# was made, so it must not be retried because of it.
+def resync(connection_info):
+    contacts.sync.mirror_invalidate(connection_info)
+    contacts.listcache.invalidate(connection_info)
+    try:
+        contacts.sync.sync_contacts(connection_info)
+    except Exception as e:
+        logger.debug('Sync after job failed, left for the next page view: %s', str(e))
+
+# The function that runs each kind of job. It is called with the job, its
+# connection, and the job's payload as keyword arguments, and returns what
+# the job did as a JSON serializable value.
+job_handlers = { 'sync': run_sync_job,
+                 'import': run_import_job,
+                 'create': run_create_job,
+                 'update': run_update_job,
+                 'delete': run_delete_job }
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,93 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from django.core.cache import cache
+from collections import namedtuple
+import hashlib
+import time
+import logging
+
+# Used for debug logging
+logger = logging.getLogger('contacts')
+
+# How long a rendered page of the contact list is kept, in seconds. Changes
+# made through this app invalidate it straight away. With the mirror on,
+# changes made in Outlook only reach a page once the mirror is synced, which
+# the index does first when the mirror is older than CONTACTS_MIRROR_MAX_AGE
+# (see contacts.sync.mirror_needs_sync); that sync drops the cached pages if
+# anything changed. Without the mirror, the timeout bounds how long changes
+# made in Outlook go unnoticed.
+cache_timeout = 300
+
+# A rendered page of the contact list, with the validators for
+# conditional requests
+#   etag: string. The page's ETag, unquoted.
+#   last_modified: int. When the page was rendered, as a Unix timestamp.
+#   content: string. The rendered HTML.
+CachedPage = namedtuple('CachedPage', [ 'etag', 'last_modified', 'content' ])
+
+# Every cached page for a user includes the user's current version number in
+# its key. Invalidating bumps the version, which orphans all of the user's
+# pages at once (sorts, filters and page numbers alike) without having to
+# know their keys. The orphans expire on their own.
+def get_version_key(connection_info):
+    return 'contacts:version:{0}'.format(connection_info.pk)
+
+def get_version(connection_info):
+    version_key = get_version_key(connection_info)
+    version = cache.get(version_key)
+    if (version is None):
+        # Start from the clock rather than 1, so a version that was evicted
+        # can never come back and match pages cached under its old value
+        cache.add(version_key, new_version(), None)
+        version = cache.get(version_key)
+    return version
+
+def new_version():
+    return int(time.time() * 1000)
+
+def get_page_key(connection_info, query):
+    query_hash = hashlib.md5(query.get_query_string().encode('utf-8')).hexdigest()
+    return 'contacts:list:{0}:{1}:{2}'.format(connection_info.pk, get_version(connection_info), query_hash)
+
+# Returns the CachedPage for a query, or None
+#   parameters:
+#     connection_info: Office365Connection. The user's connection.
+#     query: ContactListQuery. The page, sort order and filter.
+def get_contact_list(connection_info, query):
+    page = cache.get(get_page_key(connection_info, query))
+    logger.debug('Contact list cache %s for %s', 'miss' if page is None else 'hit', connection_info.username)
+    return page
+
+# Stores the CachedPage for a query
+def set_contact_list(connection_info, query, page):
+    cache.set(get_page_key(connection_info, query), page, cache_timeout)
+
+# Drops every cached page for a user. Called after any change to the
+# user's contacts.
+def invalidate(connection_info):
+    version_key = get_version_key(connection_info)
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        # No version yet, so nothing is cached under the old one
+        cache.set(version_key, new_version(), None)
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,90 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from contacts.models import Office365Connection, MirroredContact, ContactImport, Job
+from optparse import make_option
+
+# The models that belong to a connection. Their rows go with it.
+connection_models = (MirroredContact, ContactImport, Job)
+
+# Finds usernames with more than one Office365Connection and, with --apply,
+# keeps the newest connection of each and deletes the rest, along with their
+# mirrored contacts, imports and jobs. username is unique now, so run this
+# before migrating an existing database (see the README). It only reads
+# columns that earlier versions had, and skips tables they didn't have.
+#   usage:
+#     python manage.py dedupeconnections              (lists the duplicates)
+#     python manage.py dedupeconnections --apply
+class Command(BaseCommand):
+    help = 'Finds and optionally deletes extra Office 365 connections for the same username.'
+    option_list = BaseCommand.option_list + (
+        make_option('--apply',
+                    action = 'store_true',
+                    dest = 'apply',
+                    default = False,
+                    help = 'Delete all but the newest connection of each username. Without this they are only listed.'),
+    )
+    
+    def handle(self, *args, **options):
+        duplicated = (Office365Connection.objects.values('username')
+                                                 .annotate(count = Count('pk'))
+                                                 .filter(count__gt = 1)
+                                                 .values_list('username', flat = True))
+        
+        extra_ids = []
+        for username in duplicated:
+            ids = list(Office365Connection.objects.filter(username = username)
+                                                  .order_by('-pk')
+                                                  .values_list('pk', flat = True))
+            self.stdout.write('{0}: keep {1}, delete {2}'.format(username, ids[0], ', '.join(str(pk) for pk in ids[1:])))
+            extra_ids.extend(ids[1:])
+        
+        self.stdout.write('Found {0} extra connections.'.format(len(extra_ids)))
+        if (not options['apply'] or len(extra_ids) == 0):
+            return
+        
+        with transaction.atomic():
+            delete_connections(extra_ids)
+        self.stdout.write('Deleted {0} connections.'.format(len(extra_ids)))
+
+# Deletes connections and their rows with plain SQL. The ORM would select
+# every column of the models, including ones the database doesn't have
+# until it is migrated.
+def delete_connections(connection_ids):
+    tables = connection.introspection.table_names()
+    placeholders = ', '.join([ '%s' ] * len(connection_ids))
+    cursor = connection.cursor()
+    
+    for model in connection_models:
+        if (model._meta.db_table in tables):
+            cursor.execute('DELETE FROM {0} WHERE {1} IN ({2})'.format(connection.ops.quote_name(model._meta.db_table),
+                                                                       connection.ops.quote_name(model._meta.get_field('connection').column),
+                                                                       placeholders),
+                           connection_ids)
+    
+    cursor.execute('DELETE FROM {0} WHERE {1} IN ({2})'.format(connection.ops.quote_name(Office365Connection._meta.db_table),
+                                                               connection.ops.quote_name('id'),
+                                                               placeholders),
+                   connection_ids)
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,100 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from django.core.management.base import BaseCommand, CommandError
+from contacts.models import Office365Connection
+from optparse import make_option
+import contacts.o365service
+import contacts.dedupe
+import contacts.sync
+import contacts.tokens
+
+# Finds contacts that are probably the same person and, with --apply,
+# merges each group into one contact. The mirror is synced first, so the
+# scan sees the current contacts and their ChangeKeys.
+#   usage:
+#     python manage.py dedupecontacts alice                  (lists the groups)
+#     python manage.py dedupecontacts alice --apply
+#     python manage.py dedupecontacts alice --threshold 0.9
+class Command(BaseCommand):
+    args = '<username>'
+    help = 'Finds and optionally merges duplicate contacts in a user\'s Office 365 account.'
+    option_list = BaseCommand.option_list + (
+        make_option('--apply',
+                    action = 'store_true',
+                    dest = 'apply',
+                    default = False,
+                    help = 'Merge the groups that were found. Without this the groups are only listed.'),
+        make_option('--threshold',
+                    dest = 'threshold',
+                    default = contacts.dedupe.default_threshold,
+                    type = 'float',
+                    help = 'The lowest score (0 to 1) treated as a duplicate. Default {0}.'.format(contacts.dedupe.default_threshold)),
+    )
+    
+    def handle(self, *args, **options):
+        if (len(args) != 1):
+            raise CommandError('Usage: dedupecontacts {0}'.format(self.args))
+            
+        try:
+            connection_info = Office365Connection.objects.get(username = args[0])
+        except Office365Connection.DoesNotExist:
+            raise CommandError('No Office 365 connection for: {0}'.format(args[0]))
+            
+        try:
+            contacts.sync.sync_contacts(connection_info)
+        except (contacts.o365service.ApiError, contacts.tokens.TokenRefreshError) as e:
+            raise CommandError('Sync failed: {0}'.format(e))
+            
+        groups = contacts.dedupe.find_duplicates(contacts.dedupe.get_mirror_contacts(connection_info),
+                                                 options['threshold'])
+        self.stdout.write('Found {0} groups of duplicates.'.format(len(groups)))
+        
+        merged = 0
+        deleted = 0
+        for number, group in enumerate(groups, start = 1):
+            self.show_group(number, group)
+            if (not options['apply']):
+                continue
+                
+            if (len(group.dropped_emails) > 0):
+                self.stdout.write('  Skipped: merging would drop {0}'.format(', '.join(group.dropped_emails)))
+                continue
+                
+            try:
+                deleted += contacts.dedupe.apply_merge(connection_info,
+                                                       contacts.tokens.get_access_token(connection_info),
+                                                       group)
+                merged += 1
+            except contacts.dedupe.MergeError as e:
+                self.stdout.write('  Skipped: {0}'.format(e))
+                
+        if (options['apply']):
+            self.stdout.write('Merged {0} groups, deleting {1} duplicate contacts.'.format(merged, deleted))
+            
+    def show_group(self, number, group):
+        self.stdout.write('{0}. Score {1:.2f}'.format(number, group.score))
+        for index, display_contact in enumerate(group.contacts):
+            details = [ display_contact.given_name, display_contact.last_name, display_contact.mobile_phone ]
+            details.extend(entry[0] for entry in display_contact.get_email_addresses() if not entry is None)
+            self.stdout.write('  {0} {1}'.format('keep ' if index == 0 else 'merge',
+                                                 ' '.join(detail for detail in details if detail)))
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
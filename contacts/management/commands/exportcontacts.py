@@ -0,0 +1,83 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from django.core.management.base import BaseCommand, CommandError
+from contacts.models import Office365Connection
+from optparse import make_option
+import contacts.o365service
+import contacts.export
+import contacts.tokens
+import io
+import sys
+
+# Exports a user's contacts from Office 365 as CSV or vCard. Contacts are
+# written as they are paged in, so large address books don't need to fit
+# in memory.
+#   usage:
+#     python manage.py exportcontacts alice                           (CSV to stdout)
+#     python manage.py exportcontacts alice contacts.vcf --format vcard4
+class Command(BaseCommand):
+    args = '<username> [output file]'
+    help = 'Exports a user\'s Office 365 contacts as CSV or vCard.'
+    option_list = BaseCommand.option_list + (
+        make_option('--format',
+                    dest = 'export_format',
+                    default = 'csv',
+                    choices = sorted(contacts.export.export_formats.keys()),
+                    help = 'csv (default), vcard3 or vcard4'),
+    )
+    
+    def handle(self, *args, **options):
+        if (len(args) < 1 or len(args) > 2):
+            raise CommandError('Usage: exportcontacts {0}'.format(self.args))
+            
+        try:
+            connection_info = Office365Connection.objects.get(username = args[0])
+        except Office365Connection.DoesNotExist:
+            raise CommandError('No Office 365 connection for: {0}'.format(args[0]))
+            
+        if (len(args) == 2):
+            # newline = '' leaves the CSV and vCard line endings as they are
+            output = io.open(args[1], 'w', encoding = 'utf-8', newline = '')
+        else:
+            output = sys.stdout
+            
+        try:
+            display_contacts = contacts.export.iter_display_contacts(connection_info,
+                                                                     contacts.tokens.get_access_token(connection_info))
+            for chunk in contacts.export.export_contacts(self.count_contacts(display_contacts), options['export_format']):
+                output.write(chunk)
+        except (contacts.o365service.ApiError, contacts.tokens.TokenRefreshError) as e:
+            raise CommandError('Export failed: {0}'.format(e))
+        finally:
+            if (output is not sys.stdout):
+                output.close()
+                
+        if (len(args) == 2):
+            self.stdout.write('Exported {0} contacts to {1}'.format(self.exported, args[1]))
+            
+    # Passes contacts through, counting them
+    def count_contacts(self, display_contacts):
+        self.exported = 0
+        for display_contact in display_contacts:
+            self.exported += 1
+            yield display_contact
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
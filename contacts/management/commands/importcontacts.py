@@ -0,0 +1,97 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from django.core.management.base import BaseCommand, CommandError
+from contacts.models import Office365Connection, ContactImport
+from optparse import make_option
+import contacts.importer
+
+# Imports contacts from a CSV or vCard file into a user's Office 365 account.
+# Progress is saved as the import runs, so an interrupted import can be
+# picked up again with --resume.
+#   usage:
+#     python manage.py importcontacts alice contacts.csv
+#     python manage.py importcontacts alice contacts.txt --format vcard
+#     python manage.py importcontacts --resume 12
+class Command(BaseCommand):
+    args = '<username> <file>'
+    help = 'Imports contacts from a CSV or vCard file into a user\'s Office 365 account.'
+    option_list = BaseCommand.option_list + (
+        make_option('--format',
+                    dest = 'import_format',
+                    default = None,
+                    choices = [ 'csv', 'vcard' ],
+                    help = 'csv or vcard. By default this is taken from the file extension.'),
+        make_option('--resume',
+                    dest = 'resume',
+                    default = None,
+                    type = 'int',
+                    help = 'The id of a failed or interrupted import to continue.'),
+    )
+    
+    def handle(self, *args, **options):
+        if (not options['resume'] is None):
+            contact_import = self.get_resumable_import(options['resume'])
+        else:
+            contact_import = self.create_import(args, options['import_format'])
+            
+        try:
+            contacts.importer.run_import(contact_import, progress = self.show_progress)
+        except Exception as e:
+            raise CommandError('Import {0} stopped after row {1}: {2}. Run again with --resume {0} to continue.'.format(
+                contact_import.pk, contact_import.rows_done, e))
+            
+        self.stdout.write('Import {0} completed: {1} contacts created, {2} failed.'.format(contact_import.pk,
+                                                                                            contact_import.created,
+                                                                                            contact_import.failed))
+        for error in contact_import.get_errors():
+            self.stdout.write('  Row {0}: {1}'.format(error['row'], error['error']))
+            
+    def create_import(self, args, import_format):
+        if (len(args) != 2):
+            raise CommandError('Usage: importcontacts {0}'.format(self.args))
+            
+        try:
+            connection_info = Office365Connection.objects.get(username = args[0])
+        except Office365Connection.DoesNotExist:
+            raise CommandError('No Office 365 connection for: {0}'.format(args[0]))
+            
+        import_format = import_format or contacts.importer.guess_format(args[1])
+        if (import_format is None):
+            raise CommandError('Unable to tell the format of {0}. Use --format.'.format(args[1]))
+            
+        return contacts.importer.create_import(connection_info, args[1], import_format)
+        
+    def get_resumable_import(self, import_id):
+        try:
+            contact_import = ContactImport.objects.get(pk = import_id)
+        except ContactImport.DoesNotExist:
+            raise CommandError('No import with id: {0}'.format(import_id))
+            
+        if (not contacts.importer.claim_import(contact_import)):
+            raise CommandError('Import {0} is {1} and can\'t be resumed.'.format(import_id, contact_import.status))
+        return contact_import
+        
+    def show_progress(self, contact_import):
+        self.stdout.write('Row {0}: {1} created, {2} failed'.format(contact_import.rows_done,
+                                                                   contact_import.created,
+                                                                   contact_import.failed))
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,93 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+import contacts.jobs
+import os
+import socket
+import threading
+
+# Runs the jobs in contacts.jobs: syncs, imports, and the creates, updates
+# and deletes queued by the views when CONTACTS_BACKGROUND_JOBS is on.
+#   usage:
+#     python manage.py runjobs                 (runs jobs until stopped)
+#     python manage.py runjobs --concurrency 8 (runs up to 8 jobs at once)
+#     python manage.py runjobs --once          (runs the jobs that are ready, then exits)
+# More than one runjobs process can run against the same database.
+class Command(BaseCommand):
+    help = 'Runs queued Office 365 jobs (syncs, imports, and creates, updates and deletes) until stopped.'
+    option_list = BaseCommand.option_list + (
+        make_option('--concurrency',
+                    dest = 'concurrency',
+                    default = None,
+                    type = 'int',
+                    help = 'The number of jobs to run at once. Defaults to CONTACTS_JOB_CONCURRENCY.'),
+        make_option('--once',
+                    dest = 'once',
+                    action = 'store_true',
+                    default = False,
+                    help = 'Run the jobs that are ready, then exit.'),
+        make_option('--poll-interval',
+                    dest = 'poll_interval',
+                    default = 1.0,
+                    type = 'float',
+                    help = 'Seconds to wait before checking again when no job is ready.'),
+    )
+    
+    def handle(self, *args, **options):
+        concurrency = options['concurrency'] or contacts.jobs.get_concurrency()
+        if (concurrency < 1):
+            raise CommandError('--concurrency must be at least 1.')
+            
+        worker_name = '{0}:{1}'.format(socket.gethostname(), os.getpid())
+        stopping = threading.Event()
+        threads = [ threading.Thread(target = contacts.jobs.work,
+                                     name = 'runjobs-{0}'.format(index),
+                                     args = ('{0}:{1}'.format(worker_name, index), stopping,
+                                             options['poll_interval'], options['once'], self.show_job))
+                    for index in range(concurrency) ]
+        for thread in threads:
+            thread.start()
+            
+        if (not options['once']):
+            self.stdout.write('Running jobs, {0} at a time. Press CTRL-C to stop.'.format(concurrency))
+        try:
+            # Join with a timeout, so CTRL-C is handled while waiting
+            while (any(thread.is_alive() for thread in threads)):
+                for thread in threads:
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping once the jobs in progress finish.')
+            stopping.set()
+            for thread in threads:
+                thread.join()
+                
+    def show_job(self, job):
+        if (job.status == 'queued'):
+            self.stdout.write('{0} {1} job {2}: attempt {3} failed, retrying at {4}: {5}'.format(
+                job.connection, job.kind, job.pk, job.attempts, job.run_after, job.error))
+        elif (job.status == 'failed'):
+            self.stderr.write('{0} {1} job {2}: failed: {3}'.format(job.connection, job.kind, job.pk, job.error))
+        else:
+            self.stdout.write('{0} {1} job {2}: completed'.format(job.connection, job.kind, job.pk))
+    
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
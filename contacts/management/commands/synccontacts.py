@@ -0,0 +1,80 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from django.core.management.base import BaseCommand, CommandError
+from contacts.models import Office365Connection
+from optparse import make_option
+import contacts.o365service
+import contacts.jobs
+import contacts.sync
+import contacts.tokens
+
+# Syncs the local contact mirror with Office 365.
+#   usage:
+#     python manage.py synccontacts            (syncs every connection)
+#     python manage.py synccontacts alice bob  (syncs the listed users only)
+#     python manage.py synccontacts --queue    (queues the syncs for runjobs)
+class Command(BaseCommand):
+    args = '[username ...]'
+    help = 'Syncs the local contact mirror with Office 365 for one or all connections.'
+    option_list = BaseCommand.option_list + (
+        make_option('--queue',
+                    dest = 'queue',
+                    action = 'store_true',
+                    default = False,
+                    help = 'Queue a sync job for each connection instead of syncing now.'),
+    )
+    
+    def handle(self, *args, **options):
+        connections = Office365Connection.objects.all()
+        if (len(args) > 0):
+            connections = connections.filter(username__in = args)
+            missing = set(args) - set(connection.username for connection in connections)
+            if (len(missing) > 0):
+                raise CommandError('No Office 365 connection for: {0}'.format(', '.join(sorted(missing))))
+                
+        for connection_info in connections:
+            if (options['queue']):
+                job = contacts.jobs.enqueue(connection_info, 'sync')
+                self.stdout.write('{0}: queued sync job {1}'.format(connection_info.username, job.pk))
+                continue
+                
+            try:
+                result = self.sync_connection(connection_info)
+            except (contacts.o365service.ApiError, contacts.tokens.TokenRefreshError) as e:
+                self.stderr.write('{0}: sync failed, {1}'.format(connection_info.username, e))
+            else:
+                self.stdout.write('{0}: {1} added, {2} changed, {3} removed'.format(connection_info.username,
+                                                                                   result.added,
+                                                                                   result.changed,
+                                                                                   result.removed))
+                                                                                   
+    # Syncs one connection, refreshing the access token once if it is rejected
+    def sync_connection(self, connection_info):
+        try:
+            return contacts.sync.sync_contacts(connection_info)
+        except contacts.o365service.ApiError as e:
+            if (e.status_code != 401):
+                raise
+                
+        contacts.tokens.refresh_access_token(connection_info)
+        return contacts.sync.sync_contacts(connection_info)
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,65 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from django.conf import settings
+import contacts.o365metrics
+import contacts.o365throttle
+
+# Measures each request and the Office 365 calls made while handling it.
+# The totals are added to contacts.o365metrics.call_stats under the view's
+# URL name, and, if CONTACTS_SERVER_TIMING is on, sent to the browser in a
+# Server-Timing header, which browser developer tools show next to the
+# request's own timing. Place it first in MIDDLEWARE_CLASSES so the time
+# spent in the other middleware is included.
+class ServerTimingMiddleware(object):
+    def process_request(self, request):
+        request.o365_metrics = contacts.o365metrics.RequestMetrics()
+        contacts.o365metrics.set_collector(request.o365_metrics)
+
+    def process_response(self, request, response):
+        request_metrics = getattr(request, 'o365_metrics', None)
+        if (request_metrics is None):
+            return response
+
+        contacts.o365metrics.set_collector(None)
+        request_metrics.finish()
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        view_name = resolver_match.url_name if resolver_match and resolver_match.url_name else 'other'
+        contacts.o365metrics.call_stats.add_request(view_name, request_metrics, response.status_code)
+
+        if (getattr(settings, 'CONTACTS_SERVER_TIMING', settings.DEBUG)):
+            response['Server-Timing'] = request_metrics.get_server_timing()
+        return response
+
+# Makes the Office 365 calls made while handling a request use
+# contacts.o365throttle.interactive_retry_policy, so a long Retry-After is
+# shown to the user as an error rather than keeping the request waiting.
+# Work that continues after the response, such as a streamed export, uses
+# the normal policy.
+class InteractiveRetryMiddleware(object):
+    def process_request(self, request):
+        contacts.o365throttle.set_interactive(True)
+
+    def process_response(self, request, response):
+        contacts.o365throttle.set_interactive(False)
+        return response
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
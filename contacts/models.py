@@ -1,62 +1,333 @@
 # Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from django.conf import settings
 from django.db import models
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+from json.encoder import encode_basestring_ascii as encode_json_string
+import datetime
+import json
 
 # Create your models here.
 # Represents a connection between a local account and an Office 365 account
 class Office365Connection(models.Model):
     # The local username (the one used to sign into the website)
-    username = models.CharField(max_length = 30)
+    username = models.CharField(max_length = 30, unique = True)
+    # The local user. Connections made before this field was added are
+    # linked the next time their user signs in (see contacts.connections).
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, null = True, blank = True,
+                                related_name = 'office365_connection')
     # The user's Office 365 account email address
     user_email = models.CharField(max_length = 254) #for RFC compliance
     # The access token from Azure
     access_token = models.TextField()
+    # When the access token expires. None if unknown.
+    access_token_expires = models.DateTimeField(null = True, blank = True)
+    # Set while a worker is refreshing the access token, so other workers
+    # wait for its result instead of refreshing it again
+    token_refresh_lease = models.DateTimeField(null = True, blank = True)
     # The refresh token from Azure
     refresh_token = models.TextField()
     # The resource ID for Outlook services (usually https://outlook.office365.com/)
     outlook_resource_id = models.URLField()
     # The API endpoint for Outlook services (usually https://outlook.office365.com/api/v1.0)
     outlook_api_endpoint = models.URLField()
+    # When the local contact mirror was last synced with Office 365.
+    # None means the mirror has never been synced or needs a resync.
+    contacts_synced = models.DateTimeField(null = True, blank = True)
     
     def __str__(self):
         return self.username
 
-# Represents a contact item        
+# A local copy of a contact in a user's Office 365 default contacts folder.
+# Kept current by contacts.sync, so pages can render without calling Office 365.
+class MirroredContact(models.Model):
+    # The connection the contact belongs to
+    connection = models.ForeignKey(Office365Connection, related_name = 'mirrored_contacts')
+    # The contact's Id in Office 365
+    contact_id = models.CharField(max_length = 255)
+    # The contact's ChangeKey in Office 365. Changes every time the contact is modified.
+    change_key = models.CharField(max_length = 255, blank = True)
+    given_name = models.CharField(max_length = 255, blank = True)
+    surname = models.CharField(max_length = 255, blank = True)
+    mobile_phone = models.CharField(max_length = 255, blank = True)
+    # The EmailAddresses array from Office 365, stored as JSON
+    email_addresses = models.TextField(default = '[]')
+    # The addresses and names from EmailAddresses, one per line, so the
+    # contact list search matches them and not the JSON around them
+    email_search = models.TextField(blank = True, default = '')
+    # DateTimeLastModified from Office 365
+    last_modified = models.DateTimeField(null = True, blank = True)
+    
+    class Meta:
+        unique_together = ('connection', 'contact_id')
+        
+    def __str__(self):
+        return '{0} {1}'.format(self.given_name, self.surname)
+    
+    # Copies fields from the JSON representation of a contact
+    # returned by Office 365
+    #   parameters:
+    #     json_contact: dict. The JSON dictionary object returned from Office 365.
+    def load_json(self, json_contact):
+        self.contact_id = json_contact['Id']
+        self.change_key = json_contact.get('ChangeKey') or ''
+        self.given_name = json_contact.get('GivenName') or ''
+        self.surname = json_contact.get('Surname') or ''
+        self.mobile_phone = json_contact.get('MobilePhone1') or ''
+        email_addresses = json_contact.get('EmailAddresses') or []
+        self.email_addresses = json.dumps(email_addresses)
+        self.email_search = self.get_email_search_text(email_addresses)
+        self.last_modified = parse_datetime(json_contact.get('DateTimeLastModified') or '')
+        
+    # Returns the value of email_search for an EmailAddresses array
+    @staticmethod
+    def get_email_search_text(email_addresses):
+        values = []
+        for entry in email_addresses:
+            if (not entry is None):
+                values.extend(value for value in (entry.get('Address'), entry.get('Name')) if value)
+        return '\n'.join(values)
+        
+    # Returns the contact in the same JSON form Office 365 uses,
+    # so it can be loaded into a DisplayContact
+    def get_json(self):
+        email_addresses = json.loads(self.email_addresses)
+        return { 'Id': self.contact_id,
+                 'ChangeKey': self.change_key,
+                 'GivenName': self.given_name,
+                 'Surname': self.surname,
+                 'MobilePhone1': self.mobile_phone,
+                 'EmailAddresses': email_addresses,
+                 'DateTimeLastModified': self.last_modified.isoformat() if self.last_modified else None }
+                 
+    def to_display_contact(self):
+        display_contact = DisplayContact(self.given_name, self.surname, self.mobile_phone, None,
+                                         self.contact_id, self.change_key, self.last_modified)
+        display_contact.email_fields = DisplayContact.parse_email_fields(json.loads(self.email_addresses))
+        return display_contact
+
+# An import that is 'running' but hasn't saved progress for this long is
+# assumed to have been interrupted
+import_stall_timeout = datetime.timedelta(minutes = 2)
+
+# A bulk import of contacts from a CSV or vCard file. Progress is saved after
+# each group of contacts is created, so an interrupted import can be resumed
+# from where it stopped.
+class ContactImport(models.Model):
+    # The connection the contacts are imported into
+    connection = models.ForeignKey(Office365Connection, related_name = 'contact_imports')
+    # The file being imported, kept until the import finishes
+    file_path = models.CharField(max_length = 1024)
+    # 'csv' or 'vcard'
+    file_format = models.CharField(max_length = 10)
+    # 'running', 'completed' or 'failed', or 'queued' while waiting for a
+    # runjobs worker
+    status = models.CharField(max_length = 10, default = 'running')
+    # The number of rows (CSV records or vCards) read and handled so far.
+    # A resumed import skips this many rows.
+    rows_done = models.IntegerField(default = 0)
+    # The number of contacts created in Office 365
+    created = models.IntegerField(default = 0)
+    # The number of rows that failed validation or creation
+    failed = models.IntegerField(default = 0)
+    # Per-row errors as JSON: [ { "row": 12, "error": "..." }, ... ]
+    errors = models.TextField(default = '[]')
+    started = models.DateTimeField(auto_now_add = True)
+    updated = models.DateTimeField(auto_now = True)
+    
+    def __str__(self):
+        return '{0} import {1} ({2})'.format(self.connection, self.pk, self.status)
+        
+    def get_errors(self):
+        return json.loads(self.errors)
+        
+    def is_running(self):
+        return self.status == 'running' and self.updated > timezone.now() - import_stall_timeout
+        
+    # A failed import can be resumed, and so can one that stopped saving
+    # progress without finishing (the process running it was stopped)
+    def can_resume(self):
+        return not self.status in ('completed', 'queued') and not self.is_running()
+
+# A piece of Office 365 work for the runjobs command to do in the background:
+# a sync, an import, or a create, update or delete made from a form. A
+# connection's jobs run one at a time, in the order they were queued.
+class Job(models.Model):
+    # The connection the job works on
+    connection = models.ForeignKey(Office365Connection, related_name = 'jobs')
+    # 'sync', 'import', 'create', 'update' or 'delete'
+    kind = models.CharField(max_length = 10)
+    # The job's arguments as JSON
+    payload = models.TextField(default = '{}')
+    # 'queued', 'running', 'completed' or 'failed'. A job waiting to be
+    # retried is 'queued' again.
+    status = models.CharField(max_length = 10, default = 'queued')
+    # The number of times a worker has started the job
+    attempts = models.IntegerField(default = 0)
+    # The job isn't started before this time. Set ahead for a retry.
+    run_after = models.DateTimeField(default = timezone.now)
+    # While a job is running, the worker holding it renews this. A running
+    # job whose lease has expired was abandoned (its worker was stopped)
+    # and is started again.
+    lease_expires = models.DateTimeField(null = True, blank = True)
+    # The worker running or last to run the job
+    worker = models.CharField(max_length = 100, blank = True)
+    # What the job did, as JSON, once it has completed
+    result = models.TextField(blank = True)
+    # Why the last attempt failed
+    error = models.TextField(blank = True)
+    created = models.DateTimeField(auto_now_add = True)
+    updated = models.DateTimeField(auto_now = True)
+
+    class Meta:
+        index_together = ('connection', 'status')
+
+    def __str__(self):
+        return '{0} {1} job {2} ({3})'.format(self.connection, self.kind, self.pk, self.status)
+
+    def get_payload(self):
+        return json.loads(self.payload)
+
+    def get_result(self):
+        return json.loads(self.result) if self.result else None
+
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    # Returns the job as a dictionary that can be serialized as JSON
+    def to_dict(self):
+        return { 'id': self.pk,
+                 'kind': self.kind,
+                 'status': self.status,
+                 'attempts': self.attempts,
+                 'result': self.get_result(),
+                 'error': self.error,
+                 'created': self.created.isoformat(),
+                 'updated': self.updated.isoformat() }
+
+# Builds a property for one field of one of the first few email addresses,
+# so forms and templates can keep using email1_address, email2_name, etc.
+#   parameters:
+#     index: int. The position in the email address list.
+#     field: int. 0 for the address, 1 for the display name.
+def email_property(index, field):
+    position = index * 2 + field
+    
+    def get_field(self):
+        if (position < len(self.email_fields)):
+            return self.email_fields[position]
+        return ''
+        
+    def set_field(self, value):
+        entry = [ email_property(index, 0).fget(self), email_property(index, 1).fget(self) ]
+        entry[field] = value
+        self.set_email_address(index, entry[0], entry[1])
+        
+    return property(get_field, set_field)
+
+# Represents a contact item. Uses __slots__ because lists of contacts are
+# built for every page view and sync, and slotted instances are smaller and
+# faster to create than ones with a __dict__.
 class DisplayContact:
-    given_name = ''
-    last_name = ''
-    mobile_phone = ''
-    email1_address = ''
-    email1_name = ''
-    email2_address = ''
-    email2_name = ''
-    email3_address = ''
-    email3_name = ''
-    id = ''
+    __slots__ = ('id', 'change_key', 'last_modified', 'given_name', 'last_name',
+                 'mobile_phone', 'email_fields')
+                 
+    # The start of each entry in the EmailAddresses array of a payload
+    email_address_prefix = '{"@odata.type":"#Microsoft.OutlookServices.EmailAddress","Address":'
+    
+    #   parameters:
+    #     email_addresses: list. (address, name) tuples. None marks an empty
+    #                      entry, which keeps the positions of the ones after it.
+    def __init__(self, given_name = '', last_name = '', mobile_phone = '', email_addresses = None,
+                 id = '', change_key = '', last_modified = None):
+        self.id = id
+        # Used to make conditional requests for the contact
+        self.change_key = change_key
+        self.last_modified = last_modified
+        self.given_name = given_name
+        self.last_name = last_name
+        self.mobile_phone = mobile_phone
+        # The address and name of each email address, flattened into one
+        # tuple: (address1, name1, address2, name2, ...). An entry whose
+        # address and name are both empty is an empty slot.
+        self.email_fields = ()
+        if (email_addresses):
+            for index, entry in enumerate(email_addresses):
+                if (not entry is None):
+                    self.set_email_address(index, entry[0], entry[1])
+        
+    # Returns the (address, name) tuple at index, or None for an empty slot
+    def get_email_address(self, index):
+        position = index * 2
+        if (position >= len(self.email_fields)):
+            return None
+        
+        address = self.email_fields[position]
+        name = self.email_fields[position + 1]
+        if (address == '' and name == ''):
+            return None
+        return (address, name)
+        
+    # Sets the entry at index, padding the list with empty slots if needed
+    def set_email_address(self, index, address, name):
+        fields = list(self.email_fields)
+        if (index * 2 >= len(fields)):
+            fields.extend([ '' ] * (index * 2 + 2 - len(fields)))
+        fields[index * 2] = address
+        fields[index * 2 + 1] = name
+        self.email_fields = tuple(fields)
+        
+    # Returns every entry as an (address, name) tuple, or None for an empty slot
+    def get_email_addresses(self):
+        return [ self.get_email_address(index) for index in range(len(self.email_fields) // 2) ]
+        
+    email1_address = email_property(0, 0)
+    email1_name = email_property(0, 1)
+    email2_address = email_property(1, 0)
+    email2_name = email_property(1, 1)
+    email3_address = email_property(2, 0)
+    email3_name = email_property(2, 1)
     
     # Initializes fields based on the JSON representation of a contact
     # returned by Office 365
     #   parameters:
-    #     json: dict. The JSON dictionary object returned from Office 365.
-    def load_json(self, json):
-        self.given_name = json['GivenName']
-        self.last_name = json['Surname']
-        
-        if (not json['MobilePhone1'] is None):
-            self.mobile_phone = json['MobilePhone1']
-        
-        email_address_list = json['EmailAddresses']
-        if (not email_address_list[0] is None):
-            self.email1_address = email_address_list[0]['Address']
-            self.email1_name = email_address_list[0]['Name']
-        if (not email_address_list[1] is None):
-            self.email2_address = email_address_list[1]['Address']
-            self.email2_name = email_address_list[1]['Name']
-        if (not email_address_list[2] is None):
-            self.email3_address = email_address_list[2]['Address']
-            self.email3_name = email_address_list[2]['Name']
-        
-        self.id = json['Id']
-    
+    #     json_contact: dict. The JSON dictionary object returned from Office 365.
+    def load_json(self, json_contact):
+        self.id = json_contact['Id']
+        self.change_key = json_contact.get('ChangeKey') or ''
+        last_modified = json_contact.get('DateTimeLastModified')
+        self.last_modified = parse_datetime(last_modified) if last_modified else None
+        self.given_name = json_contact.get('GivenName') or ''
+        self.last_name = json_contact.get('Surname') or ''
+        self.mobile_phone = json_contact.get('MobilePhone1') or ''
+        self.email_fields = self.parse_email_fields(json_contact.get('EmailAddresses'))
+        
+    # Converts an EmailAddresses array from Office 365 to the flattened
+    # form kept in email_fields
+    @staticmethod
+    def parse_email_fields(email_address_list):
+        fields = ()
+        for entry in email_address_list or ():
+            if (entry is None):
+                fields += ('', '')
+            else:
+                fields += (entry.get('Address') or '', entry.get('Name') or '')
+        return fields
+        
+    # Returns the EmailAddresses array in the form Office 365 uses, for
+    # storing in the mirror
+    #   parameters:
+    #     return_nulls: Boolean. See get_json.
+    def get_email_address_list(self, return_nulls):
+        email_address_list = []
+        for entry in self.get_email_addresses():
+            if (entry is None):
+                if (return_nulls):
+                    email_address_list.append(None)
+            else:
+                email_address_list.append({ 'Address': entry[0], 'Name': entry[1] })
+        return email_address_list
+        
     # Generates a JSON payload for updating or creating a 
     # contact.
     #   parameters:
@@ -68,61 +339,60 @@ class DisplayContact:
     #                   in the create scenario, because passing null for any entry
     #                   results in a 500 error.
     def get_json(self, return_nulls):
-        json_string = '{'
-        json_string += '"GivenName": "{0}"'.format(self.given_name)
-        json_string += ',"Surname": "{0}"'.format(self.last_name)
-        json_string += ',"MobilePhone1": "{0}"'.format(self.mobile_phone)
-        json_string += ',"EmailAddresses": ['
-        
-        email_entry_added = False
-        if (self.email1_address == '' and self.email1_name == ''):
-            if (return_nulls == True):
-                email_entry_added = True
-                json_string += 'null'
-        else:
-            email_entry_added = True
-            json_string += '{'
-            json_string += '"@odata.type": "#Microsoft.OutlookServices.EmailAddress"'
-            json_string += ',"Address": "{0}"'.format(self.email1_address)
-            json_string += ',"Name": "{0}"'.format(self.email1_name)
-            json_string += '}'
-        
-        if (self.email2_address == '' and self.email2_name == ''):
-            if (return_nulls == True):
-                if (email_entry_added == True):
-                    json_string += ','
-                email_entry_added = True;
-                json_string += 'null'
-        else:
-            if (email_entry_added == True):
-                json_string += ','
-            email_entry_added = True;
-            json_string += '{'
-            json_string += '"@odata.type": "#Microsoft.OutlookServices.EmailAddress"'
-            json_string += ',"Address": "{0}"'.format(self.email2_address)
-            json_string += ',"Name": "{0}"'.format(self.email2_name)
-            json_string += '}'
+        # Built by concatenation rather than json.dumps: it's a fixed shape,
+        # and skipping the intermediate dicts is much faster. Every value
+        # goes through the json module's string encoder, so it is escaped
+        # exactly as json.dumps would escape it.
+        return ('{"GivenName":' + encode_json_string(self.given_name) +
+                ',"Surname":' + encode_json_string(self.last_name) +
+                ',"MobilePhone1":' + encode_json_string(self.mobile_phone) +
+                ',"EmailAddresses":[' + ','.join(self.get_email_entries(return_nulls)) + ']}')
+                
+    # Generates a JSON payload with only the properties that differ from
+    # another version of the contact, for a minimal PATCH. EmailAddresses
+    # can only be replaced as a whole, so it is sent in full (with nulls
+    # for empty entries) if any entry changed.
+    #   parameters:
+    #     original: DisplayContact. The version the changes were made to.
+    #   returns:
+    #     The JSON payload, or None if nothing changed.
+    def get_update_json(self, original):
+        changes = []
+        if (self.given_name != original.given_name):
+            changes.append('"GivenName":' + encode_json_string(self.given_name))
+        if (self.last_name != original.last_name):
+            changes.append('"Surname":' + encode_json_string(self.last_name))
+        if (self.mobile_phone != original.mobile_phone):
+            changes.append('"MobilePhone1":' + encode_json_string(self.mobile_phone))
+        if (self.get_trimmed_email_fields() != original.get_trimmed_email_fields()):
+            changes.append('"EmailAddresses":[' + ','.join(self.get_email_entries(True)) + ']')
+            
+        if (len(changes) == 0):
+            return None
             
-        if (self.email3_address == '' and self.email3_name == ''):
-            if (return_nulls == True):
-                if (email_entry_added == True):
-                    json_string += ','
-                email_entry_added = True;
-                json_string += 'null'
-        else:
-            if (email_entry_added == True):
-                json_string += ','
-            email_entry_added = True;
-            json_string += '{'
-            json_string += '"@odata.type": "#Microsoft.OutlookServices.EmailAddress"'
-            json_string += ',"Address": "{0}"'.format(self.email3_address)
-            json_string += ',"Name": "{0}"'.format(self.email3_name)
-            json_string += '}'
-        
-        json_string += ']'
-        json_string += '}'
-        
-        return json_string
+        return '{' + ','.join(changes) + '}'
+        
+    # Returns the JSON for each entry of the EmailAddresses array
+    #   parameters:
+    #     return_nulls: Boolean. See get_json.
+    def get_email_entries(self, return_nulls):
+        email_entries = []
+        fields = iter(self.email_fields)
+        for address, name in zip(fields, fields):
+            if (address or name):
+                email_entries.append(self.email_address_prefix + encode_json_string(address) +
+                                     ',"Name":' + encode_json_string(name) + '}')
+            elif (return_nulls):
+                email_entries.append('null')
+        return email_entries
+        
+    # email_fields without empty slots at the end, which don't change
+    # the contact
+    def get_trimmed_email_fields(self):
+        fields = self.email_fields
+        while (len(fields) >= 2 and fields[-1] == '' and fields[-2] == ''):
+            fields = fields[:-2]
+        return fields
     
 # MIT License: 
  
@@ -0,0 +1,218 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from concurrent.futures import ThreadPoolExecutor
+import contacts.o365service
+import contacts.o365metrics
+import threading
+import logging
+import time
+
+# Used for debug logging
+logger = logging.getLogger('contacts')
+
+# Total number of API calls in flight across all users
+max_workers = 16
+# Number of API calls in flight for any one user
+per_user_limit = 4
+
+# The outcome of a bulk run
+#   results: list. The return value of each call, in input order. None for calls that raised.
+#   failures: list. (index, error) tuples for calls that raised or returned a failure.
+#   stats: BulkStats. Throughput and latency for the run.
+class BulkResult:
+    def __init__(self, results, failures, stats):
+        self.results = results
+        self.failures = failures
+        self.stats = stats
+
+    def succeeded(self):
+        return len(self.failures) == 0
+
+# Throughput and latency figures for a bulk run. Latencies are in seconds.
+class BulkStats:
+    def __init__(self, latencies, failed, elapsed):
+        self.count = len(latencies)
+        self.failed = failed
+        self.elapsed = elapsed
+        self.throughput = self.count / elapsed if elapsed > 0 else 0.0
+
+        ordered = sorted(latencies)
+        self.latency_min = ordered[0] if self.count > 0 else 0.0
+        self.latency_max = ordered[-1] if self.count > 0 else 0.0
+        self.latency_mean = sum(ordered) / self.count if self.count > 0 else 0.0
+        self.latency_p50 = percentile(ordered, 50)
+        self.latency_p95 = percentile(ordered, 95)
+
+    def __str__(self):
+        return ('{0} calls, {1} failed in {2:.3f}s ({3:.1f} calls/s). '
+                'Latency min {4:.3f}s, p50 {5:.3f}s, p95 {6:.3f}s, max {7:.3f}s').format(self.count,
+                                                                                         self.failed,
+                                                                                         self.elapsed,
+                                                                                         self.throughput,
+                                                                                         self.latency_min,
+                                                                                         self.latency_p50,
+                                                                                         self.latency_p95,
+                                                                                         self.latency_max)
+
+# Returns the value at the given percentile of an already sorted list
+def percentile(ordered, percent):
+    if (len(ordered) == 0):
+        return 0.0
+    index = min(len(ordered) - 1, int(round((percent / 100.0) * (len(ordered) - 1))))
+    return ordered[index]
+
+# The default test for a failed call: the o365service functions return
+# None (get_*_by_id) or a non-2xx status code (create, update, delete)
+def is_failed_result(result):
+    if (result is None):
+        return True
+    if (isinstance(result, int) and not 200 <= result < 300):
+        return True
+    if (isinstance(result, contacts.o365service.BatchResult) and not 200 <= result.status_code < 300):
+        return True
+    return False
+
+# Runs many independent API calls on a bounded thread pool. The pool caps the
+# total number of calls in flight, and a semaphore per user caps how many of
+# them belong to one user, so one large job can't crowd out everyone else or
+# trip the service's per-mailbox throttling.
+class BulkExecutor:
+    def __init__(self, max_workers = max_workers, per_user_limit = per_user_limit):
+        self.per_user_limit = per_user_limit
+        self._pool = ThreadPoolExecutor(max_workers = max_workers)
+        self._user_slots = {}
+        self._user_slots_guard = threading.Lock()
+
+    def get_user_slots(self, user):
+        with self._user_slots_guard:
+            slots = self._user_slots.get(user)
+            if (slots is None):
+                slots = threading.BoundedSemaphore(self.per_user_limit)
+                self._user_slots[user] = slots
+        return slots
+
+    # Calls function once for each entry in argument_list and waits for all of them.
+    #   parameters:
+    #     function: callable. Usually one of the o365service functions.
+    #     argument_list: list. A tuple of positional arguments for each call.
+    #     user: string. The user the calls are made for, used for the per-user limit.
+    #     is_failure: callable. Returns True if a call's return value means it failed.
+    #   returns:
+    #     A BulkResult with the results in the same order as argument_list.
+    def run(self, function, argument_list, user = None, is_failure = is_failed_result):
+        logger.debug('Entering BulkExecutor.run.')
+        logger.debug('  function: %s, calls: %s, user: %s', function.__name__, len(argument_list), user)
+
+        slots = self.get_user_slots(user)
+        latencies = [ 0.0 ] * len(argument_list)
+        futures = []
+        start = time.time()
+        # Calls made on the worker threads count towards the current
+        # request's metrics, as if they were made on this thread
+        collector = contacts.o365metrics.get_collector()
+
+        def timed_call(index, arguments):
+            call_start = time.time()
+            previous = contacts.o365metrics.set_collector(collector)
+            try:
+                return function(*arguments)
+            finally:
+                contacts.o365metrics.set_collector(previous)
+                latencies[index] = time.time() - call_start
+                slots.release()
+
+        for index, arguments in enumerate(argument_list):
+            # Wait for one of the user's slots before queueing the call,
+            # so queued calls never hold a worker thread while they wait
+            slots.acquire()
+            futures.append(self._pool.submit(timed_call, index, arguments))
+
+        results = []
+        failures = []
+        for index, future in enumerate(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                results.append(None)
+                failures.append((index, e))
+            else:
+                results.append(result)
+                if (is_failure(result)):
+                    failures.append((index, result))
+
+        stats = BulkStats(latencies, len(failures), time.time() - start)
+        logger.debug('Bulk run finished: %s', stats)
+        logger.debug('Leaving BulkExecutor.run.')
+        return BulkResult(results, failures, stats)
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Returns the shared executor, so per-user limits apply across every
+# bulk run in the process
+def get_executor():
+    global _executor
+    if (_executor is None):
+        with _executor_lock:
+            if (_executor is None):
+                _executor = BulkExecutor()
+    return _executor
+
+# Retrieves many contacts by Id concurrently
+#   parameters:
+#     contact_endpoint: string. The URL to the Contacts API endpoint (https://outlook.office365.com/api/v1.0)
+#     token: string. The access token
+#     contact_ids: list. The IDs of the contacts to retrieve.
+#     parameters: string. An optional string containing query parameters to limit the properties returned.
+#     user: string. The user the calls are made for.
+def get_contacts_by_id(contact_endpoint, token, contact_ids, parameters = None, user = None):
+    return get_executor().run(contacts.o365service.get_contact_by_id,
+                              [ (contact_endpoint, token, contact_id, parameters) for contact_id in contact_ids ],
+                              user)
+
+# Retrieves many messages by Id concurrently
+def get_messages_by_id(mail_endpoint, token, message_ids, parameters = None, user = None):
+    return get_executor().run(contacts.o365service.get_message_by_id,
+                              [ (mail_endpoint, token, message_id, parameters) for message_id in message_ids ],
+                              user)
+
+# Retrieves many events by Id concurrently
+def get_events_by_id(calendar_endpoint, token, event_ids, parameters = None, user = None):
+    return get_executor().run(contacts.o365service.get_event_by_id,
+                              [ (calendar_endpoint, token, event_id, parameters) for event_id in event_ids ],
+                              user)
+
+# Deletes many items concurrently with one of the o365service delete functions
+#   parameters:
+#     delete_function: callable. delete_contact, delete_message or delete_event.
+#     api_endpoint: string. The URL to the API endpoint (https://outlook.office365.com/api/v1.0)
+#     token: string. The access token
+#     item_ids: list. The IDs of the items to delete.
+#     user: string. The user the calls are made for.
+def delete_items(delete_function, api_endpoint, token, item_ids, user = None):
+    return get_executor().run(delete_function,
+                              [ (api_endpoint, token, item_id) for item_id in item_ids ],
+                              user)
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,154 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+# Logging support for the Office 365 service layer. Nothing here imports
+# Django, so settings.LOGGING can refer to these classes.
+import itertools
+import logging
+import logging.handlers
+import queue
+import re
+
+# The most records waiting to be written by a BackgroundFileHandler. Once
+# the queue is full, new records are dropped rather than blocking the caller.
+default_max_queued = 10000
+
+redacted = '[redacted]'
+
+# Values that must never reach the log file:
+#   Bearer tokens in headers
+#   JWTs anywhere (access and id tokens, and the discovery token)
+#   Token, auth code and secret fields in form posts, JSON and dictionaries
+#   The auth code in a form post or query string (code=...). A bare 'code'
+#   key is left alone: OData errors and status lines use it.
+#   The '  token: ...' style parameter lines written by o365service
+# Each pattern is only tried on text containing one of its keywords, which
+# is much cheaper than running the regular expression on every line.
+redaction_patterns = [
+    (('Bearer',), re.compile(r'(Bearer\s+)[^\s\'",}]+'), r'\1' + redacted),
+    (('eyJ',), re.compile(r'eyJ[\w\-]+\.[\w\-]+\.[\w\-]*'), redacted),
+    (('token', 'auth_code', 'secret', 'password'),
+     re.compile(r'''(['"]?\b(?:access_token|refresh_token|id_token|client_secret|auth_code|password)['"]?\s*[:=]\s*['"]?)[^'"&,}\s]+'''),
+     r'\1' + redacted),
+    (('code=',), re.compile(r'''((?:^|[?&\s])code=)[^&'"\s]+'''), r'\1' + redacted),
+    (('token', 'auth_code'),
+     re.compile(r'''(\b(?:token|refresh_token|encoded_token|auth_code|Extracted access token from response):\s*)\S+'''),
+     r'\1' + redacted),
+]
+
+# Returns text with tokens and secrets replaced by [redacted]
+def redact(text):
+    for keywords, pattern, replacement in redaction_patterns:
+        for keyword in keywords:
+            if (keyword in text):
+                text = pattern.sub(replacement, text)
+                break
+    return text
+
+# Defers reading a response body until the record is written, so debug
+# lines like logger.debug('Response: %s', LazyJson(r)) cost nothing when
+# DEBUG is off. Bodies that aren't JSON (like the empty body of a 204) are
+# logged as text.
+class LazyJson:
+    __slots__ = ('response',)
+
+    def __init__(self, response):
+        self.response = response
+
+    def __str__(self):
+        try:
+            return str(self.response.json())
+        except ValueError:
+            return self.response.text
+
+# A filter that formats the message and redacts it. Attached to the handler
+# that writes the file, so the work happens on the writer's thread.
+class RedactingFilter(logging.Filter):
+    def filter(self, record):
+        try:
+            message = record.getMessage()
+        except Exception:
+            # Leave a bad format string for the handler to report
+            return True
+        record.msg = redact(message)
+        record.args = None
+        return True
+
+# A filter that keeps one of every rate records at or below level. Records
+# above level (warnings and errors, by default) are always kept.
+#   parameters:
+#     rate: int. Keep one record in this many. 1 keeps everything.
+#     level: string or int. The highest level that is sampled.
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate = 1, level = 'DEBUG'):
+        super().__init__()
+        self.rate = max(1, int(rate))
+        self.level = level if isinstance(level, int) else logging.getLevelName(level)
+        # next() on a count is atomic, so no lock is needed
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if (record.levelno > self.level or self.rate == 1):
+            return True
+        return next(self._counter) % self.rate == 0
+
+# A handler that writes to a file from a background thread. Logging a record
+# only puts it on a queue; formatting, redaction and the file write happen on
+# the listener thread, so API calls never wait on the disk.
+#   parameters:
+#     filename: string. The log file.
+#     mode, encoding, delay: As for logging.FileHandler.
+#     max_queued: int. The most records waiting to be written.
+class BackgroundFileHandler(logging.handlers.QueueHandler):
+    def __init__(self, filename, mode = 'a', encoding = None, delay = False, max_queued = default_max_queued):
+        super().__init__(queue.Queue(max_queued))
+        self.dropped = 0
+        self.target = logging.FileHandler(filename, mode, encoding, delay)
+        self.target.addFilter(RedactingFilter())
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    # QueueHandler formats the message here, on the caller's thread. The
+    # record is queued as it is instead, and formatted when it is written.
+    # Arguments are logged as they are when written, which for the strings
+    # and numbers o365service logs is the same as when they were passed.
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    # Writes any queued records and stops the listener thread. logging
+    # calls this at exit.
+    def close(self):
+        if (not self.listener is None):
+            self.listener.stop()
+            self.listener = None
+            self.target.close()
+        super().close()
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
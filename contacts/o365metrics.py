@@ -0,0 +1,264 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from collections import deque
+from urllib.parse import urlsplit, urlencode
+import threading
+import time
+import json
+import re
+import logging
+
+# Used for debug logging
+logger = logging.getLogger('contacts')
+
+# The number of recent durations kept per operation for the percentiles
+# reported by get_snapshot
+recent_durations = 1000
+# The most individual calls listed in a Server-Timing header. The slowest
+# are listed; the o365 total always covers all of them.
+max_server_timing_calls = 10
+
+# Path segments that look like item Ids are replaced with {id}, so calls
+# to the same API are counted together
+id_segment_pattern = re.compile(r'^[A-Za-z0-9_\-=%.]{20,}$')
+api_version_pattern = re.compile(r'^/api/v\d+\.\d+/')
+
+# One call to Office 365 (or the token and discovery endpoints)
+#   name: string. The method and path, with Ids replaced, like 'GET Me/Contacts/{id}'.
+#   status_code: int. The final status, or None if the call raised.
+#   attempts: int. 1, plus the number of retries.
+#   started: float. When the call started, as a Unix timestamp.
+#   duration: float. Seconds from the first attempt to the final response, including retry waits.
+#   ttfb: float. Seconds from sending the final attempt to receiving its headers, if known.
+#   bytes_out: int. The size of the request body.
+#   bytes_in: int. The size of the response body.
+#   request_id: string. The client-request-id sent with the call, if any.
+#   error: string. The exception, if the call raised.
+class CallRecord:
+    __slots__ = ('name', 'status_code', 'attempts', 'started', 'duration', 'ttfb',
+                 'bytes_out', 'bytes_in', 'request_id', 'error')
+
+    def __init__(self, name, status_code, attempts, started, duration, ttfb, bytes_out, bytes_in, request_id, error):
+        self.name = name
+        self.status_code = status_code
+        self.attempts = attempts
+        self.started = started
+        self.duration = duration
+        self.ttfb = ttfb
+        self.bytes_out = bytes_out
+        self.bytes_in = bytes_in
+        self.request_id = request_id
+        self.error = error
+
+    def is_failure(self):
+        return self.status_code is None or self.status_code >= 400
+
+    def to_dict(self):
+        return dict((field, getattr(self, field)) for field in self.__slots__)
+
+# Returns the name calls are grouped under: the method and the path without
+# the API version, with Ids replaced
+def get_operation_name(method, url):
+    path = api_version_pattern.sub('', urlsplit(url).path)
+    segments = [ '{id}' if id_segment_pattern.match(segment) else segment for segment in path.strip('/').split('/') ]
+    return '{0} {1}'.format(method.upper(), '/'.join(segments))
+
+def get_body_size(body):
+    if (body is None):
+        return 0
+    if (isinstance(body, dict)):
+        body = urlencode(body)
+    if (isinstance(body, str)):
+        return len(body.encode('utf-8'))
+    return len(body)
+
+# Records a finished call: adds it to the totals, to the current request's
+# calls if a request is being measured, and to the debug log
+#   parameters:
+#     method: string. The HTTP method.
+#     url: string. The URL called.
+#     started: float. time.perf_counter() when the call started.
+#     response: requests.Response. The final response, or None if the call raised.
+#     payload: The request body.
+#     attempts: int. How many times the request was sent.
+#     request_id: string. The client-request-id, if one was sent.
+#     error: Exception. The exception, if the call raised.
+def record_call(method, url, started, response = None, payload = None, attempts = 1, request_id = None, error = None):
+    duration = time.perf_counter() - started
+    ttfb = None
+    status_code = None
+    bytes_in = 0
+    if (not response is None):
+        status_code = response.status_code
+        bytes_in = len(response.content or b'')
+        elapsed = getattr(response, 'elapsed', None)
+        if (elapsed):
+            ttfb = elapsed.total_seconds()
+
+    record = CallRecord(get_operation_name(method, url), status_code, attempts, time.time() - duration,
+                        duration, ttfb, get_body_size(payload), bytes_in, request_id,
+                        None if error is None else repr(error))
+
+    call_stats.add(record)
+    collector = get_collector()
+    if (not collector is None):
+        collector.add(record)
+
+    if (logger.isEnabledFor(logging.DEBUG)):
+        logger.debug('API call: %s', json.dumps(record.to_dict()))
+    return record
+
+# The calls made while handling one Django request. Calls can be added from
+# other threads (the bulk executor's workers), so adding is locked.
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = None
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.calls.append(record)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def get_api_time(self):
+        return sum(record.duration for record in self.calls)
+
+    # Builds a Server-Timing header value: the whole request ('app'), all
+    # upstream calls ('o365'), then the slowest individual calls
+    def get_server_timing(self):
+        calls = list(self.calls)
+        retries = sum(record.attempts - 1 for record in calls)
+        entries = [ 'app;dur={0:.1f}'.format((self.duration or 0.0) * 1000),
+                    'o365;dur={0:.1f};desc="{1} calls, {2} retries"'.format(self.get_api_time() * 1000, len(calls), retries) ]
+
+        slowest = sorted(range(len(calls)), key = lambda index: calls[index].duration, reverse = True)[:max_server_timing_calls]
+        for index in sorted(slowest):
+            record = calls[index]
+            entries.append('o365-{0};dur={1:.1f};desc="{2} {3}"'.format(index + 1,
+                                                                         record.duration * 1000,
+                                                                         record.name.replace('"', "'"),
+                                                                         record.status_code or 'error'))
+        return ', '.join(entries)
+
+_local = threading.local()
+
+# Returns the RequestMetrics calls on this thread are added to, or None
+def get_collector():
+    return getattr(_local, 'collector', None)
+
+# Sets the RequestMetrics calls on this thread are added to and returns the
+# previous one. The bulk executor uses this to carry a request's collector
+# over to its worker threads.
+def set_collector(collector):
+    previous = get_collector()
+    _local.collector = collector
+    return previous
+
+# Totals for one operation (or one view, for get_snapshot's views section)
+class Stats:
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.retries = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.api_calls = 0
+        self.api_time = 0.0
+        self.durations = deque(maxlen = recent_durations)
+
+    def to_dict(self):
+        ordered = sorted(self.durations)
+        return { 'count': self.count,
+                 'failures': self.failures,
+                 'retries': self.retries,
+                 'total_ms': round(self.total_time * 1000, 1),
+                 'mean_ms': round(self.total_time * 1000 / self.count, 1) if self.count > 0 else 0.0,
+                 'p50_ms': round(percentile(ordered, 50) * 1000, 1),
+                 'p95_ms': round(percentile(ordered, 95) * 1000, 1),
+                 'max_ms': round(self.max_time * 1000, 1),
+                 'bytes_out': self.bytes_out,
+                 'bytes_in': self.bytes_in,
+                 'api_calls': self.api_calls,
+                 'api_ms': round(self.api_time * 1000, 1) }
+
+def percentile(ordered, percent):
+    if (len(ordered) == 0):
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round((percent / 100.0) * (len(ordered) - 1))))]
+
+# Running totals per operation and per view, for the metrics endpoint
+class CallStats:
+    def __init__(self):
+        self.operations = {}
+        self.views = {}
+        self.since = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            stats = self.operations.get(record.name)
+            if (stats is None):
+                stats = self.operations[record.name] = Stats()
+            add_duration(stats, record.duration)
+            stats.failures += 1 if record.is_failure() else 0
+            stats.retries += record.attempts - 1
+            stats.bytes_out += record.bytes_out
+            stats.bytes_in += record.bytes_in
+
+    def add_request(self, view_name, request_metrics, status_code):
+        with self._lock:
+            stats = self.views.get(view_name)
+            if (stats is None):
+                stats = self.views[view_name] = Stats()
+            add_duration(stats, request_metrics.duration or 0.0)
+            stats.failures += 1 if status_code >= 500 else 0
+            stats.api_calls += len(request_metrics.calls)
+            stats.api_time += request_metrics.get_api_time()
+
+    # Returns the totals as a dictionary that can be serialized as JSON
+    def get_snapshot(self):
+        with self._lock:
+            return { 'since': self.since,
+                     'operations': dict((name, stats.to_dict()) for name, stats in self.operations.items()),
+                     'views': dict((name, stats.to_dict()) for name, stats in self.views.items()) }
+
+    def reset(self):
+        with self._lock:
+            self.operations.clear()
+            self.views.clear()
+            self.since = time.time()
+
+def add_duration(stats, duration):
+    stats.count += 1
+    stats.total_time += duration
+    stats.max_time = max(stats.max_time, duration)
+    stats.durations.append(duration)
+
+# The totals for this process
+call_stats = CallStats()
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -5,8 +5,16 @@ import json
 import base64
 import logging
 import uuid
-import datetime
+from collections import namedtuple, OrderedDict
+import threading
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from contacts.clientreg import client_registration
+from contacts.o365transport import get_transport
+import contacts.o365throttle as o365throttle
+import contacts.o365metrics as o365metrics
+import contacts.o365logging as o365logging
 
 # Constant strings for OAuth2 flow
 # The OAuth authority
@@ -29,15 +37,29 @@ logger = logging.getLogger('contacts')
 # Useful for capturing API calls in Fiddler
 verifySSL = True
 
+# Number of background threads used to prefetch the next page
+# of a collection while the caller works through the current one
+prefetch_workers = 4
+_prefetch_executor = None
+_prefetch_lock = threading.Lock()
+
+# Raised by the paging iterators when the service returns
+# anything other than 200 OK for a page of results
+class ApiError(Exception):
+    def __init__(self, status_code, url):
+        self.status_code = status_code
+        self.url = url
+        super().__init__('{0} HTTP status returned for {1}'.format(status_code, url))
+
 # Plugs in client ID and redirect URL to the authorize URL
 # App will call this to get a URL to redirect the user for sign in
 def get_authorization_url(redirect_uri):
     logger.debug('Entering get_authorization_url.')
-    logger.debug('  redirect_uri: {0}'.format(redirect_uri))
+    logger.debug('  redirect_uri: %s', redirect_uri)
     
     authorization_url = authorize_url.format(client_registration.client_id(), quote(redirect_uri))
     
-    logger.debug('Authorization url: {0}'.format(authorization_url))
+    logger.debug('Authorization url: %s', authorization_url)
     logger.debug('Leaving get_authorization_url.')
     return authorization_url
 
@@ -47,8 +69,8 @@ def get_authorization_url(redirect_uri):
 # the app has permssions for
 def get_access_info_from_authcode(auth_code, redirect_uri):
     logger.debug('Entering get_access_info_from_authcode.')
-    logger.debug('  auth_code: {0}'.format(auth_code))
-    logger.debug('  redirect_uri: {0}'.format(redirect_uri))
+    logger.debug('  auth_code: %s', auth_code)
+    logger.debug('  redirect_uri: %s', redirect_uri)
     
     logger.debug('Sending request to access token endpoint.')
     post_data = { 'grant_type' : 'authorization_code',
@@ -57,14 +79,16 @@ def get_access_info_from_authcode(auth_code, redirect_uri):
                   'resource' : discovery_resource,
                   'client_id' : client_registration.client_id(),
                   'client_secret' : client_registration.client_secret() }
-    r = requests.post(access_token_url, data = post_data, verify = verifySSL)
+    started = time.perf_counter()
+    r = get_transport().request('POST', access_token_url, data = post_data, verify = verifySSL)
+    o365metrics.record_call('POST', access_token_url, started, r, post_data)
     logger.debug('Received response from token endpoint.')
-    logger.debug(r.json())
+    logger.debug('%s', o365logging.LazyJson(r))
     
     # Get the discovery service access token and do discovery
     try:
         discovery_service_token = r.json()['access_token']
-        logger.debug('Extracted access token from response: {0}'.format(discovery_service_token))
+        logger.debug('Extracted access token from response: %s', discovery_service_token)
     except:
         logger.debug('Exception encountered, setting token to None.')
         discovery_service_token = None
@@ -73,16 +97,16 @@ def get_access_info_from_authcode(auth_code, redirect_uri):
         # Add the refresh token to the dictionary to be returned
         # so that the app can use it to request additional access tokens
         # for other resources without having to re-prompt the user.
-        discovery_result = do_discovery(discovery_service_token)
+        discovery_result = get_discovery_result(discovery_service_token)
         logger.debug('Discovery completed.')
         discovery_result['refresh_token'] = r.json()['refresh_token']
         
         # Get the user's email from the access token and add to the
         # dictionary to be returned.
         json_token = parse_token(discovery_service_token)
-        logger.debug('Discovery token after parsing: {0}'.format(json_token))
+        logger.debug('Discovery token after parsing: %s', json_token)
         discovery_result['user_email'] = json_token['upn']
-        logger.debug('Extracted email from token: {0}'.format(json_token['upn']))
+        logger.debug('Extracted email from token: %s', json_token['upn'])
         logger.debug('Leaving get_access_info_from_authcode.')
         return discovery_result
     else:
@@ -94,31 +118,110 @@ def get_access_info_from_authcode(auth_code, redirect_uri):
 # from the results.
 def do_discovery(token):
     logger.debug('Entering do_discovery.')
-    logger.debug('  token: {0}'.format(token))
+    logger.debug('  token: %s', token)
     
     headers = { 'Authorization' : 'Bearer {0}'.format(token),
                 'Accept' : 'application/json' }
-    r = requests.get(discovery_endpoint, headers = headers, verify = verifySSL)
+    started = time.perf_counter()
+    r = get_transport().request('GET', discovery_endpoint, headers = headers, verify = verifySSL)
+    o365metrics.record_call('GET', discovery_endpoint, started, r)
     
     discovery_result = {}
     
     for entry in r.json()['value']:
         capability = entry['capability']
-        logger.debug('Capability found: {0}'.format(capability))
+        logger.debug('Capability found: %s', capability)
         discovery_result['{0}_resource_id'.format(capability)] = entry['serviceResourceId']
         discovery_result['{0}_api_endpoint'.format(capability)] = entry['serviceEndpointUri']
-        logger.debug('  Resource ID: {0}'.format(entry['serviceResourceId']))
-        logger.debug('  API endpoint: {0}'.format(entry['serviceEndpointUri']))
+        logger.debug('  Resource ID: %s', entry['serviceResourceId'])
+        logger.debug('  API endpoint: %s', entry['serviceEndpointUri'])
         
     logger.debug('Leaving do_discovery.')
     return discovery_result
+
+# Discovery cache #
+
+# How long, in seconds, a discovery result is reused before asking the
+# discovery service again
+discovery_cache_ttl = 24 * 60 * 60
+_discovery_cache = {}
+_discovery_cache_lock = threading.Lock()
+
+# Returns the discovery result (resource IDs and API endpoints for every
+# capability) for the user the token belongs to. Results are cached per
+# tenant and user, so reconnecting doesn't call the discovery service again
+# until the cached result expires or is invalidated.
+#   parameters:
+#     token: string. An access token for the discovery service.
+def get_discovery_result(token):
+    logger.debug('Entering get_discovery_result.')
+    claims = parse_token(token)
+    
+    if (not isinstance(claims, dict)):
+        logger.debug('Token could not be parsed, not caching.')
+        return do_discovery(token)
+        
+    tenant_id = claims.get('tid')
+    user = claims.get('upn')
+    
+    discovery_result = get_cached_discovery(tenant_id, user)
+    if (discovery_result is None):
+        discovery_result = do_discovery(token)
+        store_discovery_result(tenant_id, user, discovery_result)
+    else:
+        logger.debug('Using cached discovery result for %s', user)
+        
+    logger.debug('Leaving get_discovery_result.')
+    return discovery_result
+    
+def get_discovery_key(tenant_id, user):
+    return ((tenant_id or '').lower(), (user or '').lower())
+    
+# Returns a copy of the cached discovery result for a user,
+# or None if there isn't one or it has expired. Never calls the service.
+#   parameters:
+#     tenant_id: string. The user's tenant ID (the tid claim).
+#     user: string. The user's sign-in name (the upn claim).
+def get_cached_discovery(tenant_id, user):
+    key = get_discovery_key(tenant_id, user)
+    with _discovery_cache_lock:
+        entry = _discovery_cache.get(key)
+        if (entry is None):
+            return None
+        expires, discovery_result = entry
+        if (time.time() >= expires):
+            del _discovery_cache[key]
+            return None
+    return dict(discovery_result)
+    
+# Caches a discovery result. A result with no endpoints (the service
+# failed or returned nothing) isn't cached, so the next connect asks again.
+def store_discovery_result(tenant_id, user, discovery_result):
+    if (not any(key.endswith('_api_endpoint') for key in discovery_result)):
+        logger.debug('Discovery result has no endpoints, not caching.')
+        return
+        
+    with _discovery_cache_lock:
+        _discovery_cache[get_discovery_key(tenant_id, user)] = (time.time() + discovery_cache_ttl, dict(discovery_result))
+        
+# Removes cached discovery results, for example when a service's endpoints move.
+# With no arguments the whole cache is cleared.
+#   parameters:
+#     tenant_id: string. Only remove results for this tenant.
+#     user: string. Only remove results for this user.
+def invalidate_discovery(tenant_id = None, user = None):
+    with _discovery_cache_lock:
+        for key in list(_discovery_cache.keys()):
+            if ((tenant_id is None or key[0] == tenant_id.lower()) and
+                (user is None or key[1] == user.lower())):
+                del _discovery_cache[key]
     
 # Once the app has obtained access information (resource IDs and API endpoints)
 # it will call this function to get an access token for a specific resource. 
 def get_access_token_from_refresh_token(refresh_token, resource_id):
     logger.debug('Entering get_access_token_from_refresh_token.')
-    logger.debug('  refresh_token: {0}'.format(refresh_token))
-    logger.debug('  resource_id: {0}'.format(resource_id))
+    logger.debug('  refresh_token: %s', refresh_token)
+    logger.debug('  resource_id: %s', resource_id)
     
     post_data = { 'grant_type' : 'refresh_token',
                   'client_id' : client_registration.client_id(),
@@ -126,9 +229,11 @@ def get_access_token_from_refresh_token(refresh_token, resource_id):
                   'refresh_token' : refresh_token,
                   'resource' : resource_id }
                   
-    r = requests.post(access_token_url, data = post_data, verify = verifySSL)
+    started = time.perf_counter()
+    r = get_transport().request('POST', access_token_url, data = post_data, verify = verifySSL)
+    o365metrics.record_call('POST', access_token_url, started, r, post_data)
     
-    logger.debug('Response: {0}'.format(r.json()))
+    logger.debug('Response: %s', o365logging.LazyJson(r))
     # Return the token as a JSON object
     logger.debug('Leaving get_access_token_from_refresh_token.')
     return r.json()
@@ -138,7 +243,7 @@ def get_access_token_from_refresh_token(refresh_token, resource_id):
 # loads that into a JSON object.
 def parse_token(encoded_token):
     logger.debug('Entering parse_token.')
-    logger.debug('  encoded_token: {0}'.format(encoded_token))
+    logger.debug('  encoded_token: %s', encoded_token)
 
     try:
         # First split the token into header and payload
@@ -146,10 +251,10 @@ def parse_token(encoded_token):
         
         # Header is token_parts[0]
         # Payload is token_parts[1]
-        logger.debug('Token part to decode: {0}'.format(token_parts[1]))
+        logger.debug('Token part to decode: %s', token_parts[1])
         
         decoded_token = decode_token_part(token_parts[1])
-        logger.debug('Decoded token part: {0}'.format(decoded_token))
+        logger.debug('Decoded token part: %s', decoded_token)
         logger.debug('Leaving parse_token.')
         return json.loads(decoded_token)
     except:
@@ -157,25 +262,36 @@ def parse_token(encoded_token):
     
 def decode_token_part(base64data):
     logger.debug('Entering decode_token_part.')
-    logger.debug('  base64data: {0}'.format(base64data))
+    logger.debug('  base64data: %s', base64data)
 
     # base64 strings should have a length divisible by 4
     # If this one doesn't, add the '=' padding to fix it
     leftovers = len(base64data) % 4
-    logger.debug('String length % 4 = {0}'.format(leftovers))
+    logger.debug('String length %% 4 = %s', leftovers)
     if leftovers == 2:
         base64data += '=='
     elif leftovers == 3:
         base64data += '='
     
-    logger.debug('String with padding added: {0}'.format(base64data))
+    logger.debug('String with padding added: %s', base64data)
     decoded = base64.b64decode(base64data)
-    logger.debug('Decoded string: {0}'.format(decoded))
+    logger.debug('Decoded string: %s', decoded)
     logger.debug('Leaving decode_token_part.')
     return decoded.decode('utf-8')
     
 # Generic API Sending
-def make_api_call(method, url, token, payload = None):
+# Throttled (429) and unavailable (502, 503, 504) responses are retried
+# according to contacts.o365throttle.get_retry_policy(), and every call waits
+# its turn in the mailbox's bucket in contacts.o365throttle.rate_limiter.
+#   parameters:
+#     method: string. The HTTP method (GET, POST, PATCH, DELETE).
+#     url: string. The full URL of the API call.
+#     token: string. The access token
+#     payload: string. The request body for POST and PATCH.
+#     extra_headers: dict. Optional headers to add to, or override, the defaults.
+#     idempotent: Boolean. Set to True if a POST or PATCH is safe to send twice,
+#                 or False to never retry the call. None decides by method.
+def make_api_call(method, url, token, payload = None, extra_headers = None, idempotent = None):
     # Send these headers with all API calls
     headers = { 'User-Agent' : 'pythoncontacts/1.2',
                 'Authorization' : 'Bearer {0}'.format(token),
@@ -190,30 +306,330 @@ def make_api_call(method, url, token, payload = None):
                         
     headers.update(instrumentation)
     
-    response = None
+    method = method.upper()
     
-    if (method.upper() == 'GET'):
-        logger.debug('{0}: Sending request id: {1}'.format(datetime.datetime.now(), request_id))
-        response = requests.get(url, headers = headers, verify = verifySSL)
-    elif (method.upper() == 'DELETE'):
-        logger.debug('{0}: Sending request id: {1}'.format(datetime.datetime.now(), request_id))
-        response = requests.delete(url, headers = headers, verify = verifySSL)
-    elif (method.upper() == 'PATCH'):
-        headers.update({ 'Content-Type' : 'application/json' })
-        logger.debug('{0}: Sending request id: {1}'.format(datetime.datetime.now(), request_id))
-        response = requests.patch(url, headers = headers, data = payload, verify = verifySSL)
-    elif (method.upper() == 'POST'):
+    if (method == 'PATCH' or method == 'POST'):
         headers.update({ 'Content-Type' : 'application/json' })
-        logger.debug('{0}: Sending request id: {1}'.format(datetime.datetime.now(), request_id))
-        response = requests.post(url, headers = headers, data = payload, verify = verifySSL)
+    elif (method != 'GET' and method != 'DELETE'):
+        return None
+        
+    if (not extra_headers is None):
+        headers.update(extra_headers)
+        
+    mailbox = get_mailbox(token)
+    retry_policy = o365throttle.get_retry_policy()
+    attempt = 0
+    waited = 0.0
+    started = time.perf_counter()
+    
+    while (True):
+        o365throttle.rate_limiter.acquire(mailbox)
+        logger.debug('Sending request id: %s, attempt %s', request_id, attempt + 1)
+        
+        try:
+            response = get_transport().request(method, url, headers = headers, data = payload, verify = verifySSL)
+        except requests.exceptions.RequestException as e:
+            if (not retry_policy.should_retry_exception(method, e, attempt, idempotent)):
+                o365metrics.record_call(method, url, started, None, payload, attempt + 1, request_id, e)
+                raise
+            delay = retry_policy.get_delay(attempt)
+            if (not retry_policy.can_wait(waited, delay)):
+                logger.debug('Retry budget used up, giving up on request id %s', request_id)
+                o365metrics.record_call(method, url, started, None, payload, attempt + 1, request_id, e)
+                raise
+            logger.debug('Request id %s failed: %s. Retrying in %.3fs', request_id, e, delay)
+        else:
+            logger.debug('Request id %s completed. Server id: %s, Status: %s',
+                         request_id, response.headers.get('request-id'), response.status_code)
+            if (not retry_policy.should_retry(method, response.status_code, response.headers, attempt, idempotent)):
+                o365metrics.record_call(method, url, started, response, payload, attempt + 1, request_id)
+                return response
+            delay = retry_policy.get_delay(attempt, response.headers)
+            if (delay is None or not retry_policy.can_wait(waited, delay)):
+                logger.debug('Retry-After too long or retry budget used up, giving up on request id %s', request_id)
+                o365metrics.record_call(method, url, started, response, payload, attempt + 1, request_id)
+                return response
+            logger.debug('Request id %s throttled. Retrying in %.3fs', request_id, delay)
+            
+        time.sleep(delay)
+        waited += delay
+        attempt += 1
+    
+# The number of tokens whose mailbox is remembered
+max_cached_mailboxes = 1024
+# Maps a hash of each recently used token to its mailbox, most recently
+# used last. Tokens themselves aren't kept.
+_mailboxes = OrderedDict()
+_mailboxes_lock = threading.Lock()
 
-    if (not response is None):
-        logger.debug('{0}: Request id {1} completed. Server id: {2}, Status: {3}'.format(datetime.datetime.now(), 
-                                                                                         request_id,
-                                                                                         response.headers.get('request-id'),
-                                                                                         response.status_code))
+# Returns the mailbox an access token belongs to, used to key the per-mailbox
+# rate limit. Falls back to a hash of the token if it can't be parsed, so
+# the token is never used as a key or written to the log.
+def get_mailbox(token):
+    token_hash = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    with _mailboxes_lock:
+        mailbox = _mailboxes.get(token_hash)
+        if (not mailbox is None):
+            _mailboxes.move_to_end(token_hash)
+            return mailbox
+            
+    try:
+        claims = json.loads(decode_token_part(token.split('.')[1]))
+        mailbox = claims.get('upn') or claims.get('unique_name') or claims.get('oid')
+    except Exception:
+        mailbox = None
+    mailbox = mailbox or 'token:{0}'.format(token_hash)
+    
+    with _mailboxes_lock:
+        _mailboxes[token_hash] = mailbox
+        while (len(_mailboxes) > max_cached_mailboxes):
+            _mailboxes.popitem(last = False)
+    return mailbox
+
+# Paging #
+
+# Appends query parameters and an optional page size ($top) to a collection URL
+def build_collection_url(collection_url, parameters = None, page_size = None):
+    url = collection_url
+    
+    if (not parameters is None and
+        parameters != ''):
+        url = '{0}{1}'.format(url, parameters)
+        
+    if (not page_size is None):
+        separator = '&' if '?' in url else '?'
+        url = '{0}{1}$top={2}'.format(url, separator, page_size)
+        
+    return url
+
+# Builds an OData query string ('?$select=...&$top=...') from the options
+# that are set. Values are URL-encoded, so filter and orderby expressions
+# can be passed as written.
+#   parameters:
+#     select: string. Comma-separated properties to return.
+#     top: int. The number of items to return.
+#     skip: int. The number of items to skip.
+#     orderby: string. The sort order, for example 'Surname desc'.
+#     filter: string. A filter expression, for example "startswith(GivenName,'A')".
+def build_query_parameters(select = None, top = None, skip = None, orderby = None, filter = None):
+    options = []
+    for name, value in (('$select', select), ('$top', top), ('$skip', skip),
+                        ('$orderby', orderby), ('$filter', filter)):
+        if (not value is None and value != '' and not (name == '$skip' and value == 0)):
+            options.append('{0}={1}'.format(name, quote(str(value), safe = ",'()")))
+            
+    if (len(options) == 0):
+        return ''
+        
+    return '?{0}'.format('&'.join(options))
+    
+# Quotes a string for use as a literal in an OData filter expression
+def odata_string(value):
+    return "'{0}'".format(value.replace("'", "''"))
+    
+def get_prefetch_executor():
+    global _prefetch_executor
+    if (_prefetch_executor is None):
+        with _prefetch_lock:
+            if (_prefetch_executor is None):
+                _prefetch_executor = ThreadPoolExecutor(max_workers = prefetch_workers)
+    return _prefetch_executor
+    
+def get_page(url, token):
+    r = make_api_call('GET', url, token)
+    
+    if (r.status_code != requests.codes.ok):
+        raise ApiError(r.status_code, url)
+        
+    return r.json()
+
+# Fetches a page on a prefetch thread. The call counts towards the metrics
+# of the request that is listing the collection, as calls made by the bulk
+# executor do.
+def prefetch_page(collector, url, token):
+    previous = o365metrics.set_collector(collector)
+    try:
+        return get_page(url, token)
+    finally:
+        o365metrics.set_collector(previous)
+
+# Lazily iterates over every item in a collection, following @odata.nextLink
+# from page to page. Items are yielded one at a time, and only the current page
+# is held in memory. While the caller consumes a page, the next one is fetched
+# on a background thread.
+#   parameters:
+#     url: string. The URL of the first page, including any query parameters.
+#     token: string. The access token
+#     max_items: int. An optional cap on the number of items returned.
+#     prefetch: Boolean. Set to False to fetch each page only when it is needed.
+def iter_collection(url, token, max_items = None, prefetch = True):
+    logger.debug('Entering iter_collection.')
+    logger.debug('  url: %s', url)
+    
+    remaining = max_items
+    pending = None
+    next_url = url
+    
+    while (not next_url is None):
+        if (pending is None):
+            page = get_page(next_url, token)
+        else:
+            page = pending.result()
+            pending = None
+            
+        items = page.get('value', [])
+        next_url = page.get('@odata.nextLink')
+        
+        if (not remaining is None and len(items) >= remaining):
+            items = items[:remaining]
+            next_url = None
+        
+        if (prefetch and not next_url is None):
+            pending = get_prefetch_executor().submit(prefetch_page, o365metrics.get_collector(), next_url, token)
+            
+        for item in items:
+            yield item
+            
+        if (not remaining is None):
+            remaining -= len(items)
+            
+    logger.debug('Leaving iter_collection.')
+    
+
+# Batching #
+
+# Maximum number of operations sent in one $batch request
+max_batch_size = 20
+# Maximum size in bytes of one $batch request body
+max_batch_bytes = 4 * 1024 * 1024
+
+# The outcome of one operation in a $batch request
+#   status_code: int. The HTTP status of the operation.
+#   body: dict. The parsed JSON body of the operation's response, or None.
+BatchResult = namedtuple('BatchResult', [ 'status_code', 'body' ])
+
+# Sends operations to the service in OData $batch requests, packing up to
+# batch_size operations (and at most max_batch_bytes) into each request.
+# Each operation is independent; one failing doesn't affect the others.
+#   parameters:
+#     api_endpoint: string. The URL to the API endpoint (https://outlook.office365.com/api/v1.0)
+#     token: string. The access token
+#     operations: list. (method, url, payload) tuples. url is relative to api_endpoint
+#                 (for example 'Me/Contacts'). payload is a JSON string or None.
+#     batch_size: int. The maximum number of operations per $batch request.
+#   returns:
+#     A list of BatchResult, one per operation, in the same order as operations.
+def send_batch(api_endpoint, token, operations, batch_size = max_batch_size):
+    logger.debug('Entering send_batch.')
+    logger.debug('  api_endpoint: %s', api_endpoint)
+    logger.debug('  operations: %s', len(operations))
+    
+    batch_url = '{0}/$batch'.format(api_endpoint)
+    results = []
+    
+    for chunk in split_batch(api_endpoint, operations, batch_size):
+        boundary = 'batch_{0}'.format(uuid.uuid4())
+        body = build_batch_body(api_endpoint, chunk, boundary)
         
-    return response
+        r = make_api_call('POST', batch_url, token, body,
+                          { 'Content-Type' : 'multipart/mixed; boundary={0}'.format(boundary) })
+        
+        chunk_results = None
+        if (r.status_code == requests.codes.ok):
+            chunk_results = parse_batch_response(r.headers.get('Content-Type', ''), r.content)
+            
+        if (chunk_results is None or len(chunk_results) != len(chunk)):
+            # The batch as a whole failed, so report its status for every operation
+            logger.debug('Batch failed with status %s.', r.status_code)
+            status_code = r.status_code if r.status_code != requests.codes.ok else requests.codes.server_error
+            chunk_results = [ BatchResult(status_code, None) for operation in chunk ]
+            
+        results.extend(chunk_results)
+        
+    logger.debug('Leaving send_batch.')
+    return results
+    
+# Splits operations into chunks of at most batch_size operations
+# and max_batch_bytes of request body
+def split_batch(api_endpoint, operations, batch_size):
+    chunk = []
+    chunk_bytes = 0
+    
+    for operation in operations:
+        operation_bytes = len(build_batch_part(api_endpoint, operation, 0).encode('utf-8'))
+        if (len(chunk) > 0 and
+            (len(chunk) >= batch_size or chunk_bytes + operation_bytes > max_batch_bytes)):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+            
+        chunk.append(operation)
+        chunk_bytes += operation_bytes
+        
+    if (len(chunk) > 0):
+        yield chunk
+        
+def build_batch_part(api_endpoint, operation, content_id):
+    method, url, payload = operation
+    lines = [ 'Content-Type: application/http',
+              'Content-Transfer-Encoding: binary',
+              'Content-ID: {0}'.format(content_id),
+              '',
+              '{0} {1}/{2} HTTP/1.1'.format(method.upper(), api_endpoint, url.lstrip('/')),
+              'Accept: application/json' ]
+    if (payload is None):
+        lines.append('')
+    else:
+        lines.extend([ 'Content-Type: application/json', '', payload ])
+        
+    return '\r\n'.join(lines)
+    
+def build_batch_body(api_endpoint, operations, boundary):
+    parts = [ '--{0}\r\n{1}\r\n'.format(boundary, build_batch_part(api_endpoint, operation, index))
+              for index, operation in enumerate(operations) ]
+    return '{0}--{1}--\r\n'.format(''.join(parts), boundary)
+    
+# Parses a multipart/mixed $batch response into a list of BatchResult.
+# Returns None if the response isn't a multipart response.
+def parse_batch_response(content_type, content):
+    boundary = None
+    for parameter in content_type.split(';')[1:]:
+        name, _, value = parameter.strip().partition('=')
+        if (name.lower() == 'boundary'):
+            boundary = value.strip('"')
+            
+    if (boundary is None):
+        return None
+        
+    text = content.decode('utf-8') if isinstance(content, bytes) else content
+    results = []
+    
+    for part in text.split('--{0}'.format(boundary))[1:]:
+        if (part.startswith('--')):
+            # Closing delimiter
+            break
+        results.append(parse_batch_part(part))
+        
+    return results
+    
+def parse_batch_part(part):
+    # Each part is MIME headers, a blank line, then the embedded HTTP response:
+    # a status line, headers, a blank line and the body.
+    part = part.replace('\r\n', '\n')
+    _, _, http_response = part.strip('\n').partition('\n\n')
+    head, _, body = http_response.partition('\n\n')
+    status_line = head.split('\n', 1)[0]
+    status_code = int(status_line.split(' ')[1])
+    
+    body = body.strip()
+    json_body = None
+    if (body != ''):
+        try:
+            json_body = json.loads(body)
+        except ValueError:
+            json_body = None
+            
+    return BatchResult(status_code, json_body)
     
 
 # Contacts API #    
@@ -226,10 +642,10 @@ def make_api_call(method, url, token, payload = None):
 #                 http://msdn.microsoft.com/office/office365/APi/complex-types-for-mail-contacts-calendar#UseODataqueryparameters
 def get_contacts(contact_endpoint, token, parameters = None):
     logger.debug('Entering get_contacts.')
-    logger.debug('  contact_endpoint: {0}'.format(contact_endpoint))
-    logger.debug('  token: {0}'.format(token))
+    logger.debug('  contact_endpoint: %s', contact_endpoint)
+    logger.debug('  token: %s', token)
     if (not parameters is None):
-        logger.debug('  parameters: {0}'.format(parameters))
+        logger.debug('  parameters: %s', parameters)
         
     get_contacts = '{0}/Me/Contacts'.format(contact_endpoint)
     
@@ -242,10 +658,23 @@ def get_contacts(contact_endpoint, token, parameters = None):
         logger.debug('Leaving get_contacts.')
         return None
 
-    logger.debug('Response: {0}'.format(r.json()))
+    logger.debug('Response: %s', o365logging.LazyJson(r))
     logger.debug('Leaving get_contacts.')
     return r.json()
 
+# Iterates over the contacts in the user's default contacts folder, following
+# @odata.nextLink so that every page is returned, not just the first
+#   parameters:
+#     contact_endpoint: string. The URL to the Contacts API endpoint (https://outlook.office365.com/api/v1.0)
+#     token: string. The access token
+#     parameters: string. An optional string containing query parameters to filter, sort, etc.
+#     page_size: int. An optional number of items to request per page ($top).
+#     max_items: int. An optional cap on the total number of items returned.
+#     prefetch: Boolean. Fetch the next page in the background while the current one is consumed.
+def iter_contacts(contact_endpoint, token, parameters = None, page_size = None, max_items = None, prefetch = True):
+    collection_url = build_collection_url('{0}/Me/Contacts'.format(contact_endpoint), parameters, page_size)
+    return iter_collection(collection_url, token, max_items, prefetch)
+
 # Retrieves a single contact
 #   parameters:
 #     contact_endpoint: string. The URL to the Contacts API endpoint (https://outlook.office365.com/api/v1.0)
@@ -255,11 +684,11 @@ def get_contacts(contact_endpoint, token, parameters = None):
 #                 http://msdn.microsoft.com/office/office365/APi/complex-types-for-mail-contacts-calendar#UseODataqueryparameters    
 def get_contact_by_id(contact_endpoint, token, contact_id, parameters = None):
     logger.debug('Entering get_contact_by_id.')
-    logger.debug('  contact_endpoint: {0}'.format(contact_endpoint))
-    logger.debug('  token: {0}'.format(token))
-    logger.debug('  contact_id: {0}'.format(contact_id))
+    logger.debug('  contact_endpoint: %s', contact_endpoint)
+    logger.debug('  token: %s', token)
+    logger.debug('  contact_id: %s', contact_id)
     if (not parameters is None):
-        logger.debug('  parameters: {0}'.format(parameters))
+        logger.debug('  parameters: %s', parameters)
                 
     get_contact = '{0}/Me/Contacts/{1}'.format(contact_endpoint, contact_id)
     
@@ -270,13 +699,51 @@ def get_contact_by_id(contact_endpoint, token, contact_id, parameters = None):
     r = make_api_call('GET', get_contact, token)
     
     if (r.status_code == requests.codes.ok):
-        logger.debug('Response: {0}'.format(r.json()))
+        logger.debug('Response: %s', o365logging.LazyJson(r))
         logger.debug('Leaving get_contact_by_id(.')
         return r.json()
     else:
         logger.debug('Leaving get_contact_by_id.')
         return None
         
+# Retrieves a contact only if it changed since the caller's copy was fetched.
+# The ChangeKey of the caller's copy is sent as a weak ETag in If-None-Match,
+# and an unchanged contact comes back as a 304 with no body.
+#   parameters:
+#     contact_endpoint: string. The URL to the Contacts API endpoint (https://outlook.office365.com/api/v1.0)
+#     token: string. The access token
+#     contact_id: string. The ID of the contact to retrieve.
+#     change_key: string. The ChangeKey of the caller's copy. If empty, the contact is always returned.
+#     parameters: string. An optional string containing query parameters to limit the properties returned.
+#   returns:
+#     A (status_code, contact) tuple. contact is the JSON contact for a 200, and None otherwise.
+def get_contact_if_changed(contact_endpoint, token, contact_id, change_key, parameters = None):
+    logger.debug('Entering get_contact_if_changed.')
+    logger.debug('  contact_id: %s', contact_id)
+    logger.debug('  change_key: %s', change_key)
+    
+    get_contact = '{0}/Me/Contacts/{1}'.format(contact_endpoint, contact_id)
+    
+    if (not parameters is None and
+        parameters != ''):
+        get_contact = '{0}{1}'.format(get_contact, parameters)
+        
+    extra_headers = None
+    if (change_key):
+        extra_headers = { 'If-None-Match': get_change_key_etag(change_key) }
+        
+    r = make_api_call('GET', get_contact, token, extra_headers = extra_headers)
+    
+    logger.debug('Leaving get_contact_if_changed.')
+    if (r.status_code == requests.codes.ok):
+        return (r.status_code, r.json())
+    
+    return (r.status_code, None)
+    
+# Office 365 reports an item's ChangeKey as its weak ETag (@odata.etag)
+def get_change_key_etag(change_key):
+    return 'W/"{0}"'.format(change_key)
+    
 # Deletes a single contact
 #   parameters:
 #     contact_endpoint: string. The URL to the Contacts API endpoint (https://outlook.office365.com/api/v1.0)
@@ -284,9 +751,9 @@ def get_contact_by_id(contact_endpoint, token, contact_id, parameters = None):
 #     contact_id: string. The ID of the contact to delete.
 def delete_contact(contact_endpoint, token, contact_id):
     logger.debug('Entering delete_contact.')
-    logger.debug('  contact_endpoint: {0}'.format(contact_endpoint))
-    logger.debug('  token: {0}'.format(token))
-    logger.debug('  contact_id: {0}'.format(contact_id))
+    logger.debug('  contact_endpoint: %s', contact_endpoint)
+    logger.debug('  token: %s', token)
+    logger.debug('  contact_id: %s', contact_id)
                 
     delete_contact = '{0}/Me/Contacts/{1}'.format(contact_endpoint, contact_id)
     
@@ -302,21 +769,34 @@ def delete_contact(contact_endpoint, token, contact_id):
 #     token: string. The access token
 #     contact_id: string. The ID of the contact to update.    
 #     update_payload: string. A JSON representation of the properties to update.
-def update_contact(contact_endpoint, token, contact_id, update_payload):
-    logger.debug('Entering update_contact.')
-    logger.debug('  contact_endpoint: {0}'.format(contact_endpoint))
-    logger.debug('  token: {0}'.format(token))
-    logger.debug('  contact_id: {0}'.format(contact_id))
-    logger.debug('  update_payload: {0}'.format(update_payload))
+#     change_key: string. Optional. The ChangeKey of the version the update was
+#                 made from. If the contact has changed since, the update is
+#                 rejected with a 412 status instead of overwriting the change.
+def update_contact(contact_endpoint, token, contact_id, update_payload, change_key = None):
+    return patch_contact(contact_endpoint, token, contact_id, update_payload, change_key).status_code
+
+# Updates a single contact like update_contact, but returns the response.
+# Its body is the updated contact, with the ChangeKey the update gave it.
+def patch_contact(contact_endpoint, token, contact_id, update_payload, change_key = None):
+    logger.debug('Entering patch_contact.')
+    logger.debug('  contact_endpoint: %s', contact_endpoint)
+    logger.debug('  token: %s', token)
+    logger.debug('  contact_id: %s', contact_id)
+    logger.debug('  update_payload: %s', update_payload)
+    logger.debug('  change_key: %s', change_key)
                 
-    update_contact = '{0}/Me/Contacts/{1}'.format(contact_endpoint, contact_id)
+    patch_contact = '{0}/Me/Contacts/{1}'.format(contact_endpoint, contact_id)
     
-    r = make_api_call('PATCH', update_contact, token, update_payload)
+    extra_headers = None
+    if (change_key):
+        extra_headers = { 'If-Match': get_change_key_etag(change_key) }
+        
+    r = make_api_call('PATCH', patch_contact, token, update_payload, extra_headers)
     
-    logger.debug('Response: {0}'.format(r.json()))
-    logger.debug('Leaving update_contact.')
+    logger.debug('Response: %s', o365logging.LazyJson(r))
+    logger.debug('Leaving patch_contact.')
     
-    return r.status_code
+    return r
 
 # Creates a contact
 #   parameters:
@@ -325,19 +805,56 @@ def update_contact(contact_endpoint, token, contact_id, update_payload):
 #     contact_payload: string. A JSON representation of the new contact.    
 def create_contact(contact_endpoint, token, contact_payload):
     logger.debug('Entering create_contact.')
-    logger.debug('  contact_endpoint: {0}'.format(contact_endpoint))
-    logger.debug('  token: {0}'.format(token))
-    logger.debug('  contact_payload: {0}'.format(contact_payload))
+    logger.debug('  contact_endpoint: %s', contact_endpoint)
+    logger.debug('  token: %s', token)
+    logger.debug('  contact_payload: %s', contact_payload)
                 
     create_contact = '{0}/Me/Contacts'.format(contact_endpoint)
     
     r = make_api_call('POST', create_contact, token, contact_payload)
     
-    logger.debug('Response: {0}'.format(r.json()))
+    logger.debug('Response: %s', o365logging.LazyJson(r))
     logger.debug('Leaving create_contact.')
     
     return r.status_code
     
+# Creates contacts in bulk with $batch requests
+#   parameters:
+#     contact_endpoint: string. The URL to the Contacts API endpoint (https://outlook.office365.com/api/v1.0)
+#     token: string. The access token 
+#     contact_payloads: list. JSON representations of the new contacts.
+#     batch_size: int. The maximum number of contacts per $batch request.
+#   returns:
+#     A list of BatchResult in the same order as contact_payloads. Per MSDN, success is a 201 status,
+#     and the body is the new contact.
+def create_contacts(contact_endpoint, token, contact_payloads, batch_size = max_batch_size):
+    operations = [ ('POST', 'Me/Contacts', payload) for payload in contact_payloads ]
+    return send_batch(contact_endpoint, token, operations, batch_size)
+    
+# Updates contacts in bulk with $batch requests
+#   parameters:
+#     contact_endpoint: string. The URL to the Contacts API endpoint (https://outlook.office365.com/api/v1.0)
+#     token: string. The access token 
+#     updates: list. (contact_id, update_payload) tuples.
+#     batch_size: int. The maximum number of contacts per $batch request.
+#   returns:
+#     A list of BatchResult in the same order as updates. Per MSDN, success is a 200 status.
+def update_contacts(contact_endpoint, token, updates, batch_size = max_batch_size):
+    operations = [ ('PATCH', 'Me/Contacts/{0}'.format(contact_id), payload) for contact_id, payload in updates ]
+    return send_batch(contact_endpoint, token, operations, batch_size)
+    
+# Deletes contacts in bulk with $batch requests
+#   parameters:
+#     contact_endpoint: string. The URL to the Contacts API endpoint (https://outlook.office365.com/api/v1.0)
+#     token: string. The access token 
+#     contact_ids: list. The IDs of the contacts to delete.
+#     batch_size: int. The maximum number of contacts per $batch request.
+#   returns:
+#     A list of BatchResult in the same order as contact_ids. Per MSDN, success is a 204 status.
+def delete_contacts(contact_endpoint, token, contact_ids, batch_size = max_batch_size):
+    operations = [ ('DELETE', 'Me/Contacts/{0}'.format(contact_id), None) for contact_id in contact_ids ]
+    return send_batch(contact_endpoint, token, operations, batch_size)
+    
 # Mail API #
     
 # Retrieves a set of messages from the user's Inbox
@@ -348,10 +865,10 @@ def create_contact(contact_endpoint, token, contact_payload):
 #                 http://msdn.microsoft.com/office/office365/APi/complex-types-for-mail-contacts-calendar#UseODataqueryparameters
 def get_messages(mail_endpoint, token, parameters = None):
     logger.debug('Entering get_messages.')
-    logger.debug('  mail_endpoint: {0}'.format(mail_endpoint))
-    logger.debug('  token: {0}'.format(token))
+    logger.debug('  mail_endpoint: %s', mail_endpoint)
+    logger.debug('  token: %s', token)
     if (not parameters is None):
-        logger.debug('  parameters: {0}'.format(parameters))
+        logger.debug('  parameters: %s', parameters)
                 
     get_messages = '{0}/Me/Messages'.format(mail_endpoint)
     
@@ -364,10 +881,23 @@ def get_messages(mail_endpoint, token, parameters = None):
         logger.debug('Leaving get_messages.')
         return None
 
-    logger.debug('Response: {0}'.format(r.json()))
+    logger.debug('Response: %s', o365logging.LazyJson(r))
     logger.debug('Leaving get_messages.')
     return r.json()
 
+# Iterates over the messages in the user's mailbox, following
+# @odata.nextLink so that every page is returned, not just the first
+#   parameters:
+#     mail_endpoint: string. The URL to the Mail API endpoint (https://outlook.office365.com/api/v1.0)
+#     token: string. The access token
+#     parameters: string. An optional string containing query parameters to filter, sort, etc.
+#     page_size: int. An optional number of items to request per page ($top).
+#     max_items: int. An optional cap on the total number of items returned.
+#     prefetch: Boolean. Fetch the next page in the background while the current one is consumed.
+def iter_messages(mail_endpoint, token, parameters = None, page_size = None, max_items = None, prefetch = True):
+    collection_url = build_collection_url('{0}/Me/Messages'.format(mail_endpoint), parameters, page_size)
+    return iter_collection(collection_url, token, max_items, prefetch)
+
 # Retrieves a single message
 #   parameters:
 #     mail_endpoint: string. The URL to the Mail API endpoint (https://outlook.office365.com/api/v1.0)
@@ -377,11 +907,11 @@ def get_messages(mail_endpoint, token, parameters = None):
 #                 http://msdn.microsoft.com/office/office365/APi/complex-types-for-mail-contacts-calendar#UseODataqueryparameters    
 def get_message_by_id(mail_endpoint, token, message_id, parameters = None):
     logger.debug('Entering get_message_by_id.')
-    logger.debug('  mail_endpoint: {0}'.format(mail_endpoint))
-    logger.debug('  token: {0}'.format(token))
-    logger.debug('  message_id: {0}'.format(message_id))
+    logger.debug('  mail_endpoint: %s', mail_endpoint)
+    logger.debug('  token: %s', token)
+    logger.debug('  message_id: %s', message_id)
     if (not parameters is None):
-        logger.debug('  parameters: {0}'.format(parameters))
+        logger.debug('  parameters: %s', parameters)
                 
     get_message = '{0}/Me/Messages/{1}'.format(mail_endpoint, message_id)
     
@@ -392,7 +922,7 @@ def get_message_by_id(mail_endpoint, token, message_id, parameters = None):
     r = make_api_call('GET', get_message, token)
     
     if (r.status_code == requests.codes.ok):
-        logger.debug('Response: {0}'.format(r.json()))
+        logger.debug('Response: %s', o365logging.LazyJson(r))
         logger.debug('Leaving get_message_by_id.')
         return r.json()
     else:
@@ -406,9 +936,9 @@ def get_message_by_id(mail_endpoint, token, message_id, parameters = None):
 #     message_id: string. The ID of the message to delete.
 def delete_message(mail_endpoint, token, message_id):
     logger.debug('Entering delete_message.')
-    logger.debug('  mail_endpoint: {0}'.format(mail_endpoint))
-    logger.debug('  token: {0}'.format(token))
-    logger.debug('  message_id: {0}'.format(message_id))
+    logger.debug('  mail_endpoint: %s', mail_endpoint)
+    logger.debug('  token: %s', token)
+    logger.debug('  message_id: %s', message_id)
                 
     delete_message = '{0}/Me/Messages/{1}'.format(mail_endpoint, message_id)
     
@@ -426,16 +956,16 @@ def delete_message(mail_endpoint, token, message_id):
 #     update_payload: string. A JSON representation of the properties to update.
 def update_message(mail_endpoint, token, message_id, update_payload):
     logger.debug('Entering update_message.')
-    logger.debug('  mail_endpoint: {0}'.format(mail_endpoint))
-    logger.debug('  token: {0}'.format(token))
-    logger.debug('  message_id: {0}'.format(message_id))
-    logger.debug('  update_payload: {0}'.format(update_payload))
+    logger.debug('  mail_endpoint: %s', mail_endpoint)
+    logger.debug('  token: %s', token)
+    logger.debug('  message_id: %s', message_id)
+    logger.debug('  update_payload: %s', update_payload)
                 
     update_message = '{0}/Me/Messages/{1}'.format(mail_endpoint, message_id)
     
     r = make_api_call('PATCH', update_message, token, update_payload)
 
-    logger.debug('Response: {0}'.format(r.json()))
+    logger.debug('Response: %s', o365logging.LazyJson(r))
     logger.debug('Leaving update_message.')
     
     return r.status_code
@@ -447,15 +977,15 @@ def update_message(mail_endpoint, token, message_id, update_payload):
 #     message_payload: string. A JSON representation of the new message.    
 def create_message(mail_endpoint, token, message_payload):
     logger.debug('Entering create_message.')
-    logger.debug('  mail_endpoint: {0}'.format(mail_endpoint))
-    logger.debug('  token: {0}'.format(token))
-    logger.debug('  message_payload: {0}'.format(message_payload))
+    logger.debug('  mail_endpoint: %s', mail_endpoint)
+    logger.debug('  token: %s', token)
+    logger.debug('  message_payload: %s', message_payload)
                 
     create_message = '{0}/Me/Messages'.format(mail_endpoint)
     
     r = make_api_call('POST', create_message, token, message_payload)
     
-    logger.debug('Response: {0}'.format(r.json()))
+    logger.debug('Response: %s', o365logging.LazyJson(r))
     logger.debug('Leaving create_message.')
     
     return r.status_code   
@@ -467,9 +997,9 @@ def create_message(mail_endpoint, token, message_payload):
 #     message_id: string. The ID of the message to send.    
 def send_draft_message(mail_endpoint, token, message_id):
     logger.debug('Entering send_draft_message.')
-    logger.debug('  mail_endpoint: {0}'.format(mail_endpoint))
-    logger.debug('  token: {0}'.format(token))
-    logger.debug('  message_id: {0}'.format(message_id))
+    logger.debug('  mail_endpoint: %s', mail_endpoint)
+    logger.debug('  token: %s', token)
+    logger.debug('  message_id: %s', message_id)
     
     send_message = '{0}/Me/Messages/{1}/Send'.format(mail_endpoint, message_id)
     
@@ -486,10 +1016,10 @@ def send_draft_message(mail_endpoint, token, message_id):
 #     save_to_sentitems: boolean. True = save a copy in sent items, False = don't.    
 def send_new_message(mail_endpoint, token, message_payload, save_to_sentitems = True):
     logger.debug('Entering send_new_message.')
-    logger.debug('  mail_endpoint: {0}'.format(mail_endpoint))
-    logger.debug('  token: {0}'.format(token))
-    logger.debug('  message_payload: {0}'.format(message_payload))
-    logger.debug('  save_to_sentitems: {0}'.format(save_to_sentitems))
+    logger.debug('  mail_endpoint: %s', mail_endpoint)
+    logger.debug('  token: %s', token)
+    logger.debug('  message_payload: %s', message_payload)
+    logger.debug('  save_to_sentitems: %s', save_to_sentitems)
     
     send_message = '{0}/Me/SendMail'.format(mail_endpoint)
     
@@ -499,7 +1029,7 @@ def send_new_message(mail_endpoint, token, message_payload, save_to_sentitems =
     
     send_message_payload = json.dumps(send_message_json)
     
-    logger.debug('Created payload for send: {0}'.format(send_message_payload))
+    logger.debug('Created payload for send: %s', send_message_payload)
     
     r = make_api_call('POST', send_message, token, send_message_payload)
     
@@ -516,10 +1046,10 @@ def send_new_message(mail_endpoint, token, message_payload, save_to_sentitems =
 #                 http://msdn.microsoft.com/office/office365/APi/complex-types-for-mail-contacts-calendar#UseODataqueryparameters
 def get_events(calendar_endpoint, token, parameters = None):
     logger.debug('Entering get_events.')
-    logger.debug('  calendar_endpoint: {0}'.format(calendar_endpoint))
-    logger.debug('  token: {0}'.format(token))
+    logger.debug('  calendar_endpoint: %s', calendar_endpoint)
+    logger.debug('  token: %s', token)
     if (not parameters is None):
-        logger.debug('  parameters: {0}'.format(parameters))
+        logger.debug('  parameters: %s', parameters)
                 
     get_events = '{0}/Me/Events'.format(calendar_endpoint)
     
@@ -532,10 +1062,23 @@ def get_events(calendar_endpoint, token, parameters = None):
         logger.debug('Leaving get_events.')
         return None
 
-    logger.debug('Response: {0}'.format(r.json()))
+    logger.debug('Response: %s', o365logging.LazyJson(r))
     logger.debug('Leaving get_events.')
     return r.json()
 
+# Iterates over the events in the user's calendar, following
+# @odata.nextLink so that every page is returned, not just the first
+#   parameters:
+#     calendar_endpoint: string. The URL to the Calendar API endpoint (https://outlook.office365.com/api/v1.0)
+#     token: string. The access token
+#     parameters: string. An optional string containing query parameters to filter, sort, etc.
+#     page_size: int. An optional number of items to request per page ($top).
+#     max_items: int. An optional cap on the total number of items returned.
+#     prefetch: Boolean. Fetch the next page in the background while the current one is consumed.
+def iter_events(calendar_endpoint, token, parameters = None, page_size = None, max_items = None, prefetch = True):
+    collection_url = build_collection_url('{0}/Me/Events'.format(calendar_endpoint), parameters, page_size)
+    return iter_collection(collection_url, token, max_items, prefetch)
+
 # Retrieves a single event
 #   parameters:
 #     calendar_endpoint: string. The URL to the Calendar API endpoint (https://outlook.office365.com/api/v1.0)
@@ -545,11 +1088,11 @@ def get_events(calendar_endpoint, token, parameters = None):
 #                 http://msdn.microsoft.com/office/office365/APi/complex-types-for-mail-contacts-calendar#UseODataqueryparameters    
 def get_event_by_id(calendar_endpoint, token, event_id, parameters = None):
     logger.debug('Entering get_event_by_id.')
-    logger.debug('  calendar_endpoint: {0}'.format(calendar_endpoint))
-    logger.debug('  token: {0}'.format(token))
-    logger.debug('  event_id: {0}'.format(event_id))
+    logger.debug('  calendar_endpoint: %s', calendar_endpoint)
+    logger.debug('  token: %s', token)
+    logger.debug('  event_id: %s', event_id)
     if (not parameters is None):
-        logger.debug('  parameters: {0}'.format(parameters))
+        logger.debug('  parameters: %s', parameters)
                 
     get_event = '{0}/Me/Events/{1}'.format(calendar_endpoint, event_id)
     
@@ -560,7 +1103,7 @@ def get_event_by_id(calendar_endpoint, token, event_id, parameters = None):
     r = make_api_call('GET', get_event, token)
     
     if (r.status_code == requests.codes.ok):
-        logger.debug('Response: {0}'.format(r.json()))
+        logger.debug('Response: %s', o365logging.LazyJson(r))
         logger.debug('Leaving get_event_by_id.')
         return r.json()
     else:
@@ -574,9 +1117,9 @@ def get_event_by_id(calendar_endpoint, token, event_id, parameters = None):
 #     event_id: string. The ID of the event to delete.
 def delete_event(calendar_endpoint, token, event_id):
     logger.debug('Entering delete_event.')
-    logger.debug('  calendar_endpoint: {0}'.format(calendar_endpoint))
-    logger.debug('  token: {0}'.format(token))
-    logger.debug('  event_id: {0}'.format(event_id))
+    logger.debug('  calendar_endpoint: %s', calendar_endpoint)
+    logger.debug('  token: %s', token)
+    logger.debug('  event_id: %s', event_id)
                 
     delete_event = '{0}/Me/Events/{1}'.format(calendar_endpoint, event_id)
     
@@ -594,16 +1137,16 @@ def delete_event(calendar_endpoint, token, event_id):
 #     update_payload: string. A JSON representation of the properties to update.
 def update_event(calendar_endpoint, token, event_id, update_payload):
     logger.debug('Entering update_event.')
-    logger.debug('  calendar_endpoint: {0}'.format(calendar_endpoint))
-    logger.debug('  token: {0}'.format(token))
-    logger.debug('  event_id: {0}'.format(event_id))
-    logger.debug('  update_payload: {0}'.format(update_payload))
+    logger.debug('  calendar_endpoint: %s', calendar_endpoint)
+    logger.debug('  token: %s', token)
+    logger.debug('  event_id: %s', event_id)
+    logger.debug('  update_payload: %s', update_payload)
                 
     update_event = '{0}/Me/Events/{1}'.format(calendar_endpoint, event_id)
     
     r = make_api_call('PATCH', update_event, token, update_payload)
 
-    logger.debug('Response: {0}'.format(r.json()))
+    logger.debug('Response: %s', o365logging.LazyJson(r))
     logger.debug('Leaving update_event.')
     
     return r.status_code
@@ -615,15 +1158,15 @@ def update_event(calendar_endpoint, token, event_id, update_payload):
 #     event_payload: string. A JSON representation of the new event.    
 def create_event(calendar_endpoint, token, event_payload):
     logger.debug('Entering create_event.')
-    logger.debug('  calendar_endpoint: {0}'.format(calendar_endpoint))
-    logger.debug('  token: {0}'.format(token))
-    logger.debug('  event_payload: {0}'.format(event_payload))
+    logger.debug('  calendar_endpoint: %s', calendar_endpoint)
+    logger.debug('  token: %s', token)
+    logger.debug('  event_payload: %s', event_payload)
                 
     create_event = '{0}/Me/Events'.format(calendar_endpoint)
     
     r = make_api_call('POST', create_event, token, event_payload)
     
-    logger.debug('Response: {0}'.format(r.json()))
+    logger.debug('Response: %s', o365logging.LazyJson(r))
     logger.debug('Leaving create_event.')
     
     return r.status_code   
@@ -0,0 +1,415 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+# asyncio versions of the o365service functions, for workers that run an
+# event loop. Each function mirrors the blocking function of the same name
+# in contacts.o365service, but is a coroutine, and all of them share one
+# aiohttp connection pool. Requires Python 3.6 and aiohttp.
+import asyncio
+import json
+import logging
+import time
+import uuid
+import aiohttp
+from contacts.clientreg import client_registration
+import contacts.o365service as o365service
+import contacts.o365throttle as o365throttle
+import contacts.o365metrics as o365metrics
+
+# Used for debug logging
+logger = logging.getLogger('contacts')
+
+# Total number of connections in the shared pool
+pool_size = 100
+# Number of connections to any single host
+pool_size_per_host = 50
+# Connect and read timeouts in seconds
+connect_timeout = 5
+read_timeout = 30
+
+_session = None
+
+# The parts of an HTTP response the service functions need. The body is
+# read before the connection goes back to the pool, so callers can use
+# the response outside of any context manager.
+class ApiResponse:
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+# Returns the shared aiohttp session, creating it on first use. The session
+# belongs to the event loop that was running when it was created.
+def get_session():
+    global _session
+    if (_session is None or _session.closed):
+        connector = aiohttp.TCPConnector(limit = pool_size, limit_per_host = pool_size_per_host)
+        timeout = aiohttp.ClientTimeout(connect = connect_timeout, sock_read = read_timeout)
+        _session = aiohttp.ClientSession(connector = connector, timeout = timeout)
+    return _session
+
+# Replaces the shared session, for example with one pointed at a local
+# stand-in server. Returns the previous session.
+def set_session(session):
+    global _session
+    previous = _session
+    _session = session
+    return previous
+
+# Closes the shared session and its connections
+async def close():
+    global _session
+    if (not _session is None):
+        await _session.close()
+        _session = None
+
+async def send_request(method, url, **kwargs):
+    if (not o365service.verifySSL):
+        kwargs['ssl'] = False
+    async with get_session().request(method, url, **kwargs) as response:
+        content = await response.read()
+        return ApiResponse(response.status, response.headers, content)
+
+# Async version of o365service.get_access_info_from_authcode
+async def get_access_info_from_authcode(auth_code, redirect_uri):
+    logger.debug('Entering get_access_info_from_authcode (async).')
+    post_data = { 'grant_type' : 'authorization_code',
+                  'code' : auth_code,
+                  'redirect_uri' : redirect_uri,
+                  'resource' : o365service.discovery_resource,
+                  'client_id' : client_registration.client_id(),
+                  'client_secret' : client_registration.client_secret() }
+    r = await send_request('POST', o365service.access_token_url, data = post_data)
+
+    try:
+        token_response = r.json()
+        discovery_service_token = token_response['access_token']
+    except (ValueError, KeyError):
+        logger.debug('No access token in response, leaving get_access_info_from_authcode (async).')
+        return None
+
+    claims = o365service.parse_token(discovery_service_token)
+    if (not isinstance(claims, dict) or not 'upn' in claims):
+        logger.debug('Token could not be parsed, leaving get_access_info_from_authcode (async).')
+        return None
+
+    discovery_result = o365service.get_cached_discovery(claims.get('tid'), claims.get('upn'))
+    if (discovery_result is None):
+        discovery_result = await do_discovery(discovery_service_token)
+        o365service.store_discovery_result(claims.get('tid'), claims.get('upn'), discovery_result)
+    discovery_result['refresh_token'] = token_response['refresh_token']
+    discovery_result['user_email'] = claims['upn']
+
+    logger.debug('Leaving get_access_info_from_authcode (async).')
+    return discovery_result
+
+# Async version of o365service.do_discovery
+async def do_discovery(token):
+    logger.debug('Entering do_discovery (async).')
+    headers = { 'Authorization' : 'Bearer {0}'.format(token),
+                'Accept' : 'application/json' }
+    r = await send_request('GET', o365service.discovery_endpoint, headers = headers)
+
+    discovery_result = {}
+    for entry in r.json()['value']:
+        capability = entry['capability']
+        discovery_result['{0}_resource_id'.format(capability)] = entry['serviceResourceId']
+        discovery_result['{0}_api_endpoint'.format(capability)] = entry['serviceEndpointUri']
+
+    logger.debug('Leaving do_discovery (async).')
+    return discovery_result
+
+# Async version of o365service.get_access_token_from_refresh_token
+async def get_access_token_from_refresh_token(refresh_token, resource_id):
+    logger.debug('Entering get_access_token_from_refresh_token (async).')
+    post_data = { 'grant_type' : 'refresh_token',
+                  'client_id' : client_registration.client_id(),
+                  'client_secret' : client_registration.client_secret(),
+                  'refresh_token' : refresh_token,
+                  'resource' : resource_id }
+    r = await send_request('POST', o365service.access_token_url, data = post_data)
+
+    logger.debug('Leaving get_access_token_from_refresh_token (async).')
+    return r.json()
+
+# Async version of o365service.make_api_call. Sends the same
+# client-request-id instrumentation headers, and follows the same
+# retry policy and per-mailbox rate limit.
+async def make_api_call(method, url, token, payload = None, extra_headers = None, idempotent = None):
+    headers = { 'User-Agent' : 'pythoncontacts/1.2',
+                'Authorization' : 'Bearer {0}'.format(token),
+                'Accept' : 'application/json' }
+
+    request_id = str(uuid.uuid4())
+    instrumentation = { 'client-request-id' : request_id,
+                        'return-client-request-id' : 'true' }
+
+    headers.update(instrumentation)
+
+    method = method.upper()
+    if (method == 'PATCH' or method == 'POST'):
+        headers.update({ 'Content-Type' : 'application/json' })
+    if (not extra_headers is None):
+        headers.update(extra_headers)
+
+    retry_policy = o365throttle.retry_policy
+    mailbox = o365service.get_mailbox(token)
+    attempt = 0
+    started = time.perf_counter()
+
+    while (True):
+        wait = o365throttle.rate_limiter.reserve(mailbox)
+        if (wait > 0):
+            await asyncio.sleep(wait)
+
+        logger.debug('Sending request id: %s, attempt %s', request_id, attempt + 1)
+        try:
+            response = await send_request(method, url, headers = headers, data = payload)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # A failed connect never reached the service, anything else might have
+            if (attempt >= retry_policy.max_retries or
+                not (isinstance(e, aiohttp.ClientConnectorError) or retry_policy.is_idempotent(method, idempotent))):
+                o365metrics.record_call(method, url, started, None, payload, attempt + 1, request_id, e)
+                raise
+            delay = retry_policy.get_delay(attempt)
+        else:
+            logger.debug('Request id %s completed. Server id: %s, Status: %s',
+                         request_id, response.headers.get('request-id'), response.status_code)
+            if (not retry_policy.should_retry(method, response.status_code, response.headers, attempt, idempotent)):
+                o365metrics.record_call(method, url, started, response, payload, attempt + 1, request_id)
+                return response
+            delay = retry_policy.get_delay(attempt, response.headers)
+            if (delay is None):
+                o365metrics.record_call(method, url, started, response, payload, attempt + 1, request_id)
+                return response
+
+        await asyncio.sleep(delay)
+        attempt += 1
+
+# Paging #
+
+async def get_page(url, token):
+    r = await make_api_call('GET', url, token)
+
+    if (r.status_code != 200):
+        raise o365service.ApiError(r.status_code, url)
+
+    return r.json()
+
+# Async version of o365service.iter_collection. Use with "async for".
+# The next page is requested as soon as the current one arrives.
+async def iter_collection(url, token, max_items = None, prefetch = True):
+    remaining = max_items
+    pending = None
+    next_url = url
+
+    try:
+        while (not next_url is None):
+            if (pending is None):
+                page = await get_page(next_url, token)
+            else:
+                page = await pending
+                pending = None
+
+            items = page.get('value', [])
+            next_url = page.get('@odata.nextLink')
+
+            if (not remaining is None and len(items) >= remaining):
+                items = items[:remaining]
+                next_url = None
+
+            if (prefetch and not next_url is None):
+                pending = asyncio.ensure_future(get_page(next_url, token))
+
+            for item in items:
+                yield item
+
+            if (not remaining is None):
+                remaining -= len(items)
+    finally:
+        # The caller stopped early, don't leave the prefetch running
+        if (not pending is None):
+            pending.cancel()
+
+# Batching #
+
+# Async version of o365service.send_batch
+async def send_batch(api_endpoint, token, operations, batch_size = o365service.max_batch_size):
+    batch_url = '{0}/$batch'.format(api_endpoint)
+    results = []
+
+    for chunk in o365service.split_batch(api_endpoint, operations, batch_size):
+        boundary = 'batch_{0}'.format(uuid.uuid4())
+        body = o365service.build_batch_body(api_endpoint, chunk, boundary)
+
+        r = await make_api_call('POST', batch_url, token, body,
+                                { 'Content-Type' : 'multipart/mixed; boundary={0}'.format(boundary) })
+
+        chunk_results = None
+        if (r.status_code == 200):
+            chunk_results = o365service.parse_batch_response(r.headers.get('Content-Type', ''), r.content)
+
+        if (chunk_results is None or len(chunk_results) != len(chunk)):
+            status_code = r.status_code if r.status_code != 200 else 500
+            chunk_results = [ o365service.BatchResult(status_code, None) for operation in chunk ]
+
+        results.extend(chunk_results)
+
+    return results
+
+# Shared implementations of the CRUD functions. Each API (Contacts,
+# Mail, Calendar) uses the same patterns on a different collection.
+
+async def get_items(api_endpoint, collection, token, parameters = None):
+    url = o365service.build_collection_url('{0}/Me/{1}'.format(api_endpoint, collection), parameters)
+    r = await make_api_call('GET', url, token)
+
+    if (r.status_code == 401):
+        return None
+
+    return r.json()
+
+async def get_item_by_id(api_endpoint, collection, token, item_id, parameters = None):
+    url = o365service.build_collection_url('{0}/Me/{1}/{2}'.format(api_endpoint, collection, item_id), parameters)
+    r = await make_api_call('GET', url, token)
+
+    if (r.status_code == 200):
+        return r.json()
+
+    return None
+
+async def delete_item(api_endpoint, collection, token, item_id):
+    r = await make_api_call('DELETE', '{0}/Me/{1}/{2}'.format(api_endpoint, collection, item_id), token)
+    return r.status_code
+
+async def update_item(api_endpoint, collection, token, item_id, update_payload):
+    r = await make_api_call('PATCH', '{0}/Me/{1}/{2}'.format(api_endpoint, collection, item_id), token, update_payload)
+    return r.status_code
+
+async def create_item(api_endpoint, collection, token, payload):
+    r = await make_api_call('POST', '{0}/Me/{1}'.format(api_endpoint, collection), token, payload)
+    return r.status_code
+
+def iter_items(api_endpoint, collection, token, parameters, page_size, max_items, prefetch):
+    url = o365service.build_collection_url('{0}/Me/{1}'.format(api_endpoint, collection), parameters, page_size)
+    return iter_collection(url, token, max_items, prefetch)
+
+# Contacts API #
+
+async def get_contacts(contact_endpoint, token, parameters = None):
+    return await get_items(contact_endpoint, 'Contacts', token, parameters)
+
+def iter_contacts(contact_endpoint, token, parameters = None, page_size = None, max_items = None, prefetch = True):
+    return iter_items(contact_endpoint, 'Contacts', token, parameters, page_size, max_items, prefetch)
+
+async def get_contact_by_id(contact_endpoint, token, contact_id, parameters = None):
+    return await get_item_by_id(contact_endpoint, 'Contacts', token, contact_id, parameters)
+
+async def get_contact_if_changed(contact_endpoint, token, contact_id, change_key, parameters = None):
+    url = o365service.build_collection_url('{0}/Me/Contacts/{1}'.format(contact_endpoint, contact_id), parameters)
+    extra_headers = None
+    if (change_key):
+        extra_headers = { 'If-None-Match': o365service.get_change_key_etag(change_key) }
+    r = await make_api_call('GET', url, token, extra_headers = extra_headers)
+
+    if (r.status_code == 200):
+        return (r.status_code, r.json())
+
+    return (r.status_code, None)
+
+async def delete_contact(contact_endpoint, token, contact_id):
+    return await delete_item(contact_endpoint, 'Contacts', token, contact_id)
+
+async def update_contact(contact_endpoint, token, contact_id, update_payload, change_key = None):
+    extra_headers = None
+    if (change_key):
+        extra_headers = { 'If-Match': o365service.get_change_key_etag(change_key) }
+    r = await make_api_call('PATCH', '{0}/Me/Contacts/{1}'.format(contact_endpoint, contact_id), token, update_payload, extra_headers)
+    return r.status_code
+
+async def create_contact(contact_endpoint, token, contact_payload):
+    return await create_item(contact_endpoint, 'Contacts', token, contact_payload)
+
+async def create_contacts(contact_endpoint, token, contact_payloads, batch_size = o365service.max_batch_size):
+    operations = [ ('POST', 'Me/Contacts', payload) for payload in contact_payloads ]
+    return await send_batch(contact_endpoint, token, operations, batch_size)
+
+async def update_contacts(contact_endpoint, token, updates, batch_size = o365service.max_batch_size):
+    operations = [ ('PATCH', 'Me/Contacts/{0}'.format(contact_id), payload) for contact_id, payload in updates ]
+    return await send_batch(contact_endpoint, token, operations, batch_size)
+
+async def delete_contacts(contact_endpoint, token, contact_ids, batch_size = o365service.max_batch_size):
+    operations = [ ('DELETE', 'Me/Contacts/{0}'.format(contact_id), None) for contact_id in contact_ids ]
+    return await send_batch(contact_endpoint, token, operations, batch_size)
+
+# Mail API #
+
+async def get_messages(mail_endpoint, token, parameters = None):
+    return await get_items(mail_endpoint, 'Messages', token, parameters)
+
+def iter_messages(mail_endpoint, token, parameters = None, page_size = None, max_items = None, prefetch = True):
+    return iter_items(mail_endpoint, 'Messages', token, parameters, page_size, max_items, prefetch)
+
+async def get_message_by_id(mail_endpoint, token, message_id, parameters = None):
+    return await get_item_by_id(mail_endpoint, 'Messages', token, message_id, parameters)
+
+async def delete_message(mail_endpoint, token, message_id):
+    return await delete_item(mail_endpoint, 'Messages', token, message_id)
+
+async def update_message(mail_endpoint, token, message_id, update_payload):
+    return await update_item(mail_endpoint, 'Messages', token, message_id, update_payload)
+
+async def create_message(mail_endpoint, token, message_payload):
+    return await create_item(mail_endpoint, 'Messages', token, message_payload)
+
+async def send_draft_message(mail_endpoint, token, message_id):
+    r = await make_api_call('POST', '{0}/Me/Messages/{1}/Send'.format(mail_endpoint, message_id), token)
+    return r.status_code
+
+async def send_new_message(mail_endpoint, token, message_payload, save_to_sentitems = True):
+    send_message_json = { 'Message' : json.loads(message_payload),
+                          'SaveToSentItems' : str(save_to_sentitems).lower() }
+    r = await make_api_call('POST', '{0}/Me/SendMail'.format(mail_endpoint), token, json.dumps(send_message_json))
+    return r.status_code
+
+# Calendar API #
+
+async def get_events(calendar_endpoint, token, parameters = None):
+    return await get_items(calendar_endpoint, 'Events', token, parameters)
+
+def iter_events(calendar_endpoint, token, parameters = None, page_size = None, max_items = None, prefetch = True):
+    return iter_items(calendar_endpoint, 'Events', token, parameters, page_size, max_items, prefetch)
+
+async def get_event_by_id(calendar_endpoint, token, event_id, parameters = None):
+    return await get_item_by_id(calendar_endpoint, 'Events', token, event_id, parameters)
+
+async def delete_event(calendar_endpoint, token, event_id):
+    return await delete_item(calendar_endpoint, 'Events', token, event_id)
+
+async def update_event(calendar_endpoint, token, event_id, update_payload):
+    return await update_item(calendar_endpoint, 'Events', token, event_id, update_payload)
+
+async def create_event(calendar_endpoint, token, event_payload):
+    return await create_item(calendar_endpoint, 'Events', token, event_payload)
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,225 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from email.utils import parsedate_to_datetime
+import datetime
+import random
+import threading
+import time
+import logging
+import requests
+
+# Used for debug logging
+logger = logging.getLogger('contacts')
+
+# Decides whether a failed API call is retried, and how long to wait first.
+# Waits grow exponentially with full jitter, so clients that were throttled
+# together don't all come back at the same moment. A Retry-After header from
+# the service always wins over the computed wait.
+class RetryPolicy:
+    #   parameters:
+    #     max_retries: int. Retries after the first attempt. 0 disables retries.
+    #     base_delay: float. The wait in seconds before the first retry, before jitter.
+    #     max_delay: float. The longest computed wait in seconds.
+    #     max_retry_after: float. Give up if the service asks us to wait longer than this.
+    #     max_total_delay: float. Give up rather than wait longer than this in total
+    #                      across a call's retries. None for no limit.
+    def __init__(self, max_retries = 4, base_delay = 0.5, max_delay = 30.0, max_retry_after = 120.0,
+                 max_total_delay = None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.max_total_delay = max_total_delay
+
+    # Statuses that mean "try again later"
+    retry_statuses = frozenset([ 429, 502, 503, 504 ])
+    # Methods that can be repeated without changing the result
+    idempotent_methods = frozenset([ 'GET', 'HEAD', 'PUT', 'DELETE' ])
+
+    # Returns True if a request that got status_code should be sent again.
+    #   parameters:
+    #     method: string. The HTTP method.
+    #     status_code: int. The response status.
+    #     headers: dict. The response headers.
+    #     attempt: int. How many retries have already been made.
+    #     idempotent: Boolean. Overrides the method-based guess if not None.
+    def should_retry(self, method, status_code, headers, attempt, idempotent = None):
+        if (attempt >= self.max_retries or not status_code in self.retry_statuses):
+            return False
+
+        if (self.is_idempotent(method, idempotent)):
+            return True
+
+        # A throttled request was rejected before the service acted on it,
+        # so even a POST is safe to send again
+        return status_code == 429 or (status_code == 503 and 'Retry-After' in headers)
+
+    # Returns True if a request that raised exception should be sent again.
+    # A failed connect means nothing reached the service. Anything else
+    # (a read timeout, a dropped connection) may have been processed.
+    def should_retry_exception(self, method, exception, attempt, idempotent = None):
+        if (attempt >= self.max_retries):
+            return False
+
+        if (isinstance(exception, requests.exceptions.ConnectTimeout)):
+            return True
+
+        return (self.is_idempotent(method, idempotent) and
+                isinstance(exception, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)))
+
+    def is_idempotent(self, method, idempotent):
+        if (not idempotent is None):
+            return idempotent
+        return method.upper() in self.idempotent_methods
+
+    # Returns True if a call that has already waited waited seconds may wait
+    # delay more before its next attempt
+    def can_wait(self, waited, delay):
+        return self.max_total_delay is None or waited + delay <= self.max_total_delay
+
+    # Returns how many seconds to wait before the next attempt, or None
+    # if the service asked for a longer wait than max_retry_after.
+    def get_delay(self, attempt, headers = None):
+        retry_after = parse_retry_after(headers.get('Retry-After')) if headers else None
+        if (not retry_after is None):
+            if (retry_after > self.max_retry_after):
+                return None
+            # A little jitter on top, so callers don't return in lockstep
+            return retry_after + random.uniform(0, self.base_delay)
+
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+# Parses a Retry-After header, which is either a number of seconds or an
+# HTTP date. Returns the wait in seconds, or None if there is no usable value.
+def parse_retry_after(value):
+    if (value is None):
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    now = datetime.datetime.now(retry_at.tzinfo) if retry_at.tzinfo else datetime.datetime.utcnow()
+    return max(0.0, (retry_at - now).total_seconds())
+
+# A token bucket: holds up to capacity tokens, refilled at rate tokens per
+# second. Each request takes one token. Requests are never refused; a request
+# that finds the bucket empty is told how long to wait for its token, and the
+# bucket goes into debt so later requests queue up behind it.
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Takes a token and returns the number of seconds to wait before using it
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if (self.tokens >= 0):
+                return 0.0
+            return -self.tokens / self.rate
+
+# Keeps a TokenBucket per mailbox, so each mailbox stays under the service's
+# request limits no matter how many threads are calling for it. Buckets that
+# have been idle long enough to refill are dropped, as a new bucket behaves
+# the same, so mailboxes that stop calling don't hold memory.
+class RateLimiter:
+    # How often, in seconds, idle buckets are looked for
+    sweep_interval = 60.0
+
+    #   parameters:
+    #     rate: float. Sustained requests per second per mailbox. None disables limiting.
+    #     burst: int. Requests a mailbox can make at once after being idle.
+    def __init__(self, rate = 15.0, burst = 30):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + self.sweep_interval
+
+    # Takes a token for the mailbox and returns how many seconds the caller
+    # must wait before sending. Async callers sleep on this themselves.
+    def reserve(self, key):
+        if (self.rate is None):
+            return 0.0
+
+        # The token is taken under _lock too, so a sweep can't drop the
+        # bucket between finding it and taking from it. A caller would
+        # then start a new, full bucket and exceed the burst.
+        with self._lock:
+            now = time.monotonic()
+            if (now >= self._next_sweep):
+                self.remove_idle_buckets(now)
+            bucket = self._buckets.get(key)
+            if (bucket is None):
+                bucket = TokenBucket(self.rate, self.burst)
+                self._buckets[key] = bucket
+            return bucket.reserve()
+
+    # Drops the buckets that would be full by now. Called with _lock held.
+    def remove_idle_buckets(self, now):
+        for key, bucket in list(self._buckets.items()):
+            if (bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.capacity):
+                del self._buckets[key]
+        self._next_sweep = now + self.sweep_interval
+
+    # Blocks until the mailbox may send another request
+    def acquire(self, key):
+        wait = self.reserve(key)
+        if (wait > 0):
+            logger.debug('Rate limit reached for %s, waiting %.3fs', key, wait)
+            time.sleep(wait)
+
+# The policy and limiter used by o365service.make_api_call. Replace them
+# to change the behavior, for example RetryPolicy(max_retries = 0) in tests.
+# retry_policy is for runjobs, management commands and bulk work, which can
+# afford to wait out a long Retry-After. Threads serving a page view use
+# interactive_retry_policy (see set_interactive), which gives up after a
+# few seconds and lets the view show the 429 or 503 instead of holding a
+# web worker for minutes.
+retry_policy = RetryPolicy()
+interactive_retry_policy = RetryPolicy(max_retries = 2, max_delay = 2.0, max_retry_after = 5.0, max_total_delay = 5.0)
+rate_limiter = RateLimiter()
+
+_local = threading.local()
+
+# Marks the calling thread as serving a page view, or as done with it.
+# contacts.middleware.InteractiveRetryMiddleware sets it for each request.
+def set_interactive(interactive):
+    _local.interactive = interactive
+
+# Returns the RetryPolicy for calls made on the calling thread
+def get_retry_policy():
+    return interactive_retry_policy if getattr(_local, 'interactive', False) else retry_policy
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,119 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+import threading
+import logging
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+# Used for debug logging
+logger = logging.getLogger('contacts')
+
+# Number of keep-alive connections kept open per host
+pool_size = 10
+# Maximum number of hosts to keep a connection pool for
+pool_connections = 4
+# Default (connect, read) timeout in seconds for every request
+timeout = (5, 30)
+
+# Sends HTTP requests through one pooled requests.Session per host
+# (scheme + host + port). Sessions keep their TCP/TLS connections alive
+# between calls, so only the first request to a host pays for the handshake.
+# Sessions are created lazily and shared between threads; the urllib3
+# connection pool underneath each session is thread safe.
+class PooledTransport:
+    # Initializes the transport
+    #   parameters:
+    #     pool_size: int. Number of keep-alive connections kept per host.
+    #     timeout: float or (float, float). The default (connect, read) timeout.
+    #     keep_alive: Boolean. If False, connections are closed after each request.
+    def __init__(self, pool_size = pool_size, timeout = timeout, keep_alive = True):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    # Returns the session for the host in url, creating it if needed
+    def get_session(self, url):
+        parts = urlsplit(url)
+        host_key = '{0}://{1}'.format(parts.scheme, parts.netloc.lower())
+
+        session = self._sessions.get(host_key)
+        if (session is None):
+            with self._lock:
+                session = self._sessions.get(host_key)
+                if (session is None):
+                    logger.debug('Creating pooled session for %s', host_key)
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections = pool_connections,
+                                          pool_maxsize = self.pool_size,
+                                          pool_block = False)
+                    session.mount('{0}://'.format(parts.scheme), adapter)
+                    if (not self.keep_alive):
+                        session.headers['Connection'] = 'close'
+                    self._sessions[host_key] = session
+
+        return session
+
+    # Sends a request and returns the requests.Response
+    #   parameters:
+    #     method: string. The HTTP method (GET, POST, PATCH, DELETE).
+    #     url: string. The full URL to send the request to.
+    #     kwargs: Any keyword arguments accepted by requests.Session.request.
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.get_session(url).request(method, url, **kwargs)
+
+    # Closes every pooled session and its connections
+    def close(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+
+        for session in sessions:
+            session.close()
+
+_transport = None
+_transport_lock = threading.Lock()
+
+# Returns the transport used by o365service, creating the default
+# PooledTransport on first use.
+def get_transport():
+    global _transport
+    if (_transport is None):
+        with _transport_lock:
+            if (_transport is None):
+                _transport = PooledTransport()
+    return _transport
+
+# Replaces the transport used by o365service and returns the previous one.
+# Any object with a request(method, url, **kwargs) method works, which
+# makes it possible to point the service layer at a local stand-in server
+# or a fake in tests. Pass None to go back to a default PooledTransport.
+def set_transport(transport):
+    global _transport
+    with _transport_lock:
+        previous = _transport
+        _transport = transport
+    return previous
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,215 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from collections import OrderedDict
+from contacts.models import MirroredContact
+import contacts.listcache
+import array
+import bisect
+import threading
+import unicodedata
+import json
+import re
+import logging
+
+# Used for debug logging
+logger = logging.getLogger('contacts')
+
+# The number of users whose index is kept in memory. The least recently
+# searched index is dropped first.
+max_cached_indexes = 50
+# The default and largest number of results a search returns
+default_limit = 10
+max_limit = 50
+
+word_pattern = re.compile(r'\w+')
+phone_pattern = re.compile(r'^[\d\s()+\-.]+$')
+
+# Lowercases text and removes accents, so 'Zoë' is found by 'zoe'
+def normalize(text):
+    text = text.lower()
+    try:
+        text.encode('ascii')
+    except UnicodeEncodeError:
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(character for character in text if not unicodedata.combining(character))
+    return text
+
+# Splits names and email addresses into searchable words
+def get_words(text):
+    return word_pattern.findall(normalize(text))
+
+# Phone numbers are indexed as digits from the start of each group, so
+# '+1 425 555 0100' is found by '1425', '425555', '5550' or '0100'
+def get_phone_terms(phone):
+    groups = re.findall(r'\d+', phone)
+    return [ ''.join(groups[start:]) for start in range(len(groups)) ]
+
+# Turns a search box query into the prefixes to look up. A query that looks
+# like a phone number is a single prefix of its digits.
+def get_query_terms(query):
+    if (phone_pattern.match(query) and any(character.isdigit() for character in query)):
+        return [ re.sub(r'\D', '', query) ]
+    return get_words(query)
+
+# A prefix index over one user's contacts: given name, surname, mobile phone
+# and every email address and display name.
+#
+# The index is a sorted list of the distinct terms, with a parallel list of
+# the contacts each term belongs to. All the terms that start with a prefix
+# are next to each other, so two binary searches find them. A search walks
+# the terms for its most selective prefix and stops once it has enough
+# results, so its cost depends on the limit rather than on the number of
+# contacts.
+class ContactIndex:
+    def __init__(self, entries):
+        # (contact id, given name, surname, mobile phone, first email address)
+        self.contacts = []
+        # The terms of each contact, for checking the other words of a query
+        self.contact_terms = []
+
+        # Each distinct term, mapped to the contacts it belongs to
+        postings = {}
+        for contact_id, given_name, surname, mobile_phone, email_addresses in entries:
+            contact_terms = set(get_words(given_name) + get_words(surname) + get_phone_terms(mobile_phone))
+            first_address = ''
+            for entry in email_addresses:
+                if (not entry is None):
+                    address = entry.get('Address') or ''
+                    first_address = first_address or address
+                    contact_terms.update(get_words(address))
+                    contact_terms.update(get_words(entry.get('Name') or ''))
+
+            index = len(self.contacts)
+            self.contacts.append((contact_id, given_name, surname, mobile_phone, first_address))
+            for term in contact_terms:
+                postings.setdefault(term, []).append(index)
+            self.contact_terms.append(contact_terms)
+
+        self.terms = sorted(postings)
+        # The contacts for self.terms[i] are self.postings[self.offsets[i]:self.offsets[i + 1]].
+        # Flat arrays take a fraction of the memory of a tuple per term.
+        self.offsets = array.array('l', [ 0 ])
+        self.postings = array.array('l')
+        for term in self.terms:
+            self.postings.extend(postings[term])
+            self.offsets.append(len(self.postings))
+
+        # Keep each contact's terms sorted, using the index's copy of each
+        # term string rather than one copy per contact
+        shared_terms = dict(zip(self.terms, self.terms))
+        self.contact_terms = [ tuple(sorted(shared_terms[term] for term in contact_terms))
+                               for contact_terms in self.contact_terms ]
+
+    def __len__(self):
+        return len(self.contacts)
+
+    # Returns the positions in self.terms of the terms starting with prefix
+    def get_range(self, prefix):
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + '\uffff', start)
+        return start, end
+
+    # Finds contacts with a term starting with each word of the query
+    #   parameters:
+    #     query: string. The text typed so far.
+    #     limit: int. The most results to return.
+    #   returns:
+    #     A list of (contact id, given name, surname, mobile phone, first email address)
+    #     tuples, ordered by the matched term.
+    def search(self, query, limit = default_limit):
+        prefixes = get_query_terms(query)
+        if (len(prefixes) == 0):
+            return []
+
+        # Walk the prefix with the fewest postings, and check the others
+        # against each candidate's own terms
+        ranges = [ (self.get_range(prefix), prefix) for prefix in prefixes ]
+        ranges.sort(key = lambda item: self.offsets[item[0][1]] - self.offsets[item[0][0]])
+        (start, end), walked = ranges[0]
+        others = [ prefix for range_, prefix in ranges[1:] if prefix != walked ]
+
+        results = []
+        seen = set()
+        for position in range(self.offsets[start], self.offsets[end]):
+            index = self.postings[position]
+            if (index in seen):
+                continue
+            seen.add(index)
+            if (self.has_prefixes(index, others)):
+                results.append(self.contacts[index])
+                if (len(results) >= limit):
+                    return results
+
+        return results
+
+    def has_prefixes(self, index, prefixes):
+        terms = self.contact_terms[index]
+        for prefix in prefixes:
+            position = bisect.bisect_left(terms, prefix)
+            if (position == len(terms) or not terms[position].startswith(prefix)):
+                return False
+        return True
+
+    # Builds an index from the local mirror
+    @classmethod
+    def from_mirror(cls, connection_info):
+        rows = (MirroredContact.objects.filter(connection = connection_info)
+                                       .values_list('contact_id', 'given_name', 'surname',
+                                                    'mobile_phone', 'email_addresses'))
+        return cls((contact_id, given_name, surname, mobile_phone, json.loads(email_addresses))
+                   for contact_id, given_name, surname, mobile_phone, email_addresses in rows.iterator())
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+# Returns the index for a user's contacts, building it from the mirror if
+# the contacts changed since it was built. Every change made through the app
+# (and every sync that finds changes) bumps the user's contact list cache
+# version, so an index is current as long as it was built at the same version.
+#   parameters:
+#     connection_info: Office365Connection. The user's connection. The mirror
+#                      should already be synced.
+def get_index(connection_info):
+    version = contacts.listcache.get_version(connection_info)
+
+    with _indexes_lock:
+        cached = _indexes.get(connection_info.pk)
+        if (not cached is None and cached[0] == version):
+            _indexes.move_to_end(connection_info.pk)
+            return cached[1]
+
+    logger.debug('Building search index for %s', connection_info.username)
+    index = ContactIndex.from_mirror(connection_info)
+
+    with _indexes_lock:
+        _indexes[connection_info.pk] = (version, index)
+        _indexes.move_to_end(connection_info.pk)
+        while (len(_indexes) > max_cached_indexes):
+            _indexes.popitem(last = False)
+
+    return index
+
+# Drops every cached index
+def clear():
+    with _indexes_lock:
+        _indexes.clear()
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
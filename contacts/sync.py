@@ -0,0 +1,248 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from collections import namedtuple
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from contacts.models import MirroredContact
+import contacts.o365service
+import contacts.o365executor
+import contacts.tokens
+import contacts.listcache
+import datetime
+import json
+import logging
+
+# Used for debug logging
+logger = logging.getLogger('contacts')
+
+# The properties copied into the local mirror
+sync_properties = '?$select=GivenName,Surname,MobilePhone1,EmailAddresses,ChangeKey,DateTimeLastModified'
+# Only Id and ChangeKey are needed to find out what changed
+change_key_properties = '?$select=ChangeKey'
+# The number of contacts requested from Office 365 per page
+sync_page_size = 100
+# If more contacts than this changed since the last sync, it is cheaper
+# to page through the full contact list again than to fetch each one by Id
+max_incremental_fetches = 50
+# Maximum number of Ids to delete in one query (SQLite limits query variables)
+delete_chunk_size = 500
+# How old the mirror can get, in seconds, before a page view syncs it again,
+# so changes made in Outlook show up without running synccontacts. Set
+# CONTACTS_MIRROR_MAX_AGE to change it, or to None to sync only when the
+# mirror is empty or was invalidated.
+default_mirror_max_age = 300
+
+SyncResult = namedtuple('SyncResult', [ 'added', 'changed', 'removed' ])
+
+# Brings the local mirror for a connection up to date with Office 365.
+# The first sync copies every contact. Later syncs only list Ids and
+# ChangeKeys, then fetch the contacts that are new or whose ChangeKey
+# changed, and remove the ones that no longer exist.
+#   parameters:
+#     connection_info: Office365Connection. The connection to sync.
+#   returns:
+#     A SyncResult with the number of contacts added, changed and removed.
+def sync_contacts(connection_info):
+    logger.debug('Entering sync_contacts.')
+    logger.debug('  connection: %s', connection_info)
+
+    fill_email_search(connection_info)
+    existing = dict(MirroredContact.objects.filter(connection = connection_info)
+                                           .values_list('contact_id', 'change_key'))
+
+    token = contacts.tokens.get_access_token(connection_info)
+
+    if (len(existing) == 0):
+        result = full_sync(connection_info, token, existing)
+    else:
+        result = incremental_sync(connection_info, token, existing)
+
+    connection_info.contacts_synced = timezone.now()
+    connection_info.save(update_fields = [ 'contacts_synced' ])
+    
+    if (result != (0, 0, 0)):
+        contacts.listcache.invalidate(connection_info)
+
+    logger.debug('Sync result: %s', result)
+    logger.debug('Leaving sync_contacts.')
+    return result
+
+# Pages through every contact with all mirrored properties
+def full_sync(connection_info, token, existing):
+    added = 0
+    changed = 0
+    seen = set()
+    new_contacts = []
+
+    with transaction.atomic():
+        for json_contact in contacts.o365service.iter_contacts(connection_info.outlook_api_endpoint,
+                                                               token,
+                                                               sync_properties,
+                                                               page_size = sync_page_size):
+            contact_id = json_contact['Id']
+            seen.add(contact_id)
+
+            if (not contact_id in existing):
+                new_contacts.append(json_contact)
+                added += 1
+            elif (existing[contact_id] != json_contact.get('ChangeKey')):
+                save_contact(connection_info, json_contact)
+                changed += 1
+
+            if (len(new_contacts) >= sync_page_size):
+                create_contacts(connection_info, new_contacts)
+                new_contacts = []
+
+        create_contacts(connection_info, new_contacts)
+        removed = remove_contacts(connection_info, set(existing) - seen)
+
+    return SyncResult(added, changed, removed)
+
+# Lists Ids and ChangeKeys, then fetches only what changed
+def incremental_sync(connection_info, token, existing):
+    current = {}
+    for json_contact in contacts.o365service.iter_contacts(connection_info.outlook_api_endpoint,
+                                                           token,
+                                                           change_key_properties,
+                                                           page_size = sync_page_size):
+        current[json_contact['Id']] = json_contact.get('ChangeKey')
+
+    stale_ids = [ contact_id for contact_id, change_key in current.items()
+                  if existing.get(contact_id) != change_key ]
+
+    if (len(stale_ids) > max_incremental_fetches):
+        logger.debug('%s contacts changed, falling back to a full sync.', len(stale_ids))
+        return full_sync(connection_info, token, existing)
+
+    added = 0
+    changed = 0
+
+    # Fetch the changed contacts concurrently, then save them together
+    fetched = contacts.o365executor.get_contacts_by_id(connection_info.outlook_api_endpoint,
+                                                       token, stale_ids, sync_properties,
+                                                       user = connection_info.username)
+    logger.debug('Fetched changed contacts: %s', fetched.stats)
+
+    with transaction.atomic():
+        for contact_id, json_contact in zip(stale_ids, fetched.results):
+            if (json_contact is None):
+                # Deleted between listing and fetching, or the fetch failed.
+                # The next sync will pick it up.
+                continue
+
+            save_contact(connection_info, json_contact)
+            if (contact_id in existing):
+                changed += 1
+            else:
+                added += 1
+
+        removed = remove_contacts(connection_info, set(existing) - set(current))
+
+    return SyncResult(added, changed, removed)
+
+# Adds contacts to the mirror in one query. If another request mirrored
+# some of them first (two first syncs running at once), they are saved
+# one at a time instead, updating the rows the other request added.
+def create_contacts(connection_info, json_contacts):
+    new_contacts = []
+    for json_contact in json_contacts:
+        mirrored_contact = MirroredContact(connection = connection_info)
+        mirrored_contact.load_json(json_contact)
+        new_contacts.append(mirrored_contact)
+
+    try:
+        with transaction.atomic():
+            MirroredContact.objects.bulk_create(new_contacts)
+    except IntegrityError:
+        logger.debug('Contacts were mirrored by another request, saving them one at a time.')
+        for json_contact in json_contacts:
+            save_contact(connection_info, json_contact)
+
+# Fills in email_search for contacts mirrored before it was added. Works
+# from the mirror's own copy, so nothing is fetched from Office 365.
+def fill_email_search(connection_info):
+    missing = (MirroredContact.objects.filter(connection = connection_info, email_search = '')
+                                      .exclude(email_addresses = '[]')
+                                      .values_list('pk', 'email_addresses'))
+    for pk, email_addresses in missing:
+        email_search = MirroredContact.get_email_search_text(json.loads(email_addresses))
+        if (email_search != ''):
+            MirroredContact.objects.filter(pk = pk).update(email_search = email_search)
+
+def save_contact(connection_info, json_contact):
+    try:
+        mirrored_contact = MirroredContact.objects.get(connection = connection_info, contact_id = json_contact['Id'])
+    except MirroredContact.DoesNotExist:
+        mirrored_contact = MirroredContact(connection = connection_info)
+
+    mirrored_contact.load_json(json_contact)
+    mirrored_contact.save()
+
+def remove_contacts(connection_info, contact_ids):
+    contact_ids = list(contact_ids)
+    for start in range(0, len(contact_ids), delete_chunk_size):
+        MirroredContact.objects.filter(connection = connection_info,
+                                       contact_id__in = contact_ids[start:start + delete_chunk_size]).delete()
+    return len(contact_ids)
+
+# Write-through helpers, called by the views after a successful
+# change in Office 365 so the mirror doesn't show stale data.
+
+# Copies the fields of an updated contact into the mirror. The ChangeKey
+# is cleared so that the next sync fetches the server's version.
+#   parameters:
+#     connection_info: Office365Connection. The connection the contact belongs to.
+#     contact_id: string. The ID of the contact that was updated.
+#     display_contact: DisplayContact. The updated contact.
+def mirror_contact_updated(connection_info, contact_id, display_contact):
+    email_addresses = display_contact.get_email_address_list(True)
+    MirroredContact.objects.filter(connection = connection_info, contact_id = contact_id).update(
+        change_key = '',
+        given_name = display_contact.given_name,
+        surname = display_contact.last_name,
+        mobile_phone = display_contact.mobile_phone,
+        email_addresses = json.dumps(email_addresses),
+        email_search = MirroredContact.get_email_search_text(email_addresses),
+        last_modified = timezone.now())
+
+# Removes a deleted contact from the mirror
+def mirror_contact_deleted(connection_info, contact_id):
+    MirroredContact.objects.filter(connection = connection_info, contact_id = contact_id).delete()
+
+# Returns True if the mirror should be synced before it is read: it has
+# never been synced, was invalidated, or is older than CONTACTS_MIRROR_MAX_AGE
+def mirror_needs_sync(connection_info):
+    if (connection_info.contacts_synced is None):
+        return True
+        
+    max_age = getattr(settings, 'CONTACTS_MIRROR_MAX_AGE', default_mirror_max_age)
+    if (max_age is None):
+        return False
+    return timezone.now() - connection_info.contacts_synced > datetime.timedelta(seconds = max_age)
+
+# Marks the mirror as needing a sync, for changes that can't be
+# applied locally (for example a new contact, whose Id isn't known)
+def mirror_invalidate(connection_info):
+    connection_info.contacts_synced = None
+    connection_info.save(update_fields = [ 'contacts_synced' ])
+
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -0,0 +1,185 @@
+# Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
+from django.db.models import Q
+from django.utils import timezone
+from contacts.models import Office365Connection
+import contacts.o365service
+import datetime
+import logging
+import threading
+import time
+
+# Used for debug logging
+logger = logging.getLogger('contacts')
+
+# Tokens are refreshed this long before they expire, so a token
+# handed out is still good for the API calls that follow
+refresh_margin = datetime.timedelta(minutes = 5)
+# Assumed lifetime when the token response doesn't say
+default_lifetime = datetime.timedelta(hours = 1)
+# How long a worker may hold the refresh lease before others assume it died
+lease_duration = datetime.timedelta(seconds = 30)
+# How often a worker waiting on another worker's refresh checks the database
+lease_poll_interval = 0.1
+
+# The number of locks that refreshes in this process are spread over. Each
+# (connection, resource) always uses the same one, so only one thread
+# refreshes a given token at a time. A fixed set keeps long-running workers
+# from collecting a lock for every token they ever refreshed; tokens that
+# share a lock only wait for each other's refreshes.
+refresh_lock_count = 64
+_refresh_locks = [ threading.Lock() for i in range(refresh_lock_count) ]
+
+# Raised when the token endpoint doesn't return an access token,
+# for example because the refresh token was revoked
+class TokenRefreshError(Exception):
+    pass
+
+# Returns an access token for the connection's Outlook resource. The cached
+# token is returned until it is within refresh_margin of expiring, at which
+# point a new one is requested with the refresh token and saved.
+#   parameters:
+#     connection_info: Office365Connection. The user's connection.
+def get_access_token(connection_info):
+    if (is_token_valid(connection_info)):
+        return connection_info.access_token
+        
+    return refresh_access_token(connection_info)
+    
+# Returns True if the connection has an access token that isn't about to expire
+def is_token_valid(connection_info):
+    if (connection_info.access_token is None or
+        connection_info.access_token == '' or
+        connection_info.access_token_expires is None):
+        return False
+        
+    return timezone.now() < connection_info.access_token_expires - refresh_margin
+    
+# Gets a new access token for the connection and returns it. Concurrent
+# refreshes of the same token are coalesced: threads in this process wait on
+# a shared lock, and worker processes take a lease on the connection's row,
+# so only one caller talks to the token endpoint. The others pick up the
+# token it saved.
+#   parameters:
+#     connection_info: Office365Connection. The user's connection.
+def refresh_access_token(connection_info):
+    logger.debug('Entering refresh_access_token.')
+    logger.debug('  connection: %s', connection_info)
+    
+    stale_token = connection_info.access_token
+    
+    with get_refresh_lock(connection_info):
+        while (True):
+            if (load_refreshed_token(connection_info, stale_token)):
+                logger.debug('Token was refreshed by another caller, leaving refresh_access_token.')
+                return connection_info.access_token
+                
+            if (acquire_lease(connection_info)):
+                try:
+                    # Check again, the previous lease holder may have
+                    # finished between the check above and taking the lease
+                    if (load_refreshed_token(connection_info, stale_token)):
+                        return connection_info.access_token
+                    access_token = request_access_token(connection_info)
+                finally:
+                    release_lease(connection_info)
+                    
+                logger.debug('Leaving refresh_access_token.')
+                return access_token
+                
+            wait_for_lease(connection_info)
+            
+def get_refresh_lock(connection_info):
+    key = (connection_info.pk, connection_info.outlook_resource_id)
+    return _refresh_locks[hash(key) % len(_refresh_locks)]
+    
+# If the saved token differs from stale_token and is still valid, someone
+# else refreshed it. Copies it into connection_info and returns True.
+def load_refreshed_token(connection_info, stale_token):
+    saved = Office365Connection.objects.only('access_token', 'access_token_expires', 'refresh_token').get(pk = connection_info.pk)
+    
+    if (saved.access_token == stale_token or not is_token_valid(saved)):
+        return False
+        
+    connection_info.access_token = saved.access_token
+    connection_info.access_token_expires = saved.access_token_expires
+    connection_info.refresh_token = saved.refresh_token
+    return True
+    
+# Takes the refresh lease on the connection's row. The conditional update
+# succeeds for exactly one worker, even across processes.
+def acquire_lease(connection_info):
+    now = timezone.now()
+    acquired = (Office365Connection.objects
+                .filter(pk = connection_info.pk)
+                .filter(Q(token_refresh_lease__isnull = True) | Q(token_refresh_lease__lt = now))
+                .update(token_refresh_lease = now + lease_duration))
+    return acquired == 1
+    
+def release_lease(connection_info):
+    Office365Connection.objects.filter(pk = connection_info.pk).update(token_refresh_lease = None)
+    
+# Waits until the current lease holder releases the lease, or the lease expires
+def wait_for_lease(connection_info):
+    deadline = time.time() + lease_duration.total_seconds()
+    while (time.time() < deadline):
+        time.sleep(lease_poll_interval)
+        lease = (Office365Connection.objects
+                 .filter(pk = connection_info.pk)
+                 .values_list('token_refresh_lease', flat = True)[0])
+        if (lease is None or lease < timezone.now()):
+            return
+    
+# Requests a new access token with the connection's refresh token and
+# saves it, along with its expiry time and the new refresh token if
+# Azure rotated it. Returns the new access token.
+def request_access_token(connection_info):
+    token_response = contacts.o365service.get_access_token_from_refresh_token(connection_info.refresh_token,
+                                                                              connection_info.outlook_resource_id)
+    
+    try:
+        access_token = token_response['access_token']
+    except (KeyError, TypeError):
+        logger.debug('No access token in response.')
+        raise TokenRefreshError('Unable to refresh access token: {0}'.format(token_response))
+        
+    connection_info.access_token = access_token
+    connection_info.access_token_expires = get_expiry(token_response)
+    if ('refresh_token' in token_response):
+        connection_info.refresh_token = token_response['refresh_token']
+    connection_info.save(update_fields = [ 'access_token', 'access_token_expires', 'refresh_token' ])
+    
+    logger.debug('Token expires: %s', connection_info.access_token_expires)
+    return access_token
+    
+# Works out when a token expires from the token endpoint's response.
+# Azure returns expires_on (seconds since the epoch) and expires_in (seconds),
+# both as strings.
+def get_expiry(token_response):
+    if ('expires_on' in token_response):
+        return datetime.datetime.fromtimestamp(int(token_response['expires_on']), timezone.utc)
+        
+    if ('expires_in' in token_response):
+        return timezone.now() + datetime.timedelta(seconds = int(token_response['expires_in']))
+        
+    return timezone.now() + default_lifetime
+    
+# MIT License: 
+ 
+# Permission is hereby granted, free of charge, to any person obtaining 
+# a copy of this software and associated documentation files (the 
+# ""Software""), to deal in the Software without restriction, including 
+# without limitation the rights to use, copy, modify, merge, publish, 
+# distribute, sublicense, and/or sell copies of the Software, and to 
+# permit persons to whom the Software is furnished to do so, subject to 
+# the following conditions: 
+ 
+# The above copyright notice and this permission notice shall be 
+# included in all copies or substantial portions of the Software. 
+ 
+# THE SOFTWARE IS PROVIDED ""AS IS"", WITHOUT WARRANTY OF ANY KIND, 
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF 
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
\ No newline at end of file
@@ -20,6 +20,22 @@ urlpatterns = patterns('',
     url(r'^update/(?P<contact_id>.+)/$', views.update, name='update'),
     # Invoked to delete an existing contact ('/contacts/delete/<contact_id>/')
     url(r'^delete/(?P<contact_id>.+)/$', views.delete, name='delete'),
+    # Downloads all contacts as CSV or vCard ('/contacts/export/?format=csv')
+    url(r'^export/$', views.export, name='export'),
+    # Returns contacts matching a typeahead query as JSON ('/contacts/search/?q=ann')
+    url(r'^search/$', views.search, name='search'),
+    # Lists the user's background jobs ('/contacts/jobs/')
+    url(r'^jobs/$', views.jobs, name='jobs'),
+    # Returns a background job's status as JSON ('/contacts/jobs/<job_id>/')
+    url(r'^jobs/(?P<job_id>\d+)/$', views.job_status, name='job_status'),
+    # Returns Office 365 call and view timing totals as JSON, for staff ('/contacts/metrics/')
+    url(r'^metrics/$', views.metrics, name='metrics'),
+    # Uploads a CSV or vCard file to import ('/contacts/import/')
+    url(r'^import/$', views.import_contacts, name='import'),
+    # Displays an import's progress ('/contacts/import/<import_id>/')
+    url(r'^import/(?P<import_id>\d+)/$', views.import_status, name='import_status'),
+    # Invoked to resume a failed or interrupted import ('/contacts/import/<import_id>/resume/')
+    url(r'^import/(?P<import_id>\d+)/resume/$', views.import_resume, name='import_resume'),
 )
 
 # MIT License: 
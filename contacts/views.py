@@ -1,16 +1,39 @@
 # Copyright (c) Microsoft. All rights reserved. Licensed under the MIT license. See full license at the bottom of this file.
 from django.shortcuts import render
-from django.http import HttpResponseRedirect, HttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.http import http_date, parse_http_date_safe, parse_etags, quote_etag
+from django.utils.cache import patch_cache_control
+from django.middleware.csrf import get_token
+from django.http import HttpResponseRedirect, HttpResponse, HttpResponseNotModified, StreamingHttpResponse, Http404, JsonResponse
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.utils.decorators import method_decorator
 from django.views import generic
 from django.core.urlresolvers import reverse
 from django.core.exceptions import ObjectDoesNotExist
-from contacts.models import Office365Connection, DisplayContact
+from django.conf import settings
+from contacts.models import Office365Connection, DisplayContact, ContactImport, Job
 import contacts.o365service
+import contacts.connections
+import contacts.contactlist
+import contacts.listcache
+import contacts.export
+import contacts.importer
+import contacts.jobs
+import contacts.searchindex
+import contacts.o365metrics
+import contacts.sync
+import contacts.tokens
 import traceback
+import itertools
+import hashlib
+import time
 
-contact_properties = '?$select=GivenName,Surname,MobilePhone1,EmailAddresses&$top=50'
+contact_properties = '?$select=GivenName,Surname,MobilePhone1,EmailAddresses,ChangeKey,DateTimeLastModified'
+
+concurrent_update_message = ('This contact was changed in Office 365 after you opened it. '
+                             'Open it again to see the changes, then make your edits again.')
 
 # Create your views here.
 # This is the index view for /contacts/
@@ -18,7 +41,7 @@ contact_properties = '?$select=GivenName,Surname,MobilePhone1,EmailAddresses&$to
 def index(request):
     try:
         # Get the user's connection info
-        connection_info = Office365Connection.objects.get(username = request.user)
+        connection_info = contacts.connections.get_connection(request)
         
     except ObjectDoesNotExist:
         # If there is no connection object for the user, they haven't connected their
@@ -26,46 +49,131 @@ def index(request):
         return render(request, 'contacts/index.html', None)
     
     else:
-        # If we don't have an access token, request one
-        # NOTE: This doesn't check if the token is expired. We could, but 
-        # we'll just lazily assume it is good. If we try to use it and we
-        # get an error, then we can refresh.
-        if (connection_info.access_token is None or 
-            connection_info.access_token == ''):
-            # Use the refresh token to request a token for the Contacts API
-            access_token = contacts.o365service.get_access_token_from_refresh_token(connection_info.refresh_token, 
-                                                                                    connection_info.outlook_resource_id)
+        query = contacts.contactlist.ContactListQuery.from_query_dict(request.GET)
+        
+        # Serve the rendered list from the cache if nothing has changed since
+        # it was rendered. This skips the mirror or API query and the rendering.
+        # A mirror that is due a sync is synced first (see get_display_contacts);
+        # the sync drops the cached pages if anything changed.
+        contact_list = None
+        if (not uses_mirror() or not contacts.sync.mirror_needs_sync(connection_info)):
+            contact_list = contacts.listcache.get_contact_list(connection_info, query)
+        
+        if (contact_list is None):
+            try:
+                display_contacts = get_display_contacts_with_retry(connection_info, query)
+            except contacts.tokens.TokenRefreshError:
+                # The refresh token was revoked or has expired. The page
+                # will ask them to connect again.
+                return render(request, 'contacts/index.html', None)
+            except contacts.o365service.ApiError as e:
+                return render(request, 'contacts/error.html',
+                    {
+                        'error_message': 'Unable to get contacts: {0} HTTP status returned.'.format(e.status_code),
+                    }
+                )
             
-            # Save the access token
-            connection_info.access_token = access_token['access_token']
-            connection_info.save()
+            list_context = contacts.contactlist.get_page_context(query, display_contacts)
+            list_context['user_email'] = connection_info.user_email
+            list_context['user_contacts'] = display_contacts[:query.page_size]
+            contact_list = contacts.listcache.CachedPage(
+                contacts.contactlist.get_page_etag(query, connection_info.user_email, display_contacts),
+                int(time.time()),
+                render_to_string('contacts/contact_list.html', list_context))
+            contacts.listcache.set_contact_list(connection_info, query, contact_list)
         
-        user_contacts = contacts.o365service.get_contacts(connection_info.outlook_api_endpoint,
-                                                          connection_info.access_token, contact_properties)
-                                                          
-        if (user_contacts is None):
-            # Use the refresh token to request a token for the Contacts API
-            access_token = contacts.o365service.get_access_token_from_refresh_token(connection_info.refresh_token, 
-                                                                                    connection_info.outlook_resource_id)
+        # Changes still waiting for runjobs are listed above the contacts.
+        # The count isn't part of the ETag, so send the page while there are any.
+        pending_jobs = contacts.jobs.get_pending_count(connection_info) if contacts.jobs.is_enabled() else 0
+        
+        # If the browser already has this page, don't send it again
+        if (pending_jobs == 0 and is_not_modified(request, contact_list.etag, contact_list.last_modified)):
+            return get_not_modified_response(contact_list.etag, contact_list.last_modified)
             
-            # Save the access token
-            connection_info.access_token = access_token['access_token']
-            connection_info.save()
+        context = { 'user_email': connection_info.user_email,
+                    'contact_list': mark_safe(contact_list.content),
+                    'pending_jobs': pending_jobs }
+        response = render(request, 'contacts/index.html', context)
+        set_validators(response, contact_list.etag, contact_list.last_modified)
+        return response
+        
+# Whether the contacts index reads from the local mirror
+def uses_mirror():
+    return getattr(settings, 'CONTACTS_USE_MIRROR', True)
+    
+# Loads one page of the user's contacts as DisplayContact objects, plus one
+# extra contact if there is a next page. The page comes from the local mirror
+# unless CONTACTS_USE_MIRROR is False. If the mirror has never been synced,
+# a change was made that it couldn't apply locally, or it is older than
+# CONTACTS_MIRROR_MAX_AGE, it is synced with Office 365 first.
+#   parameters:
+#     connection_info: Office365Connection. The user's connection.
+#     query: ContactListQuery. The page, sort order and filter to load.
+def get_display_contacts(connection_info, query):
+    contact_list = list()
+    
+    if (uses_mirror()):
+        if (contacts.sync.mirror_needs_sync(connection_info)):
+            contacts.sync.sync_contacts(connection_info)
             
-            user_contacts = contacts.o365service.get_contacts(connection_info.outlook_api_endpoint,
-                                                              connection_info.access_token, contact_properties)
-        contact_list = list()
+        for mirrored_contact in query.apply(connection_info.mirrored_contacts.all()):
+            contact_list.append(mirrored_contact.to_display_contact())
+    else:
+        token = contacts.tokens.get_access_token(connection_info)
+        url = '{0}/Me/Contacts{1}'.format(connection_info.outlook_api_endpoint, query.to_odata())
         
-        for user_contact in user_contacts['value']:
+        for json_contact in contacts.o365service.get_page(url, token)['value']:
             display_contact = DisplayContact()
-            display_contact.load_json(user_contact)
+            display_contact.load_json(json_contact)
             contact_list.append(display_contact)
         
-        # For now just return the token and the user's email, the page will display it.
-        context = { 'user_email': connection_info.user_email,
-                    'user_contacts': contact_list }
-        return render(request, 'contacts/index.html', context)
+    return contact_list
+    
+# Loads a page of contacts as get_display_contacts does. If the token is
+# rejected before its expiry time (for example, it was revoked), a new one
+# is requested and the page is loaded again.
+def get_display_contacts_with_retry(connection_info, query):
+    try:
+        return get_display_contacts(connection_info, query)
+    except contacts.o365service.ApiError as e:
+        if (e.status_code != 401):
+            raise
+            
+    contacts.tokens.refresh_access_token(connection_info)
+    return get_display_contacts(connection_info, query)
+        
+# Returns True if the copy of a page the browser already has, identified by
+# the request's If-None-Match or If-Modified-Since header, is still current
+#   parameters:
+#     request: HttpRequest. The request.
+#     etag: string. The page's current ETag, unquoted.
+#     last_modified: int. When the page last changed, as a Unix timestamp, or None.
+def is_not_modified(request, etag, last_modified = None):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if (not if_none_match is None):
+        # If-None-Match takes precedence over If-Modified-Since
+        return if_none_match.strip() == '*' or etag in parse_etags(if_none_match)
         
+    if (last_modified is None):
+        return False
+        
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+    return (not if_modified_since is None and last_modified <= if_modified_since)
+    
+# Adds the ETag and Last-Modified headers to a response. Pages are per user,
+# so shared caches must not store them, and browsers must check back
+# before reusing them.
+def set_validators(response, etag, last_modified = None):
+    response['ETag'] = quote_etag(etag)
+    if (not last_modified is None):
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private = True, no_cache = True)
+    
+def get_not_modified_response(etag, last_modified = None):
+    response = HttpResponseNotModified()
+    set_validators(response, etag, last_modified)
+    return response
+    
 # The /contacts/connect/ action. This will redirect to the Azure OAuth
 # login/consent page.
 def connect(request):
@@ -76,6 +184,7 @@ def connect(request):
     
 # The /contacts/authorize action. This is where Azure's login/consent page
 # redirects after the user consents.
+@login_required
 def authorize(request):
     redirect_uri = 'http://127.0.0.1:8000/contacts/authorize/'
     if request.method == "GET":
@@ -87,13 +196,6 @@ def authorize(request):
                     'error_message' : 'Connection canceled.'
                 })
         else:
-            # Get the user's connection info from database
-            try:
-                connection = Office365Connection.objects.get(username = request.user)
-            except ObjectDoesNotExist:
-                # If there is not one for the user, create a new one
-                connection = Office365Connection(username = request.user)
-
             # Use the auth code to get an access token and do discovery
             access_info = contacts.o365service.get_access_info_from_authcode(auth_code, redirect_uri)
             
@@ -104,12 +206,22 @@ def authorize(request):
                     resource_id = access_info['Contacts_resource_id']
                     api_endpoint = access_info['Contacts_api_endpoint']
                     
-                    # Save the access information in the user's connection info
-                    connection.user_email = user_email
-                    connection.refresh_token = refresh_token
-                    connection.outlook_resource_id = resource_id
-                    connection.outlook_api_endpoint = api_endpoint
-                    connection.save()
+                    # Save the access information in the user's connection
+                    # info, creating it if this is their first connection.
+                    # username is unique, so two sign-ins at once can't
+                    # create two connections.
+                    connection, created = Office365Connection.objects.update_or_create(
+                        username = request.user.get_username(),
+                        defaults = { 'user': request.user,
+                                     'user_email': user_email,
+                                     'refresh_token': refresh_token,
+                                     'outlook_resource_id': resource_id,
+                                     'outlook_api_endpoint': api_endpoint,
+                                     # The code was exchanged for a new token
+                                     'access_token': '',
+                                     'access_token_expires': None })
+                    # The account may have changed, so drop the cached list
+                    contacts.listcache.invalidate(connection)
                 except Exception as e:
                     return render(request, 'contacts/error.html', 
                         {
@@ -157,7 +269,7 @@ def create(request):
     else:
         try:
             # Get the user's connection info
-            connection_info = Office365Connection.objects.get(username = request.user)
+            connection_info = contacts.connections.get_connection(request)
             
         except ObjectDoesNotExist:
             # If there is no connection object for the user, they haven't connected their
@@ -165,11 +277,28 @@ def create(request):
             return render(request, 'contacts/index.html', None)
             
         else:
+            if (contacts.jobs.is_enabled()):
+                # runjobs creates it and syncs it into the mirror, and the
+                # list shows it from then on
+                contacts.jobs.enqueue(connection_info, 'create', contact = new_contact.get_json(False))
+                return HttpResponseRedirect(reverse('contacts:index'))
+                
+            try:
+                token = contacts.tokens.get_access_token(connection_info)
+            except contacts.tokens.TokenRefreshError:
+                # The refresh token was revoked or has expired. The page
+                # will ask them to connect again.
+                return render(request, 'contacts/index.html', None)
+                
             result = contacts.o365service.create_contact(connection_info.outlook_api_endpoint,
-                                                         connection_info.access_token,
+                                                         token,
                                                          new_contact.get_json(False))
             # Per MSDN, success should be a 201 status                                             
             if (result == 201):
+                # The new contact's Id isn't known, so have the next
+                # page view sync the mirror
+                contacts.sync.mirror_invalidate(connection_info)
+                contacts.listcache.invalidate(connection_info)
                 return HttpResponseRedirect(reverse('contacts:index'))
             else:
                 return render(request, 'contacts/error.html',
@@ -179,40 +308,71 @@ def create(request):
                 )
 
 # The edit view, used to display an existing contact in a details form.
-# Note this view always retrieves the contact from Office 365 to get the latest version.                
+# Note this view always checks Office 365 for the latest version. If the
+# mirror has the contact, the check is a conditional request that returns
+# no body when the mirror's copy is current. The exception is a contact
+# with a queued update (see contacts.jobs.get_pending_update): the form
+# shows the queued change, which Office 365 doesn't have yet.
 @login_required
 def edit(request, contact_id):        
     try:
         # Get the user's connection info
-        connection_info = Office365Connection.objects.get(username = request.user)
+        connection_info = contacts.connections.get_connection(request)
         
     except ObjectDoesNotExist:
         # If there is no connection object for the user, they haven't connected their
         # Office 365 account yet. The page will ask them to connect.
         return render(request, 'contacts/index.html', None)
         
+    mirrored_contact = connection_info.mirrored_contacts.filter(contact_id = contact_id).first()
+    change_key = mirrored_contact.change_key if mirrored_contact else ''
+    
+    if (not mirrored_contact is None and has_pending_update(connection_info, contact_id)):
+        # Show the mirror's copy, as if it were current. Replacing it with
+        # the version in Office 365 would lose the queued change.
+        status_code, contact_json = 304, None
     else:
-        if (connection_info.access_token is None or 
-                connection_info.access_token == ''):
+        try:
+            token = contacts.tokens.get_access_token(connection_info)
+        except contacts.tokens.TokenRefreshError:
+            # The refresh token was revoked or has expired. The page will ask
+            # them to connect again.
             return render(request, 'contacts/index.html', None)
             
-    contact_json = contacts.o365service.get_contact_by_id(connection_info.outlook_api_endpoint,
-                                                          connection_info.access_token,
-                                                          contact_id, contact_properties)
+        status_code, contact_json = contacts.o365service.get_contact_if_changed(connection_info.outlook_api_endpoint,
+                                                                                token,
+                                                                                contact_id, change_key, contact_properties)
                                                           
-    if (not contact_json is None):
+    if (status_code == 304):
+        # The mirror's copy is current
+        display_contact = mirrored_contact.to_display_contact()
+    elif (not contact_json is None):
         # Load the contact into a DisplayContact object
         display_contact = DisplayContact()
         display_contact.load_json(contact_json)
         
-        # Render a details form
-        return render(request, 'contacts/details.html', { 'contact': display_contact })
+        if (not mirrored_contact is None and display_contact.change_key != change_key):
+            contacts.sync.save_contact(connection_info, contact_json)
+            contacts.listcache.invalidate(connection_info)
     else:
         return render(request, 'contacts/error.html',
             {
                 'error_message': 'Unable to get contact with ID: {0}'.format(contact_id),
             }
         )
+        
+    # The form embeds the CSRF token, so the ETag covers it too. There is no
+    # Last-Modified: the contact's modified time doesn't change with the token.
+    etag = hashlib.md5('{0}\n{1}\n{2}'.format(display_contact.id,
+                                                display_contact.change_key,
+                                                get_token(request)).encode('utf-8')).hexdigest()
+    if (is_not_modified(request, etag)):
+        return get_not_modified_response(etag)
+        
+    # Render a details form
+    response = render(request, 'contacts/details.html', { 'contact': display_contact })
+    set_validators(response, etag)
+    return response
 
 # The update action, invoked via POST from the details form when editing
 # an existing contact.
@@ -241,7 +401,7 @@ def update(request, contact_id):
     else:
         try:
             # Get the user's connection info
-            connection_info = Office365Connection.objects.get(username = request.user)
+            connection_info = contacts.connections.get_connection(request)
             
         except ObjectDoesNotExist:
             # If there is no connection object for the user, they haven't connected their
@@ -249,27 +409,119 @@ def update(request, contact_id):
             return render(request, 'contacts/index.html', None)
             
         else:
+            try:
+                token = contacts.tokens.get_access_token(connection_info)
+            except contacts.tokens.TokenRefreshError:
+                # The refresh token was revoked or has expired. The page
+                # will ask them to connect again.
+                return render(request, 'contacts/index.html', None)
+            
+            # The ChangeKey of the version the form was filled in from
+            change_key = request.POST.get('change_key', '')
+            
+            # With an update still queued, the form was filled in from the
+            # mirror's copy, which has its change. This update is sent
+            # after it, with the ChangeKey it produces.
+            pending_update = None
+            if (contacts.jobs.is_enabled()):
+                pending_update = contacts.jobs.get_pending_update(connection_info, contact_id)
+            mirrored_contact = None
+            if (not pending_update is None):
+                mirrored_contact = connection_info.mirrored_contacts.filter(contact_id = contact_id).first()
+                
+            if (not mirrored_contact is None):
+                original_contact = mirrored_contact.to_display_contact()
+            else:
+                original_contact = get_original_contact(connection_info, token, contact_id, change_key)
+            
+            if (original_contact is None):
+                return render(request, 'contacts/error.html',
+                    {
+                        'error_message': 'Unable to get contact with ID: {0}'.format(contact_id),
+                    }
+                )
+                
+            if (change_key and original_contact.change_key != change_key):
+                return render(request, 'contacts/error.html', { 'error_message': concurrent_update_message })
+                
+            # The form only shows the first three email addresses. Keep the rest.
+            updated_contact.email_fields = updated_contact.email_fields[:6] + original_contact.email_fields[6:]
+            
+            # Only send the properties that changed. The ChangeKey makes Office 365
+            # reject the update if the contact was changed by someone else since.
+            update_payload = updated_contact.get_update_json(original_contact)
+            if (update_payload is None):
+                return HttpResponseRedirect(reverse('contacts:index'))
+                
+            if (contacts.jobs.is_enabled()):
+                # Show the change straight away; runjobs sends it. If it
+                # fails, the mirror is resynced and the change disappears.
+                if (pending_update is None):
+                    contacts.jobs.enqueue(connection_info, 'update', contact_id = contact_id,
+                                          changes = update_payload, change_key = original_contact.change_key)
+                else:
+                    contacts.jobs.enqueue(connection_info, 'update', contact_id = contact_id,
+                                          changes = update_payload, change_key = original_contact.change_key,
+                                          after_job = pending_update.pk)
+                contacts.sync.mirror_contact_updated(connection_info, contact_id, updated_contact)
+                contacts.listcache.invalidate(connection_info)
+                return HttpResponseRedirect(reverse('contacts:index'))
+                
             result = contacts.o365service.update_contact(connection_info.outlook_api_endpoint,
-                                                         connection_info.access_token,
+                                                         token,
                                                          contact_id,
-                                                         updated_contact.get_json(True))
+                                                         update_payload,
+                                                         original_contact.change_key)
             
             # Per MSDN, success should be a 200 status
             if (result == 200):
+                contacts.sync.mirror_contact_updated(connection_info, contact_id, updated_contact)
+                contacts.listcache.invalidate(connection_info)
                 return HttpResponseRedirect(reverse('contacts:index'))
+            elif (result == 412):
+                return render(request, 'contacts/error.html', { 'error_message': concurrent_update_message })
             else:
                 return render(request, 'contacts/error.html',
                     {
                         'error_message': 'Unable to update contact: {0} HTTP status returned.'.format(result),
                     }
                 )
+                
+# Returns True if the contact has an update waiting in the job queue
+def has_pending_update(connection_info, contact_id):
+    return contacts.jobs.is_enabled() and not contacts.jobs.get_pending_update(connection_info, contact_id) is None
+        
+# Returns the version of a contact that an edit was made to, as a
+# DisplayContact, so the update can be compared against it. The mirror's
+# copy is used if it is that version. Otherwise the current version is
+# fetched from Office 365.
+#   parameters:
+#     connection_info: Office365Connection. The user's connection.
+#     token: string. The access token.
+#     contact_id: string. The ID of the contact.
+#     change_key: string. The ChangeKey posted with the form, or empty.
+def get_original_contact(connection_info, token, contact_id, change_key):
+    if (change_key):
+        mirrored_contact = connection_info.mirrored_contacts.filter(contact_id = contact_id,
+                                                                    change_key = change_key).first()
+        if (not mirrored_contact is None):
+            return mirrored_contact.to_display_contact()
+            
+    contact_json = contacts.o365service.get_contact_by_id(connection_info.outlook_api_endpoint,
+                                                          token, contact_id, contact_properties)
+    if (contact_json is None):
+        return None
+        
+    original_contact = DisplayContact()
+    original_contact.load_json(contact_json)
+    return original_contact
         
 # The delete action, invoked to delete a contact.        
 @login_required
 def delete(request, contact_id):
     try:
         # Get the user's connection info
-        connection_info = Office365Connection.objects.get(username = request.user)
+        connection_info = contacts.connections.get_connection(request)
         
     except ObjectDoesNotExist:
         # If there is no connection object for the user, they haven't connected their
@@ -277,16 +529,29 @@ def delete(request, contact_id):
         return render(request, 'contacts/index.html', None)
         
     else:
-        if (connection_info.access_token is None or 
-                connection_info.access_token == ''):
+        if (contacts.jobs.is_enabled()):
+            # As with updates, the contact is removed from the page now
+            # and from Office 365 when the job runs
+            contacts.jobs.enqueue(connection_info, 'delete', contact_id = contact_id)
+            contacts.sync.mirror_contact_deleted(connection_info, contact_id)
+            contacts.listcache.invalidate(connection_info)
+            return HttpResponseRedirect(reverse('contacts:index'))
+            
+        try:
+            token = contacts.tokens.get_access_token(connection_info)
+        except contacts.tokens.TokenRefreshError:
+            # The refresh token was revoked or has expired. The page will
+            # ask them to connect again.
             return render(request, 'contacts/index.html', None)
             
         result = contacts.o365service.delete_contact(connection_info.outlook_api_endpoint,
-                                                     connection_info.access_token,
+                                                     token,
                                                      contact_id)
         
         # Per MSDN, success should be a 204 status
         if (result == 204):
+            contacts.sync.mirror_contact_deleted(connection_info, contact_id)
+            contacts.listcache.invalidate(connection_info)
             return HttpResponseRedirect(reverse('contacts:index'))
         else:
             return render(request, 'contacts/error.html',
@@ -294,6 +559,199 @@ def delete(request, contact_id):
                     'error_message': 'Unable to delete contact: {0} HTTP status returned.'.format(result),
                 }
             )
+# The export action, which downloads all of the user's contacts as CSV or
+# vCard ('/contacts/export/?format=csv', 'vcard3' or 'vcard4'). The file is
+# streamed while the contacts are paged in from Office 365, so the download
+# starts straight away and memory use doesn't grow with the number of contacts.
+@login_required
+def export(request):
+    export_format = request.GET.get('format', 'csv')
+    if (not export_format in contacts.export.export_formats):
+        return render(request, 'contacts/error.html',
+            {
+                'error_message': 'Unknown export format: {0}'.format(export_format),
+            }
+        )
+        
+    try:
+        # Get the user's connection info
+        connection_info = contacts.connections.get_connection(request)
+        
+    except ObjectDoesNotExist:
+        # If there is no connection object for the user, they haven't connected their
+        # Office 365 account yet. The page will ask them to connect.
+        return render(request, 'contacts/index.html', None)
+        
+    try:
+        display_contacts = contacts.export.iter_display_contacts(connection_info,
+                                                                 contacts.tokens.get_access_token(connection_info))
+        # Fetch the first page before the response starts, so a failure
+        # can still be reported as an error page
+        first_contact = next(display_contacts, None)
+    except (contacts.o365service.ApiError, contacts.tokens.TokenRefreshError) as e:
+        return render(request, 'contacts/error.html',
+            {
+                'error_message': 'Unable to export contacts: {0}'.format(e),
+            }
+        )
+        
+    if (not first_contact is None):
+        display_contacts = itertools.chain([ first_contact ], display_contacts)
+        
+    content_type, extension = contacts.export.export_formats[export_format]
+    response = StreamingHttpResponse(contacts.export.export_contacts(display_contacts, export_format),
+                                     content_type = content_type)
+    response['Content-Disposition'] = 'attachment; filename="contacts.{0}"'.format(extension)
+    return response
+    
+# The search view ('/contacts/search/?q=ann&limit=10'). Returns the contacts
+# with a word starting with each word of the query, as JSON, for typeahead
+# lookups. Searches use an in-memory index built from the local mirror.
+@login_required
+def search(request):
+    try:
+        # Get the user's connection info
+        connection_info = contacts.connections.get_connection(request)
+        
+    except ObjectDoesNotExist:
+        return JsonResponse({ 'error': 'No Office 365 account is connected.' }, status = 404)
+        
+    query = request.GET.get('q', '')
+    limit = contacts.contactlist.parse_int(request.GET.get('limit'),
+                                           contacts.searchindex.default_limit, 1,
+                                           contacts.searchindex.max_limit)
+    
+    if (contacts.sync.mirror_needs_sync(connection_info)):
+        try:
+            contacts.sync.sync_contacts(connection_info)
+        except (contacts.o365service.ApiError, contacts.tokens.TokenRefreshError) as e:
+            return JsonResponse({ 'error': 'Unable to get contacts: {0}'.format(e) }, status = 502)
+            
+    results = contacts.searchindex.get_index(connection_info).search(query, limit)
+    return JsonResponse(
+        {
+            'query': query,
+            'results': [ { 'id': contact_id,
+                           'given_name': given_name,
+                           'last_name': surname,
+                           'mobile_phone': mobile_phone,
+                           'email_address': email_address,
+                           'edit_url': reverse('contacts:edit', args = (contact_id,)) }
+                         for contact_id, given_name, surname, mobile_phone, email_address in results ],
+        }
+    )
+    
+# The import view ('/contacts/import/'). GET displays the upload form. POST
+# saves the uploaded CSV or vCard file and starts importing it in the
+# background (on a thread, or as a runjobs job if CONTACTS_BACKGROUND_JOBS
+# is on), then redirects to the import's status page.
+@login_required
+def import_contacts(request):
+    try:
+        # Get the user's connection info
+        connection_info = contacts.connections.get_connection(request)
+        
+    except ObjectDoesNotExist:
+        # If there is no connection object for the user, they haven't connected their
+        # Office 365 account yet. The page will ask them to connect.
+        return render(request, 'contacts/index.html', None)
+        
+    if (request.method != 'POST'):
+        return render(request, 'contacts/import.html',
+            {
+                'imports': connection_info.contact_imports.order_by('-started')[:10],
+            }
+        )
+        
+    uploaded_file = request.FILES.get('file')
+    if (uploaded_file is None):
+        return render(request, 'contacts/error.html',
+            {
+                'error_message': 'No file included in POST.',
+            }
+        )
+        
+    file_format = request.POST.get('format') or contacts.importer.guess_format(uploaded_file.name)
+    if (not file_format in ('csv', 'vcard')):
+        return render(request, 'contacts/error.html',
+            {
+                'error_message': 'Unable to import {0}: choose CSV or vCard.'.format(uploaded_file.name),
+            }
+        )
+        
+    if (contacts.jobs.is_enabled()):
+        contact_import = contacts.importer.create_upload_import(connection_info, uploaded_file, file_format, 'queued')
+        contacts.jobs.enqueue(connection_info, 'import', import_id = contact_import.pk)
+    else:
+        contact_import = contacts.importer.create_upload_import(connection_info, uploaded_file, file_format)
+        contacts.importer.start_import_thread(contact_import)
+    return HttpResponseRedirect(reverse('contacts:import_status', args = (contact_import.pk,)))
+    
+# The import status view ('/contacts/import/<import_id>/'). Shows an import's
+# progress and row errors, and refreshes itself while the import runs.
+@login_required
+def import_status(request, import_id):
+    contact_import = get_contact_import(request, import_id)
+    return render(request, 'contacts/import_status.html',
+        {
+            'contact_import': contact_import,
+            'errors': contact_import.get_errors()[:100],
+            'can_resume': contact_import.can_resume(),
+        }
+    )
+    
+# The resume action, invoked via POST from the status page of an import
+# that failed or was interrupted (for example by a server restart).
+@login_required
+def import_resume(request, import_id):
+    contact_import = get_contact_import(request, import_id)
+    if (request.method == 'POST'):
+        if (contacts.jobs.is_enabled()):
+            contacts.jobs.queue_import(contact_import)
+        elif (contacts.importer.claim_import(contact_import)):
+            contacts.importer.start_import_thread(contact_import)
+    return HttpResponseRedirect(reverse('contacts:import_status', args = (contact_import.pk,)))
+    
+# Returns one of the current user's imports, or raises Http404
+def get_contact_import(request, import_id):
+    try:
+        return ContactImport.objects.get(pk = import_id, connection__username = request.user)
+    except ObjectDoesNotExist:
+        raise Http404('No such import.')
+        
+# The jobs view ('/contacts/jobs/'). Lists the user's recent background jobs
+# with their status, attempts and errors, and refreshes itself while any
+# are waiting or running.
+@login_required
+def jobs(request):
+    recent_jobs = list(Job.objects.filter(connection__username = request.user).order_by('-pk')[:50])
+    return render(request, 'contacts/jobs.html',
+        {
+            'jobs': recent_jobs,
+            'pending': any(not job.is_finished() for job in recent_jobs),
+        }
+    )
+    
+# The job status view ('/contacts/jobs/<job_id>/'). Returns one of the
+# user's jobs as JSON, so a page can poll until it finishes.
+@login_required
+def job_status(request, job_id):
+    try:
+        job = Job.objects.get(pk = job_id, connection__username = request.user)
+    except ObjectDoesNotExist:
+        return JsonResponse({ 'error': 'No such job.' }, status = 404)
+    return JsonResponse(job.to_dict())
+    
+# The metrics view ('/contacts/metrics/'). Returns this process's totals for
+# each kind of Office 365 call and each view as JSON: counts, failures,
+# retries, latency percentiles and bytes sent and received. Staff only.
+# POST resets the totals.
+@staff_member_required
+def metrics(request):
+    if (request.method == 'POST'):
+        contacts.o365metrics.call_stats.reset()
+    return JsonResponse(contacts.o365metrics.call_stats.get_snapshot())
+    
 # MIT License: 
  
 # Permission is hereby granted, free of charge, to any person obtaining 
@@ -41,6 +41,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'contacts.middleware.ServerTimingMiddleware',
+    'contacts.middleware.InteractiveRetryMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -89,20 +91,78 @@ TEMPLATE_DIRS = [os.path.join(BASE_DIR, 'templates')]
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/contacts/'
 
+# Serve the contacts index from the local mirror (see contacts/sync.py).
+# Set to False to page, sort and filter directly against Office 365.
+CONTACTS_USE_MIRROR = True
+
+# Page views sync the mirror when it is older than this many seconds, so
+# changes made in Outlook show up. None syncs only when the mirror is empty.
+CONTACTS_MIRROR_MAX_AGE = 300
+
+# Rendered contact lists are cached per user (see contacts/listcache.py).
+# The local-memory cache is per process; with several worker processes use
+# a shared backend such as FileBasedCache or memcached, so a change made in
+# one process invalidates the list in all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'contacts',
+    },
+}
+
+# Adds a Server-Timing header with the time spent in Office 365 calls to
+# every response (see contacts/middleware.py). The header shows API paths,
+# so it is only on while debugging.
+CONTACTS_SERVER_TIMING = DEBUG
+
+# Uploaded contact files are kept here until their import completes
+# (see contacts/importer.py)
+CONTACTS_IMPORT_DIR = os.path.join(BASE_DIR, 'imports')
+
+# Whether creates, updates and deletes made from the contact forms are
+# queued as jobs (see contacts/jobs.py) instead of sent to Office 365 while
+# the browser waits. Uploaded imports run as jobs too. Jobs only run while
+# 'python manage.py runjobs' is running. It is a separate process, so use a
+# shared CACHES backend for its changes to show up in the list straight away.
+CONTACTS_BACKGROUND_JOBS = False
+
+# The number of jobs each runjobs process runs at once. Jobs for the same
+# connection always run one at a time, in order.
+CONTACTS_JOB_CONCURRENCY = 4
+
+# Logging for the contacts app (see contacts/o365logging.py). Records are
+# written to debug.log from a background thread, with tokens redacted. The
+# service layer logs every API call at DEBUG, so the logger is at INFO unless
+# DEBUG is on. To debug a busy server, set the level to DEBUG and raise the
+# sample rate to keep one DEBUG record in that many.
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'timestamped': {
+            'format': '%(asctime)s %(threadName)s %(levelname)s %(message)s',
+        },
+    },
+    'filters': {
+        'sample_debug': {
+            '()': 'contacts.o365logging.SamplingFilter',
+            'rate': 1,
+            'level': 'DEBUG',
+        },
+    },
     'handlers': {
         'file': {
             'level': 'DEBUG',
-            'class': 'logging.FileHandler',
+            'class': 'contacts.o365logging.BackgroundFileHandler',
             'filename': './debug.log',
+            'formatter': 'timestamped',
+            'filters': ['sample_debug'],
         },
     },
     'loggers': {
         'contacts': {
             'handlers': ['file'],
-            'level': 'DEBUG',
+            'level': 'DEBUG' if DEBUG else 'INFO',
             'propagate': False,
         },
     },